@@ -0,0 +1,131 @@
+import os
+import math
+import time
+import threading
+from contextlib import contextmanager
+from concurrent.futures import Future
+
+# Computations admitted at once, and requests allowed to wait for a slot.
+# Together they should stay below gunicorn's --threads so a thread is always
+# free to answer 429s, stats and metrics.
+ADMISSION_MAX_CONCURRENT = int(os.getenv('ADMISSION_MAX_CONCURRENT', '4'))
+ADMISSION_MAX_QUEUE = int(os.getenv('ADMISSION_MAX_QUEUE', '2'))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv('ADMISSION_QUEUE_TIMEOUT', '2'))  # seconds
+
+
+class Overloaded(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"Overloaded, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class SingleFlight:
+    """Shares one in-progress computation between concurrent callers.
+
+    The first caller for a key (the leader) runs `fn`; callers arriving
+    while it runs wait for and receive the same result or exception.
+    Nothing is kept once the leader finishes.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.shared = 0
+
+    def do(self, key, fn):
+        # Returns (result, shared)
+        with self._lock:
+            future = self._calls.get(key)
+            if future is None:
+                future = self._calls[key] = Future()
+                self.leaders += 1
+                leader = True
+            else:
+                self.shared += 1
+                leader = False
+        if not leader:
+            return future.result(), True
+        try:
+            result = fn()
+            future.set_result(result)
+            return result, False
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    def stats(self):
+        with self._lock:
+            return {'in_flight': len(self._calls), 'leaders': self.leaders, 'shared': self.shared}
+
+
+class AdmissionController:
+    """Bounds concurrent computations and the queue in front of them.
+
+    admit() runs immediately while fewer than max_concurrent are running,
+    waits up to queue_timeout while at most max_queue others wait, and
+    raises Overloaded otherwise. Retry-After is estimated from the recent
+    service time and the queue ahead.
+    """
+
+    def __init__(self, max_concurrent=ADMISSION_MAX_CONCURRENT, max_queue=ADMISSION_MAX_QUEUE,
+                 queue_timeout=ADMISSION_QUEUE_TIMEOUT):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._slots = threading.Semaphore(max_concurrent)
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self._service_time = None  # EWMA, seconds
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    def _retry_after(self):
+        service_time = self._service_time or 1.0
+        return max(1, math.ceil(service_time * (self._waiting + 1) / self.max_concurrent))
+
+    @contextmanager
+    def admit(self):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                if self._waiting >= self.max_queue:
+                    self.rejected += 1
+                    raise Overloaded(self._retry_after())
+                self._waiting += 1
+            try:
+                acquired = self._slots.acquire(timeout=self.queue_timeout)
+            finally:
+                with self._lock:
+                    self._waiting -= 1
+            if not acquired:
+                with self._lock:
+                    self.timed_out += 1
+                    raise Overloaded(self._retry_after())
+        started = time.perf_counter()
+        try:
+            with self._lock:
+                self.admitted += 1
+            yield
+        finally:
+            self._slots.release()
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self._service_time = elapsed if self._service_time is None else \
+                    0.8 * self._service_time + 0.2 * elapsed
+
+    def stats(self):
+        with self._lock:
+            return {
+                'max_concurrent': self.max_concurrent,
+                'max_queue': self.max_queue,
+                'queue_timeout_seconds': self.queue_timeout,
+                'waiting': self._waiting,
+                'admitted': self.admitted,
+                'rejected': self.rejected,
+                'timed_out': self.timed_out,
+                'service_time_seconds': self._service_time,
+            }
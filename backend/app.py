@@ -1,20 +1,31 @@
 import io
+import gc
+import re
 import requests
 import os
 from dotenv import load_dotenv
-from flask import Flask, jsonify, request # type: ignore
+from flask import Flask, jsonify, request, g, has_request_context # type: ignore
 from flask_cors import CORS
 import numpy as np
 import pandas as pd
 import logging
 from sklearn.preprocessing import MinMaxScaler
-os.environ["TF_CPP_MIN_LOG_LEVEL"] = "2"
-os.environ["TF_ENABLE_ONEDNN_OPTS"] = "0"
-from tensorflow.keras.models import load_model
-import joblib
-from ta import add_all_ta_features
+from indicators import indicator_frame, SELECTED_FEATURES
+from indicator_state import FeatureStreamStore, FEATURE_STATE_DIR
+from sequences import latest_sequence
+from cache import LRUTTLCache, PrecomputedStore, PREDICTION_CACHE_DIR, PRECOMPUTE_DIR
+import time
 import traceback
-from polygon import RESTClient
+from concurrent.futures import TimeoutError
+from bar_store import BarStore, BAR_STORE_DIR, BAR_SIZE, HISTORY_DAYS, make_bar_source, sized_dir
+from inference_scheduler import MicroBatchScheduler
+from model_registry import ModelRegistry, MODEL_REGISTRY_DIR
+from incremental_lstm import IncrementalLSTM
+from baselines import BASELINES, stack_tails
+from metrics import (REGISTRY, FALLBACKS, REJECTIONS, SHARED_RESULTS, MODEL_INFO, MODEL_SWAPS,
+                     timed, record_error, trace_note, instrumented)
+from admission import SingleFlight, AdmissionController, Overloaded
+from responses import PredictionResponse, ENCODINGS, JSON, parse_since
 
 load_dotenv()
 
@@ -25,107 +36,182 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__)
 CORS(app)
 
-# Ensure models directory exists
-MODEL_DIR = 'models'
+# Ensure models directory exists; models, bars and feature state are kept
+# per BAR_SIZE (daily in the original locations, see bar_store.sized_dir)
+MODEL_DIR = sized_dir('models')
 if not os.path.exists(MODEL_DIR):
     os.makedirs(MODEL_DIR)
 
+# Per-request latency budget for the LSTM path in milliseconds (0 = none);
+# past it, or without a model, /api/predict answers from FALLBACK_BASELINE
+PREDICTION_LATENCY_BUDGET_MS = float(os.getenv('PREDICTION_LATENCY_BUDGET_MS', '0'))
+FALLBACK_BASELINE = os.getenv('FALLBACK_BASELINE', 'linear_regression')
+if FALLBACK_BASELINE not in BASELINES:
+    raise ValueError(f"Unknown FALLBACK_BASELINE {FALLBACK_BASELINE}; expected one of {sorted(BASELINES)}")
+
+bar_store = BarStore(sized_dir(BAR_STORE_DIR), make_bar_source())
+# Calendar days of bars kept per symbol, and the most recent bars of them
+# read per request (0 = all). Intraday histories are long, so requests only
+# see a bounded tail; indicators still carry on from the warm feature state.
+BAR_HISTORY_DAYS = int(os.getenv('BAR_HISTORY_DAYS', str(HISTORY_DAYS[BAR_SIZE.timespan])))
+SERVING_HISTORY_BARS = int(os.getenv('SERVING_HISTORY_BARS', '0' if BAR_SIZE.timespan == 'day' else '1000'))
+
+# Each model version's window comes from its metadata (see ServedModel);
+# this one only sizes the feature streams while no model is loaded
+SEQUENCE_LENGTH = 60
+# Per-symbol warm feature rows; latest_sequence needs time_step + 2 rows
+feature_streams = FeatureStreamStore(sized_dir(FEATURE_STATE_DIR), SEQUENCE_LENGTH + 2)
+
+# 'incremental' advances cached per-symbol LSTM states by one step per new
+# bar instead of replaying the window (see incremental_lstm.py); it needs
+# the NumPy backend
+INFERENCE_MODE = os.getenv('INFERENCE_MODE', 'window')
+
+class ServedModel:
+    # One model version with its own serving state, so requests pinned to it
+    # keep a consistent model, scalers and scheduler across a hot swap
+    def __init__(self, bundle):
+        # An LSTM accepts windows of any length, so a model without a
+        # recorded sequence_length could silently be fed the wrong one
+        if 'sequence_length' not in bundle.metadata:
+            raise ValueError(f"Model version {bundle.version} does not record its sequence_length")
+        if bundle.metadata.get('features', SELECTED_FEATURES) != SELECTED_FEATURES:
+            raise ValueError(f"Model version {bundle.version} was trained on other features")
+        if bundle.metadata.get('bar_size', '1d') != BAR_SIZE.label:
+            raise ValueError(f"Model version {bundle.version} was trained on {bundle.metadata['bar_size']} bars")
+        self.bundle = bundle
+        self.model = bundle.model
+        self.price_scaler = bundle.price_scaler
+        self.indicator_scaler = bundle.indicator_scaler
+        self.version = bundle.version
+        # Sweeps train other window lengths (see sweep.py)
+        self.sequence_length = int(bundle.metadata['sequence_length'])
+        # Concurrent requests are coalesced into a single model.predict call
+        self.scheduler = MicroBatchScheduler(self.model.predict)
+        self.incremental = None
+        if INFERENCE_MODE == 'incremental':
+            try:
+                self.incremental = IncrementalLSTM(self.model)
+                # Incremental outputs differ slightly from the full window
+                self.version = f"{self.version}-incremental"
+            except ValueError as e:
+                logger.warning(f"Incremental inference disabled: {str(e)}")
+
+    def stats(self):
+        return {'version': self.version, 'backend': self.model.name,
+                'loaded_at': self.bundle.loaded_at, 'metadata': self.bundle.metadata}
+
+def model_swapped(old, new):
+    if old is not None:
+        # Requests already holding the old version still finish on it
+        old.scheduler.close()
+        if old.incremental is not None:
+            old.incremental.close()
+        MODEL_INFO.remove(version=old.version, backend=old.model.name)
+        MODEL_SWAPS.inc()
+    MODEL_INFO.set(1, version=new.version, backend=new.model.name)
+
+# Versions published by train_model.py (see model_registry.py), or the flat
+# models/ directory until one is; NumPy/TFLite backends avoid importing
+# TensorFlow in the server
+model_registry = ModelRegistry(sized_dir(MODEL_REGISTRY_DIR), fallback_dir=MODEL_DIR, prepare=ServedModel,
+                               on_swap=model_swapped)
 try:
-    # Load the trained model and scalers
     logger.info("Loading model and scalers...")
-    model = load_model(os.path.join(MODEL_DIR, 'final_model.h5'))
-    price_scaler = joblib.load(os.path.join(MODEL_DIR, 'price_scaler.save'))
-    indicator_scaler = joblib.load(os.path.join(MODEL_DIR, 'indicator_scaler.save'))
-    logger.info("Model and scalers loaded successfully")
+    model_registry.load()
+    logger.info(f"Serving model version {model_registry.active.version} "
+                f"with the {model_registry.active.model.name} inference backend")
 except Exception as e:
+    # Keep serving: predictions fall back to the baseline below
     logger.error(f"Error loading model or scalers: {str(e)}")
     logger.error(traceback.format_exc())
-    raise
 
-client = RESTClient(api_key=os.getenv("POLYGON_API_KEY"))
+def serving():
+    # The model version for the current request, pinned on first use so a
+    # swap mid-request cannot mix two versions; None without a model
+    if not has_request_context():
+        return model_registry.active
+    if 'served_model' not in g:
+        g.served_model = model_registry.active
+    return g.served_model
 
+@app.before_request
+def watch_model_registry():
+    model_registry.watch()
+
+# Prepared inputs and finished responses, keyed by symbol, last bar and
+# model version; a new bar or model simply produces a new key
+feature_cache = LRUTTLCache('features', disk_dir=PREDICTION_CACHE_DIR)
+response_cache = LRUTTLCache('responses', disk_dir=PREDICTION_CACHE_DIR)
+# Responses for the watchlist written after the close by precompute.py
+precomputed_store = PrecomputedStore(sized_dir(PRECOMPUTE_DIR))
+
+# Upper bound on symbols accepted by /api/predict/batch
+MAX_BATCH_SYMBOLS = int(os.getenv('MAX_BATCH_SYMBOLS', '100'))
+# Symbols become file names in the bar and feature stores and part of the
+# Polygon URL, so requests may only name tickers, normalised to upper case
+TICKER_PATTERN = re.compile(r'[A-Z][A-Z0-9.\-]{0,9}')
+
+# Concurrent /api/predict calls for one symbol share a single computation,
+# and computations beyond the admission limits are answered with 429
+prediction_flights = SingleFlight()
+admission = AdmissionController()
+
+
+def normalize_symbols(symbols):
+    # Upper-cased, deduplicated symbols in request order, or None if any is
+    # not a ticker
+    symbols = [symbol.strip().upper() if isinstance(symbol, str) else None for symbol in symbols]
+    if not all(symbol and TICKER_PATTERN.fullmatch(symbol) for symbol in symbols):
+        return None
+    return list(dict.fromkeys(symbols))
+
+def history_range():
+    # BAR_HISTORY_DAYS (a year for daily bars) up to the most recent bar
+    to_date = pd.Timestamp.now().strftime('%Y-%m-%d')
+    from_date = (pd.Timestamp.now() - pd.Timedelta(days=BAR_HISTORY_DAYS)).strftime('%Y-%m-%d')
+    return from_date, to_date
 
 def fetch_stock_data(symbol):
     try:
-        # Get the most recent trading day
-        to_date = pd.Timestamp.now().strftime('%Y-%m-%d')
-        from_date = (pd.Timestamp.now() - pd.Timedelta(days=365)).strftime('%Y-%m-%d')
-        
-        # Fetch data from Polygon
-        aggs = client.get_aggs(
-            ticker=symbol,
-            multiplier=1,
-            timespan="day",
-            from_=from_date,
-            to=to_date
-        )
+        from_date, to_date = history_range()
         
-        # Convert to DataFrame
-        df = pd.DataFrame([{
-            'timestamp': agg.timestamp,
-            'open': agg.open,
-            'high': agg.high,
-            'low': agg.low,
-            'close': agg.close,
-            'volume': agg.volume
-        } for agg in aggs])
-        
-        # Convert timestamp
-        df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
-        df = df.sort_values('timestamp')
+        # Read from the local bar store; only bars newer than the last
+        # stored one are fetched from Polygon
+        df = bar_store.get_bars(symbol, from_date, to_date, tail=SERVING_HISTORY_BARS or None)
+        if df.empty:
+            logger.error(f"Error fetching data: no bars for {symbol}")
+            return None
         
         return df
         
     except Exception as e:
-        print(f"Error fetching data: {e}")
+        logger.error(f"Error fetching data for {symbol}: {str(e)}")
         return None
 
 def add_technical_indicators(data):
-    logger.info("Adding technical indicators")
     try:
-        df = data.copy()
-        
-        # Add all technical indicators
-        df = add_all_ta_features(
-            df, open="open", high="high", low="low", 
-            close="close", volume="volume", fillna=True
-        )
-        
-        # Select relevant features
-        selected_features = [
-            'open', 'high', 'low', 'close', 
-            'trend_sma_fast', 
-            'trend_sma_slow', 
-            'trend_macd',  
-            'trend_macd_signal', 
-            'trend_macd_diff',  # MACD Histogram
-            'momentum_rsi', 
-            'momentum_stoch', 
-            'momentum_stoch_signal',  # Stochastic %D
-            'momentum_tsi',  # True Strength Index
-            'momentum_uo',  # Ultimate Oscillator
-            'volatility_atr',  # Average True Range
-            'volatility_bbm', 
-            'volatility_bbh', 
-            'volatility_bbl', 
-            'volume_adi',  # Accumulation/Distribution Index
-            'volume_obv',  # On-Balance Volume
-            'volume_vwap',  # Volume Weighted Average Price
-            'volume_mfi',  # Money Flow Index
-            'volume_em',  # Ease of Movement
-            'volume_sma_em'  # SMA of Ease of Movement
-        ]
-        
-        result = df[selected_features].copy()
-        logger.info("Technical indicators added successfully")
-        return result
+        # Compute only the selected features (see indicators.py)
+        return indicator_frame(data, SELECTED_FEATURES)
     except Exception as e:
         logger.error(f"Error adding technical indicators: {str(e)}")
         logger.error(traceback.format_exc())
         return None
 
+def streaming_technical_indicators(symbol, stock_data):
+    # Advance the symbol's warm indicator state by the bars added since the
+    # last request instead of recomputing the whole history
+    served = serving()
+    window = (served.sequence_length if served is not None else SEQUENCE_LENGTH) + 2
+    try:
+        return feature_streams.features(symbol, stock_data, window)
+    except Exception as e:
+        logger.error(f"Error updating feature state for {symbol}: {str(e)}")
+        logger.error(traceback.format_exc())
+        record_error('feature_state')
+        return add_technical_indicators(stock_data)
+
 def preprocess_data(data):
-    logger.info("Preprocessing data")
     try:
         # Handle missing values first
         data = data.fillna(method='ffill').fillna(method='bfill')
@@ -135,17 +221,18 @@ def preprocess_data(data):
         # Extract technical indicators (excluding price columns)
         indicator_data = data.drop(['open', 'high', 'low', 'close'], axis=1).values
         
-        # Log shapes for debugging
-        logger.info(f"Price data shape: {price_data.shape}")
-        logger.info(f"Indicator data shape: {indicator_data.shape}")
+        # Shapes go to the sampled debug trace (see metrics.py)
+        trace_note('price_shape', price_data.shape)
+        trace_note('indicator_shape', indicator_data.shape)
         
         # Scale price and indicators separately
-        scaled_price = price_scaler.transform(price_data)
-        scaled_indicators = indicator_scaler.transform(indicator_data)
+        served = serving()
+        scaled_price = served.price_scaler.transform(price_data)
+        scaled_indicators = served.indicator_scaler.transform(indicator_data)
         
         # Combine scaled price data and indicators
         scaled_data = np.hstack((scaled_price, scaled_indicators))
-        logger.info(f"Final preprocessed data shape: {scaled_data.shape}")
+        trace_note('scaled_shape', scaled_data.shape)
         
         return scaled_data
     except Exception as e:
@@ -153,117 +240,398 @@ def preprocess_data(data):
         logger.error(traceback.format_exc())
         raise
 
-def create_sequences(data, time_step=60):
-    logger.info(f"Creating sequences with time_step: {time_step}")
+class PredictionError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+def load_stock_data(symbol):
+    with timed('bar_fetch'):
+        stock_data = fetch_stock_data(symbol)
+    if stock_data is None:
+        record_error('bar_fetch')
+        raise PredictionError('Failed to fetch stock data', 400)
+    return stock_data
+
+def cache_key(symbol, stock_data):
+    # The last bar's close and volume are part of the key so a daily bar
+    # revised after a partial fetch does not keep serving the old result
+    served = serving()
+    return (
+        symbol,
+        int(stock_data['timestamp'].iat[-1].value // 1_000_000),
+        float(stock_data['close'].iat[-1]),
+        float(stock_data['volume'].iat[-1]),
+        served.version if served is not None else 'unavailable',
+    )
+
+def stored_response(key):
+    # In-memory/shared cache first, then the precomputed store; a
+    # precomputed hit is promoted into the cache. Entries written before
+    # responses were cached as PredictionResponse are ignored.
+    result = response_cache.get(key)
+    if not isinstance(result, PredictionResponse):
+        result = precomputed_store.get(key)
+        if not isinstance(result, PredictionResponse):
+            return None
+        response_cache.set(key, result)
+    return result
+
+def prepare_prediction_input(symbol, stock_data, key):
+    # Compute features and build the latest model input window.
+    # Raises PredictionError with the client-facing message and status code.
+    cached = feature_cache.get(key)
+    if cached is not None:
+        return cached
+        
+    # Add technical indicators
+    with timed('indicators'):
+        feature_data = streaming_technical_indicators(symbol, stock_data)
+    if feature_data is None:
+        record_error('indicators')
+        raise PredictionError('Failed to calculate technical indicators', 400)
+    
+    # Without a model only the response's indicators are needed
+    if serving() is None:
+        return feature_data, None
+        
+    # Preprocess the data
     try:
-        X, y = [], []
-        for i in range(len(data) - time_step - 1):
-            # Include all features in the input sequence
-            X.append(data[i:(i + time_step), :])
-            # Predict the 'close' price of the next time step
-            y.append(data[i + time_step, 3])  # Index 3 corresponds to 'close'
-        X = np.array(X)
-        y = np.array(y)
-        logger.info(f"Created sequences with shape: {X.shape}")
-        return X, y
+        with timed('scaling'):
+            scaled_data = preprocess_data(feature_data)
     except Exception as e:
-        logger.error(f"Error creating sequences: {str(e)}")
-        logger.error(traceback.format_exc())
-        raise
+        logger.error(f"Preprocessing error: {str(e)}")
+        raise PredictionError('Error preprocessing data', 500)
+        
+    # Build only the latest window
+    try:
+        with timed('sequence'):
+            sequence = latest_sequence(scaled_data, serving().sequence_length)
+    except Exception as e:
+        logger.error(f"Sequence creation error: {str(e)}")
+        raise PredictionError('Error creating sequences', 500)
+    if len(sequence) == 0:
+        raise PredictionError('Insufficient data for prediction', 400)
+    
+    feature_cache.set(key, (feature_data, sequence))
+    return feature_data, sequence
+
+def run_model(symbols, batch, timeout=None):
+    served = serving()
+    if served.incremental is not None:
+        return served.incremental.predict_many(symbols, batch, timeout=timeout)
+    return served.scheduler.predict(batch, timeout=timeout)
+
+def remaining_budget(started):
+    # Seconds left of the latency budget, or None without one
+    if PREDICTION_LATENCY_BUDGET_MS <= 0:
+        return None
+    return PREDICTION_LATENCY_BUDGET_MS / 1000.0 - (time.perf_counter() - started)
+
+def model_prices(symbols, sequences, started):
+    # Returns (prices, None) from the LSTM, or (None, reason) when the
+    # baseline has to answer instead
+    if any(sequence is None for sequence in sequences):
+        return None, 'model_unavailable'
+    timeout = remaining_budget(started)
+    if timeout is not None and timeout <= 0:
+        return None, 'latency_budget'
+    try:
+        with timed('inference'):
+            predictions = run_model(symbols, np.concatenate(sequences), timeout=timeout)
+        with timed('inverse_transform'):
+            return inverse_transform_close(predictions[:, 0]), None
+    except TimeoutError:
+        logger.warning(f"LSTM prediction exceeded the {PREDICTION_LATENCY_BUDGET_MS:.0f}ms budget")
+        return None, 'latency_budget'
+    except Exception as e:
+        logger.error(f"Prediction error: {str(e)}")
+        return None, 'model_error'
+
+def baseline_prices(stock_frames, fallback_reason):
+    # One closed-form computation over every symbol's recent closes
+    FALLBACKS.inc(len(stock_frames), reason=fallback_reason)
+    with timed('baseline'):
+        closes = stack_tails([stock_data['close'].to_numpy() for stock_data in stock_frames])
+        return BASELINES[FALLBACK_BASELINE](closes)
 
-@app.route('/api/predict', methods=['POST'])
+def inverse_transform_close(predictions):
+    # Pad the predictions with zeros for the other features (open, high, low)
+    # The scaler expects a 2D array with 4 features
+    padded_predictions = np.zeros((len(predictions), 4))
+    padded_predictions[:, 3] = predictions  # Set the 'close' values
+    return serving().price_scaler.inverse_transform(padded_predictions)[:, 3]
+
+def build_prediction_response(key, stock_data, feature_data, predicted_price, fallback_reason=None):
+    latest_data = feature_data.iloc[-1]
+    additional_info = {
+        'moving_average_fast': float(latest_data['trend_sma_fast']),
+        'moving_average_slow': float(latest_data['trend_sma_slow']),
+        'rsi': float(latest_data['momentum_rsi']),
+        'stochastic': float(latest_data['momentum_stoch']),
+        'stochastic_signal': float(latest_data['momentum_stoch_signal']),
+        'macd': float(latest_data['trend_macd']),
+        'macd_signal': float(latest_data['trend_macd_signal']),
+        'macd_histogram': float(latest_data['trend_macd_diff']),
+        'atr': float(latest_data['volatility_atr']),
+        'bollinger_bands': {
+            'middle': float(latest_data['volatility_bbm']),
+            'upper': float(latest_data['volatility_bbh']),
+            'lower': float(latest_data['volatility_bbl'])
+        },
+        'volume_indicators': {
+            'adi': float(latest_data['volume_adi']),
+            'obv': float(latest_data['volume_obv']),
+            'mfi': float(latest_data['volume_mfi'])
+        }
+    }
+    
+    summary = {
+        'predicted_price': predicted_price,
+        'prediction_source': 'lstm' if fallback_reason is None else FALLBACK_BASELINE,
+        'model_version': key[-1],
+        'bar_size': BAR_SIZE.label,
+        'additional_info': additional_info,
+        'last_updated': stock_data['timestamp'].max().strftime(
+            '%Y-%m-%d' if BAR_SIZE.timespan == 'day' else '%Y-%m-%dT%H:%M:%S')
+    }
+    if fallback_reason is not None:
+        summary['fallback_reason'] = fallback_reason
+    # historical_data is attached per encoding (see responses.py); the
+    # default JSON body is encoded here, once per cache entry
+    with timed('serialization'):
+        return PredictionResponse(summary, stock_data, (key, fallback_reason), app.json.dumps)
+
+def json_body(payload):
+    return app.json.dumps(payload).encode()
+
+def json_response(body):
+    return app.response_class(body + b'\n', mimetype='application/json')
+
+def encoded_response(result, encoding, since_ms):
+    # ETag/Last-Modified from the result's version and last bar; a GET whose
+    # If-None-Match/If-Modified-Since still matches gets an empty 304
+    with timed('serialization'):
+        body = result.encode(encoding, app.json.dumps, since_ms)
+    if encoding != JSON and not encoding.endswith('+json'):
+        response = app.response_class(body, mimetype=encoding)
+    else:
+        response = app.response_class(body + b'\n', mimetype=encoding)
+    response.set_etag(result.etag(encoding, since_ms))
+    response.last_modified = result.last_modified
+    response.cache_control.no_cache = True
+    response.vary.add('Accept')
+    return response.make_conditional(request)
+
+def predict_symbol(symbol, started):
+    # The full /api/predict computation for one symbol; returns a
+    # PredictionResponse and raises PredictionError for client-facing failures
+    stock_data = load_stock_data(symbol)
+    key = cache_key(symbol, stock_data)
+    cached = stored_response(key)
+    if cached is not None:
+        trace_note('cache', 'hit')
+        return cached
+    feature_data, sequence = prepare_prediction_input(symbol, stock_data, key)
+        
+    # Make prediction
+    prices, fallback_reason = model_prices([symbol], [sequence], started)
+    if fallback_reason is not None:
+        prices = baseline_prices([stock_data], fallback_reason)
+        if np.isnan(prices[0]):
+            raise PredictionError('Insufficient data for prediction', 400)
+    predicted_price = float(prices[0])
+    trace_note('predicted_price', predicted_price)
+        
+    result = build_prediction_response(key, stock_data, feature_data, predicted_price, fallback_reason)
+    # Fallback answers are not cached so the LSTM gets the next request
+    if fallback_reason is None:
+        response_cache.set(key, result)
+    return result
+
+def admitted(fn, *args):
+    with admission.admit():
+        return fn(*args)
+
+def overloaded_response(error, endpoint):
+    REJECTIONS.inc(endpoint=endpoint)
+    response = jsonify({'error': 'Server busy, retry later'})
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response, 429
+
+@app.route('/api/predict', methods=['GET', 'POST'])
+@instrumented('predict')
 def predict():
+    # POST {"symbol": ..., "since": ...} or GET ?symbol=...&since=...; GETs
+    # can be revalidated with If-None-Match/If-Modified-Since. `since`
+    # (epoch ms or ISO date) limits historical_data to newer bars, and
+    # Accept picks the encoding (see responses.ENCODINGS).
+    started = time.perf_counter()
     try:
-        data = request.get_json()
+        data = request.args if request.method == 'GET' else request.get_json()
         if not data or 'symbol' not in data:
             return jsonify({'error': 'No symbol provided'}), 400
             
-        symbol = data['symbol']
-        logger.info(f"Processing prediction request for symbol: {symbol}")
-        
-        # Fetch and validate data
-        stock_data = fetch_stock_data(symbol)
-        if stock_data is None:
-            return jsonify({'error': 'Failed to fetch stock data'}), 400
-            
-        # Add technical indicators
-        feature_data = add_technical_indicators(stock_data)
-        if feature_data is None:
-            return jsonify({'error': 'Failed to calculate technical indicators'}), 400
-            
-        # Preprocess the data
+        symbols = normalize_symbols([data['symbol']])
+        if symbols is None:
+            return jsonify({'error': 'Invalid symbol'}), 400
+        symbol = symbols[0]
+        logger.debug(f"Processing prediction request for symbol: {symbol}")
+        trace_note('symbol', symbol)
         try:
-            scaled_data = preprocess_data(feature_data)
-        except Exception as e:
-            logger.error(f"Preprocessing error: {str(e)}")
-            return jsonify({'error': 'Error preprocessing data'}), 500
-            
-        # Create sequences
+            since_ms = parse_since(data.get('since'))
+        except (ValueError, TypeError):
+            return jsonify({'error': 'since must be epoch milliseconds or an ISO date'}), 400
+        encoding = request.accept_mimetypes.best_match(ENCODINGS, default=JSON)
+        
         try:
-            X, _ = create_sequences(scaled_data)
-            if len(X) == 0:
-                return jsonify({'error': 'Insufficient data for prediction'}), 400
-        except Exception as e:
-            logger.error(f"Sequence creation error: {str(e)}")
-            return jsonify({'error': 'Error creating sequences'}), 500
-            
-        # Make prediction
+            result, shared = prediction_flights.do(symbol, lambda: admitted(predict_symbol, symbol, started))
+        except PredictionError as e:
+            return jsonify({'error': e.message}), e.status
+        except Overloaded as e:
+            return overloaded_response(e, 'predict')
+        if shared:
+            SHARED_RESULTS.inc()
+            trace_note('single_flight', 'shared')
+        logger.debug("Successfully generated prediction response")
+        return encoded_response(result, encoding, since_ms)
+    
+    except Exception as e:
+        logger.error(f"Unexpected error in predict endpoint: {str(e)}")
+        logger.error(traceback.format_exc())
+        return jsonify({'error': f'Prediction failed: {str(e)}'}), 500
+
+def predict_symbols(symbols, started):
+    # The /api/predict/batch computation; returns the JSON body
+
+    # Fetch new bars for every symbol concurrently up front; the per-symbol
+    # loads below then read from the local store. Symbols whose fetch
+    # failed are answered with an error instead of being fetched again.
+    with timed('bar_prefetch'):
+        _, fetch_errors = bar_store.refresh_many(symbols, *history_range())
+    
+    results, errors = {}, {}
+    for symbol in fetch_errors:
+        record_error('bar_fetch')
+        errors[symbol] = 'Failed to fetch stock data'
+    prepared = []
+    for symbol in symbols:
+        if symbol in errors:
+            continue
         try:
-             latest_sequence = X[-1:]
-             prediction = model.predict(latest_sequence)
-                
-             # Pad the prediction with zeros for the other features (open, high, low)
-             # The scaler expects a 2D array with 4 features
-             padded_prediction = np.zeros((1, 4))  # Shape: (1, 4)
-             padded_prediction[0, 3] = prediction[0][0]  # Set the 'close' value
-                
-             # Inverse transform the padded prediction
-             predicted_price = float(price_scaler.inverse_transform(padded_prediction)[0, 3])  # Extract the 'close' value
-             logger.info(f"Predicted price: {predicted_price}")
-        except Exception as e:
-             logger.error(f"Prediction error: {str(e)}")
-             return jsonify({'error': 'Error making prediction'}), 500
-            
-        # Prepare response data
-        latest_data = feature_data.iloc[-1]
-        additional_info = {
-            'moving_average_fast': float(latest_data['trend_sma_fast']),
-            'moving_average_slow': float(latest_data['trend_sma_slow']),
-            'rsi': float(latest_data['momentum_rsi']),
-            'stochastic': float(latest_data['momentum_stoch']),
-            'stochastic_signal': float(latest_data['momentum_stoch_signal']),
-            'macd': float(latest_data['trend_macd']),
-            'macd_signal': float(latest_data['trend_macd_signal']),
-            'macd_histogram': float(latest_data['trend_macd_diff']),
-            'atr': float(latest_data['volatility_atr']),
-            'bollinger_bands': {
-                'middle': float(latest_data['volatility_bbm']),
-                'upper': float(latest_data['volatility_bbh']),
-                'lower': float(latest_data['volatility_bbl'])
-            },
-            'volume_indicators': {
-                'adi': float(latest_data['volume_adi']),
-                'obv': float(latest_data['volume_obv']),
-                'mfi': float(latest_data['volume_mfi'])
-            }
-        }
+            stock_data = load_stock_data(symbol)
+            key = cache_key(symbol, stock_data)
+            cached = stored_response(key)
+            if cached is not None:
+                results[symbol] = cached.json
+                continue
+            feature_data, sequence = prepare_prediction_input(symbol, stock_data, key)
+            prepared.append((symbol, key, stock_data, feature_data, sequence))
+        except PredictionError as e:
+            errors[symbol] = e.message
+    
+    if prepared:
+        # One forward pass over every symbol's window, or one baseline
+        # computation over all of them
+        predicted_prices, fallback_reason = model_prices(
+            [symbol for symbol, *_ in prepared], [sequence for *_, sequence in prepared], started
+        )
+        if fallback_reason is not None:
+            predicted_prices = baseline_prices([stock_data for _, _, stock_data, _, _ in prepared], fallback_reason)
         
-        historical_data = stock_data[['timestamp', 'open', 'high', 'low', 'close', 'volume']].tail(300).to_dict('records')
+        # build_prediction_response times its own serialization
+        for (symbol, key, stock_data, feature_data, _), predicted_price in zip(prepared, predicted_prices):
+            if np.isnan(predicted_price):
+                errors[symbol] = 'Insufficient data for prediction'
+                continue
+            result = build_prediction_response(
+                key, stock_data, feature_data, float(predicted_price), fallback_reason
+            )
+            results[symbol] = result.json
+            if fallback_reason is None:
+                response_cache.set(key, result)
+    
+    logger.debug(f"Batch prediction done: {len(results)} succeeded, {len(errors)} failed")
+    trace_note('symbols', len(symbols))
+    # Splice the per-symbol bodies (cached or fresh) into one document
+    results_body = b','.join(json_body(symbol) + b':' + results[symbol] for symbol in sorted(results))
+    return b'{"errors":' + json_body(errors) + b',"results":{' + results_body + b'}}'
+
+@app.route('/api/predict/batch', methods=['POST'])
+@instrumented('predict_batch')
+def predict_batch():
+    started = time.perf_counter()
+    try:
+        data = request.get_json()
+        symbols = data.get('symbols') if isinstance(data, dict) else None
+        if not isinstance(symbols, list) or not symbols:
+            return jsonify({'error': 'No symbols provided'}), 400
+        symbols = normalize_symbols(symbols)
+        if symbols is None:
+            return jsonify({'error': 'Symbols must be tickers such as AAPL or BRK.B'}), 400
+        if len(symbols) > MAX_BATCH_SYMBOLS:
+            return jsonify({'error': f'At most {MAX_BATCH_SYMBOLS} symbols per request'}), 400
+        logger.debug(f"Processing batch prediction request for {len(symbols)} symbols")
         
-        response = {
-            'predicted_price': predicted_price,
-            'historical_data': historical_data,
-            'additional_info': additional_info,
-            'last_updated': stock_data['timestamp'].max().strftime('%Y-%m-%d')
-        }
+        try:
+            body = admitted(predict_symbols, symbols, started)
+        except Overloaded as e:
+            return overloaded_response(e, 'predict_batch')
+        return json_response(body)
+    
+    except Exception as e:
+        logger.error(f"Unexpected error in batch predict endpoint: {str(e)}")
+        logger.error(traceback.format_exc())
+        return jsonify({'error': f'Batch prediction failed: {str(e)}'}), 500
+
+
+@app.route('/api/prefetch', methods=['POST'])
+def prefetch():
+    # Warms the bar store for a watchlist so later predictions skip the fetch
+    try:
+        data = request.get_json()
+        symbols = data.get('symbols') if isinstance(data, dict) else None
+        if not isinstance(symbols, list) or not symbols:
+            return jsonify({'error': 'No symbols provided'}), 400
+        symbols = normalize_symbols(symbols)
+        if symbols is None:
+            return jsonify({'error': 'Symbols must be tickers such as AAPL or BRK.B'}), 400
+        if len(symbols) > MAX_BATCH_SYMBOLS:
+            return jsonify({'error': f'At most {MAX_BATCH_SYMBOLS} symbols per request'}), 400
         
-        logger.info("Successfully generated prediction response")
-        return jsonify(response)
+        results, errors = bar_store.refresh_many(symbols, *history_range())
+        return jsonify({'bars': {symbol: len(bars) for symbol, bars in results.items()}, 'errors': errors})
     
     except Exception as e:
-        logger.error(f"Unexpected error in predict endpoint: {str(e)}")
+        logger.error(f"Unexpected error in prefetch endpoint: {str(e)}")
         logger.error(traceback.format_exc())
-        return jsonify({'error': f'Prediction failed: {str(e)}'}), 500
+        return jsonify({'error': f'Prefetch failed: {str(e)}'}), 500
+
+@app.route('/api/inference/stats', methods=['GET'])
+def inference_stats():
+    served = serving()
+    stats = served.scheduler.stats() if served is not None else {}
+    stats['model'] = served.stats() if served is not None else None
+    stats['registry'] = model_registry.stats()
+    stats['admission'] = admission.stats()
+    stats['single_flight'] = prediction_flights.stats()
+    if served is not None and served.incremental is not None:
+        stats['incremental'] = served.incremental.stats()
+    return jsonify(stats)
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    # Prometheus text exposition of the stage histograms and error counters
+    return app.response_class(REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    return jsonify({
+        'features': feature_cache.stats(),
+        'responses': response_cache.stats(),
+        'precomputed': precomputed_store.stats(),
+    })
 
 @app.errorhandler(500)
 def internal_error(error):
@@ -271,5 +639,10 @@ def internal_error(error):
     logger.error(traceback.format_exc())
     return jsonify({'error': 'Internal server error'}), 500
 
+# Under gunicorn --preload this module (and the model) is loaded once in the
+# master and shared copy-on-write with the forked workers; freezing keeps
+# the garbage collector from writing to, and so copying, those pages
+gc.freeze()
+
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,232 @@
+import os
+import logging
+import argparse
+import joblib
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+from baselines import moving_average_forecasts, linear_regression_forecasts, LR_LOOKBACK
+from bar_store import BarStore, BAR_STORE_DIR, make_bar_source, sized_dir
+from feature_prep import prepare_features, load_features
+from inference import load_backend
+from model_registry import read_metadata
+from sequences import CLOSE_INDEX
+
+# Walk-forward backtest of the served model and the baselines over a symbol
+# universe. Every bar `o` with at least T bars before it (the model's
+# sequence_length, and LR_LOOKBACK) is a forecast origin: the LSTM sees the
+# scaled feature rows [o - T, o), the baselines see the bars before o, and
+# all of them predict close[o]. By default only origins after the model's
+# training range are scored, so the metrics are out of sample. Windows
+# from every symbol are pushed through the model in large batches; metrics are
+# computed from grouped sums, and plots are drawn from the finished report.
+
+logger = logging.getLogger(__name__)
+
+MODEL_DIR = sized_dir('models')
+BACKTEST_BATCH_SIZE = int(os.getenv('BACKTEST_BATCH_SIZE', '4096'))
+PRICE_COLUMNS = ['open', 'high', 'low', 'close']
+MODELS = ['lstm', 'moving_average', 'linear_regression']
+
+
+def scale_features(features, price_scaler, indicator_scaler):
+    # Same layout and scalers as app.preprocess_data
+    price_data = features[PRICE_COLUMNS].values
+    indicator_data = features.drop(PRICE_COLUMNS, axis=1).values
+    return np.hstack((price_scaler.transform(price_data),
+                      indicator_scaler.transform(indicator_data))).astype(np.float32)
+
+
+def inverse_close(values, price_scaler):
+    padded = np.zeros((len(values), len(PRICE_COLUMNS)))
+    padded[:, CLOSE_INDEX] = values
+    return price_scaler.inverse_transform(padded)[:, CLOSE_INDEX]
+
+
+def predict_windows(model, views, batch_size=BACKTEST_BATCH_SIZE):
+    # `views` are per-symbol (windows, time, features) strided views. Windows
+    # are copied into one reusable buffer, so a batch can span symbols and
+    # only batch_size windows are materialised at a time.
+    total = sum(len(view) for view in views)
+    if total == 0:
+        return np.empty(0)
+    buffer = np.empty((min(batch_size, total),) + views[0].shape[1:], dtype=np.float32)
+    outputs, filled = [], 0
+    for view in views:
+        position = 0
+        while position < len(view):
+            take = min(len(buffer) - filled, len(view) - position)
+            buffer[filled:filled + take] = view[position:position + take]
+            filled += take
+            position += take
+            if filled == len(buffer):
+                outputs.append(np.asarray(model.predict(buffer))[:, 0])
+                filled = 0
+    if filled:
+        outputs.append(np.asarray(model.predict(buffer[:filled]))[:, 0])
+    return np.concatenate(outputs)
+
+
+def symbol_frame(symbol, bars, features, origins):
+    # The baselines see the LR_LOOKBACK closes strictly before each origin,
+    # all origins in one batched call (origins start at LR_LOOKBACK or
+    # later, so every row is full)
+    close = features['close'].to_numpy()
+    history = sliding_window_view(close, LR_LOOKBACK)[origins - LR_LOOKBACK]
+    return pd.DataFrame({
+        'symbol': symbol,
+        'date': bars['timestamp'].to_numpy()[origins],
+        'actual': close[origins],
+        'previous': close[origins - 1],
+        'moving_average': moving_average_forecasts(history),
+        'linear_regression': linear_regression_forecasts(history),
+    })
+
+
+def run_backtest(symbols, start_date, end_date, model, price_scaler, indicator_scaler, sequence_length,
+                 origins_from=None, step=1, batch_size=BACKTEST_BATCH_SIZE):
+    bar_store = BarStore(sized_dir(BAR_STORE_DIR), make_bar_source())
+    bar_store.refresh_many(symbols, start_date, end_date)
+    feature_paths = prepare_features(symbols, start_date, end_date)
+
+    frames, views = [], []
+    for symbol, path in feature_paths.items():
+        bars = bar_store.get_bars(symbol, start_date, end_date)
+        features = load_features(path)
+        origins = np.arange(max(sequence_length, LR_LOOKBACK), len(features), step)
+        if origins_from:
+            origins = origins[bars['timestamp'].to_numpy()[origins] >= np.datetime64(origins_from)]
+        if len(origins) == 0:
+            logger.warning(f"No forecast origins for {symbol}")
+            continue
+        scaled = scale_features(features, price_scaler, indicator_scaler)
+        # windows[i] = scaled[i:i + T], so the window ending before o is o - T
+        windows = sliding_window_view(scaled, sequence_length, axis=0).transpose(0, 2, 1)
+        views.append(windows[origins - sequence_length])
+        frames.append(symbol_frame(symbol, bars, features, origins))
+    if not frames:
+        return pd.DataFrame(columns=['symbol', 'date', 'actual', 'previous'] + MODELS)
+
+    report = pd.concat(frames, ignore_index=True)
+    report['lstm'] = inverse_close(predict_windows(model, views, batch_size), price_scaler)
+    return report[['symbol', 'date', 'actual', 'previous'] + MODELS]
+
+
+def summarize(report, by):
+    # MAE, RMSE, R² and directional accuracy per `by` group and model, all
+    # derived from grouped sums instead of per-group metric calls
+    rows = []
+    for name in MODELS:
+        valid = report[report[name].notna()]
+        actual = valid['actual'].to_numpy()
+        error = valid[name].to_numpy() - actual
+        parts = pd.DataFrame({
+            'abs_error': np.abs(error),
+            'sq_error': error ** 2,
+            'actual': actual,
+            'actual_sq': actual ** 2,
+            'hit': np.sign(valid[name].to_numpy() - valid['previous'].to_numpy())
+                   == np.sign(actual - valid['previous'].to_numpy()),
+        })
+        grouped = parts.groupby(valid[by].to_numpy())
+        sums, n = grouped.sum(), grouped.size()
+        ss_tot = sums['actual_sq'] - sums['actual'] ** 2 / n
+        rows.append(pd.DataFrame({
+            'group': by,
+            'key': sums.index.astype(str),
+            'model': name,
+            'n': n.to_numpy(),
+            'mae': (sums['abs_error'] / n).to_numpy(),
+            'rmse': np.sqrt(sums['sq_error'] / n).to_numpy(),
+            'r2': (1 - sums['sq_error'] / ss_tot).to_numpy(),
+            'directional_accuracy': (sums['hit'] / n).to_numpy(),
+        }))
+    return pd.concat(rows, ignore_index=True)
+
+
+def summary_tables(report, period='Q'):
+    report = report.assign(overall='all', period=pd.to_datetime(report['date']).dt.to_period(period).astype(str))
+    return pd.concat([summarize(report, by) for by in ('overall', 'symbol', 'period')], ignore_index=True)
+
+
+def write_table(df, path):
+    # Parquet needs pyarrow (or fastparquet); CSV works everywhere
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    if path.endswith('.parquet'):
+        df.to_parquet(path, index=False)
+    else:
+        df.to_csv(path, index=False)
+
+
+def plot_report(report, output_dir):
+    # Runs on the finished report only; one PNG per symbol
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    os.makedirs(output_dir, exist_ok=True)
+    for symbol, frame in report.groupby('symbol'):
+        plt.figure(figsize=(14, 7))
+        plt.plot(frame['date'], frame['actual'], label="Actual Price", color="blue")
+        for name in MODELS:
+            plt.plot(frame['date'], frame[name], label=name, linewidth=0.8)
+        plt.xlabel("Date")
+        plt.ylabel("Price")
+        plt.title(f"Walk-forward backtest: {symbol}")
+        plt.legend()
+        plt.tight_layout()
+        plt.savefig(os.path.join(output_dir, f"backtest_{symbol}.png"), dpi=150)
+        plt.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Walk-forward backtest of the LSTM and baseline forecasts")
+    parser.add_argument('symbols', nargs='+')
+    parser.add_argument('--start', default='2020-01-01', help="first bar loaded")
+    parser.add_argument('--end', default=pd.Timestamp.now().strftime('%Y-%m-%d'))
+    parser.add_argument('--origins-from',
+                        help="only evaluate forecasts for bars on or after this date (default: the day "
+                             "after the model's training end_date; 'all' for every origin)")
+    parser.add_argument('--step', type=int, default=1, help="bars between forecast origins")
+    parser.add_argument('--period', default='Q', help="pandas period for the per-period summary")
+    parser.add_argument('--model-dir', default=MODEL_DIR)
+    parser.add_argument('--batch-size', type=int, default=BACKTEST_BATCH_SIZE)
+    parser.add_argument('--output', default=os.path.join('reports', 'backtest.parquet'),
+                        help="per-origin report; .parquet or .csv")
+    parser.add_argument('--plot', action='store_true', help="also write per-symbol plots next to the report")
+    args = parser.parse_args()
+
+    # Window length and training range come from the model's metadata.json
+    # (a registry version directory works as --model-dir too)
+    metadata = read_metadata(args.model_dir)
+    if 'sequence_length' not in metadata:
+        raise SystemExit(f"{args.model_dir} does not record the model's sequence_length")
+    origins_from = args.origins_from
+    if origins_from is None and 'end_date' in metadata:
+        origins_from = (pd.Timestamp(metadata['end_date']) + pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+        logger.info(f"Scoring forecasts from {origins_from}, after the model's training data")
+    elif origins_from is None:
+        logger.warning(f"{args.model_dir} does not record its training end_date; "
+                       f"forecasts inside the training range are scored too")
+    elif origins_from == 'all':
+        origins_from = None
+    model = load_backend(args.model_dir)
+    price_scaler = joblib.load(os.path.join(args.model_dir, 'price_scaler.save'))
+    indicator_scaler = joblib.load(os.path.join(args.model_dir, 'indicator_scaler.save'))
+
+    report = run_backtest(args.symbols, args.start, args.end, model, price_scaler, indicator_scaler,
+                          int(metadata['sequence_length']), origins_from, args.step, args.batch_size)
+    write_table(report, args.output)
+    stem, extension = os.path.splitext(args.output)
+    summary = summary_tables(report, args.period)
+    write_table(summary, f"{stem}_summary{extension}")
+    logger.info(f"Wrote {len(report)} forecasts to {args.output}")
+    for row in summary[summary['group'] == 'overall'].itertuples():
+        logger.info(f"{row.model}: MAE={row.mae:.2f}, RMSE={row.rmse:.2f}, R²={row.r2:.2f}, "
+                    f"direction={row.directional_accuracy:.1%} over {row.n} forecasts")
+    if args.plot:
+        plot_report(report, os.path.dirname(os.path.abspath(args.output)))
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    main()
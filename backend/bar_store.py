@@ -0,0 +1,329 @@
+import os
+import re
+import json
+import time
+import logging
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from polygon_async import BackgroundPolygonClient
+
+logger = logging.getLogger(__name__)
+
+BAR_STORE_DIR = os.getenv('BAR_STORE_DIR', os.path.join('data', 'bars'))
+# Seconds during which a symbol that was just refreshed is served from disk
+# without asking the source for new bars
+REFRESH_INTERVAL = int(os.getenv('BAR_STORE_REFRESH_SECONDS', '900'))
+# Threads of each store's refresh pool, shared by concurrent refresh_many
+# calls; HTTP concurrency is bounded separately by the Polygon client
+PREFETCH_WORKERS = int(os.getenv('BAR_STORE_PREFETCH_WORKERS', '16'))
+# Rows per chunk when streaming bars from CSV files or the store
+CHUNK_ROWS = int(os.getenv('BAR_CHUNK_ROWS', '50000'))
+
+BAR_COLUMNS = ['timestamp', 'open', 'high', 'low', 'close', 'volume']
+# One record per bar; timestamps are Polygon's epoch milliseconds
+BAR_DTYPE = np.dtype([
+    ('timestamp', '<i8'),
+    ('open', '<f8'),
+    ('high', '<f8'),
+    ('low', '<f8'),
+    ('close', '<f8'),
+    ('volume', '<f8'),
+])
+
+DAY_MS = 24 * 60 * 60 * 1000
+
+# A bar size such as '1d', '1h' or '15m'. Sources are read at one
+# `timespan` (one minute, hour or day per bar) and downsampled to
+# `multiplier` of them.
+BarSize = namedtuple('BarSize', ['label', 'multiplier', 'timespan', 'milliseconds'])
+TIMESPANS = {'m': ('minute', 60 * 1000), 'h': ('hour', 60 * 60 * 1000), 'd': ('day', DAY_MS)}
+# Calendar days of bars the server keeps per symbol, by timespan; a year
+# of minute bars is ~100k rows, of which only a bounded tail is served
+HISTORY_DAYS = {'minute': 30, 'hour': 180, 'day': 365}
+
+
+def parse_bar_size(label):
+    match = re.fullmatch(r'(\d+)([mhd])', label.strip().lower())
+    if not match or int(match.group(1)) < 1:
+        raise ValueError(f"Invalid bar size {label!r}; expected e.g. 1d, 4h, 15m")
+    multiplier = int(match.group(1))
+    timespan, unit_ms = TIMESPANS[match.group(2)]
+    # Buckets are aligned to UTC midnight, so intraday sizes must divide a
+    # day; daily bars are not aggregated further
+    if (timespan == 'day' and multiplier != 1) or DAY_MS % (multiplier * unit_ms):
+        raise ValueError(f"Unsupported bar size {label!r}")
+    return BarSize(f"{multiplier}{match.group(2)}", multiplier, timespan, multiplier * unit_ms)
+
+
+BAR_SIZE = parse_bar_size(os.getenv('BAR_SIZE', '1d'))
+
+
+def sized_dir(root, bar_size=BAR_SIZE):
+    # Daily data keeps the original layout; other sizes get a sibling
+    # directory (data/bars_1h), never a subdirectory of one that is rebuilt
+    return root if bar_size.timespan == 'day' else f"{os.path.normpath(root)}_{bar_size.label}"
+
+
+def downsample(chunks, bar_size):
+    # Aggregates a time-ordered stream of BAR_DTYPE chunks into bar_size
+    # buckets (first open, max high, min low, last close, summed volume).
+    # The last bucket of a chunk may continue in the next one, so it is
+    # held back until then; at the end it is yielded as is, possibly partial.
+    # Daily bars pass through: Polygon stamps them at midnight New York time.
+    if bar_size.timespan == 'day':
+        yield from chunks
+        return
+    carry = np.empty(0, dtype=BAR_DTYPE)
+    for chunk in chunks:
+        bars = np.concatenate([carry, chunk]) if len(carry) else chunk
+        if len(bars) == 0:
+            continue
+        buckets = bars['timestamp'] // bar_size.milliseconds
+        starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+        carry = bars[starts[-1]:]
+        if len(starts) > 1:
+            yield _aggregate(bars[:starts[-1]], starts[:-1], buckets, bar_size)
+    if len(carry):
+        yield _aggregate(carry, np.array([0]), carry['timestamp'] // bar_size.milliseconds, bar_size)
+
+
+def _aggregate(bars, starts, buckets, bar_size):
+    ends = np.r_[starts[1:], len(bars)]
+    out = np.empty(len(starts), dtype=BAR_DTYPE)
+    out['timestamp'] = buckets[starts] * bar_size.milliseconds
+    out['open'] = bars['open'][starts]
+    out['high'] = np.maximum.reduceat(bars['high'], starts)
+    out['low'] = np.minimum.reduceat(bars['low'], starts)
+    out['close'] = bars['close'][ends - 1]
+    out['volume'] = np.add.reduceat(bars['volume'], starts)
+    return out
+
+
+def _date_to_ms(date):
+    return int(pd.Timestamp(date).value // 1_000_000)
+
+
+def _ms_to_date(ms):
+    return pd.Timestamp(ms, unit='ms').strftime('%Y-%m-%d')
+
+
+class PolygonBarSource:
+    # `client` is a BackgroundPolygonClient: calls block only the calling
+    # thread while the request runs on the shared event loop. Aggregates
+    # are read one result page at a time at the bar size's timespan.
+    def __init__(self, client, bar_size=BAR_SIZE):
+        self.client = client
+        self.bar_size = bar_size
+
+    def iter_bars(self, symbol, from_date, to_date):
+        pages = self.client.iter_aggs(symbol, from_date, to_date, multiplier=1, timespan=self.bar_size.timespan)
+        return downsample((np.array(rows, dtype=BAR_DTYPE) for rows in pages), self.bar_size)
+
+    def get_bars(self, symbol, from_date, to_date):
+        return _concat(self.iter_bars(symbol, from_date, to_date))
+
+
+class CsvBarSource:
+    # File-backed stand-in for Polygon: reads <directory>/<SYMBOL>.csv with the
+    # BAR_COLUMNS header in chunks. Timestamps may be epoch milliseconds or
+    # dates; bars finer than bar_size (e.g. minutes for '1h') are downsampled.
+    def __init__(self, directory, bar_size=BAR_SIZE, chunk_rows=CHUNK_ROWS):
+        self.directory = directory
+        self.bar_size = bar_size
+        self.chunk_rows = chunk_rows
+
+    def _chunks(self, path, from_date, to_date):
+        with pd.read_csv(path, chunksize=self.chunk_rows) as reader:
+            for df in reader:
+                if not np.issubdtype(df['timestamp'].dtype, np.integer):
+                    df['timestamp'] = pd.to_datetime(df['timestamp']).astype('int64') // 1_000_000
+                df = df[(df['timestamp'] >= _date_to_ms(from_date)) &
+                        (df['timestamp'] < _date_to_ms(to_date) + DAY_MS)]
+                bars = np.empty(len(df), dtype=BAR_DTYPE)
+                for column in BAR_COLUMNS:
+                    bars[column] = df[column].values
+                yield bars
+
+    def iter_bars(self, symbol, from_date, to_date):
+        path = os.path.join(self.directory, f"{symbol}.csv")
+        if not os.path.exists(path):
+            return iter(())
+        return downsample(self._chunks(path, from_date, to_date), self.bar_size)
+
+    def get_bars(self, symbol, from_date, to_date):
+        return _concat(self.iter_bars(symbol, from_date, to_date))
+
+
+def _concat(chunks):
+    # Structured chunks are compact (48 bytes per bar); only they, never a
+    # whole history of parsed rows, are held at once
+    chunks = list(chunks)
+    return np.concatenate(chunks) if chunks else np.empty(0, dtype=BAR_DTYPE)
+
+
+def make_bar_source(bar_size=BAR_SIZE):
+    # BAR_SOURCE_DIR switches the store to local CSV files (tests, offline runs)
+    source_dir = os.getenv('BAR_SOURCE_DIR')
+    if source_dir:
+        logger.info(f"Using CSV bar source at {source_dir}")
+        return CsvBarSource(source_dir, bar_size)
+    return PolygonBarSource(BackgroundPolygonClient(os.getenv("POLYGON_API_KEY")), bar_size)
+
+
+class BarStore:
+    """Per-symbol bars persisted as memory-mapped .npy files.
+
+    Only bars from the day of the last stored one onwards are requested
+    from the source, so a partial (still forming) last bar gets replaced by
+    its final values. One store holds one bar size (see sized_dir).
+    """
+
+    def __init__(self, root, source, refresh_interval=REFRESH_INTERVAL):
+        self.root = root
+        self.source = source
+        self.refresh_interval = refresh_interval
+        self._locks = {}
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pid = None
+        os.makedirs(root, exist_ok=True)
+
+    def _symbol_lock(self, symbol):
+        with self._lock:
+            return self._locks.setdefault(symbol.upper(), threading.Lock())
+
+    def _executor(self):
+        # One refresh pool per store, created lazily and per process: pool
+        # threads started before gunicorn forks do not survive the fork
+        with self._lock:
+            if self._pool is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._pool = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix='bar-store')
+            return self._pool
+
+    def _paths(self, symbol):
+        base = os.path.join(self.root, symbol.upper())
+        return base + '.npy', base + '.json'
+
+    def _read_meta(self, symbol):
+        _, meta_path = self._paths(symbol)
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path) as f:
+            return json.load(f)
+
+    def load(self, symbol):
+        bars_path, _ = self._paths(symbol)
+        if not os.path.exists(bars_path):
+            return np.empty(0, dtype=BAR_DTYPE)
+        return np.load(bars_path, mmap_mode='r')
+
+    def _write(self, symbol, bars, meta):
+        bars_path, meta_path = self._paths(symbol)
+        # Write-then-rename so concurrent readers (other gunicorn workers)
+        # never see a half-written file
+        tmp_bars = f"{bars_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_bars, 'wb') as f:
+            np.save(f, bars)
+        os.replace(tmp_bars, bars_path)
+        tmp_meta = f"{meta_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_meta, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_meta, meta_path)
+
+    @staticmethod
+    def _merge(stored, fetched):
+        if len(fetched) == 0:
+            return np.array(stored)
+        # Fetched bars win over stored bars with the same timestamp
+        keep = ~np.isin(stored['timestamp'], fetched['timestamp'])
+        merged = np.concatenate([stored[keep], fetched])
+        return merged[np.argsort(merged['timestamp'], kind='stable')]
+
+    def refresh(self, symbol, from_date, to_date):
+        # Concurrent refreshes of one symbol wait for the first instead of
+        # fetching the same bars again
+        with self._symbol_lock(symbol):
+            return self._refresh(symbol, from_date, to_date)
+
+    def _refresh(self, symbol, from_date, to_date):
+        stored = self.load(symbol)
+        meta = self._read_meta(symbol)
+
+        if meta is None or len(stored) == 0:
+            fetched = self.source.get_bars(symbol, from_date, to_date)
+            logger.info(f"Bar store: fetched {len(fetched)} bars for {symbol}")
+            if len(fetched) == 0:
+                # Nothing is stored for unknown symbols (or empty ranges),
+                # so they neither leave files behind nor count as fresh
+                return fetched
+            bars = self._merge(np.empty(0, dtype=BAR_DTYPE), fetched)
+            meta = {'covered_from': from_date, 'covered_to': to_date, 'fetched_at': time.time()}
+            self._write(symbol, bars, meta)
+            return bars
+
+        fresh = (time.time() - meta['fetched_at'] < self.refresh_interval
+                 and to_date <= meta['covered_to'])
+        if fresh and from_date >= meta['covered_from']:
+            return stored
+
+        bars = stored
+        if from_date < meta['covered_from']:
+            backfill = self.source.get_bars(symbol, from_date, meta['covered_from'])
+            bars = self._merge(bars, backfill)
+            meta['covered_from'] = from_date
+        if not fresh:
+            since = _ms_to_date(int(stored['timestamp'][-1]))
+            fetched = self.source.get_bars(symbol, since, to_date)
+            logger.info(f"Bar store: fetched {len(fetched)} bars for {symbol} since {since}")
+            bars = self._merge(bars, fetched)
+            meta['covered_to'] = max(to_date, meta['covered_to'])
+            meta['fetched_at'] = time.time()
+        self._write(symbol, bars, meta)
+        return bars
+
+    def refresh_many(self, symbols, from_date, to_date):
+        # Refreshes symbols in parallel; returns ({symbol: bars}, {symbol: error})
+        results, errors = {}, {}
+        if not symbols:
+            return results, errors
+        pool = self._executor()
+        futures = {symbol: pool.submit(self.refresh, symbol, from_date, to_date) for symbol in symbols}
+        for symbol, future in futures.items():
+            try:
+                results[symbol] = future.result()
+            except Exception as e:
+                logger.error(f"Bar store: refreshing {symbol} failed: {str(e)}")
+                errors[symbol] = str(e)
+        return results, errors
+
+    def get_bars(self, symbol, from_date, to_date, tail=None):
+        # `tail` keeps only the last bars of the range; the rest of the
+        # memory map is never read
+        return self._frame(self._select(self.refresh(symbol, from_date, to_date), from_date, to_date, tail))
+
+    def iter_frames(self, symbol, from_date, to_date, chunk_rows=CHUNK_ROWS):
+        # The stored range as DataFrames of at most chunk_rows bars, for
+        # passes over long intraday histories in bounded memory
+        bars = self._select(self.refresh(symbol, from_date, to_date), from_date, to_date)
+        for start in range(0, len(bars), chunk_rows):
+            yield self._frame(bars[start:start + chunk_rows])
+
+    @staticmethod
+    def _select(bars, from_date, to_date, tail=None):
+        # Timestamps are sorted, so the range is a slice of the memory map
+        ts = bars['timestamp']
+        start = int(np.searchsorted(ts, _date_to_ms(from_date)))
+        end = int(np.searchsorted(ts, _date_to_ms(to_date) + DAY_MS))
+        if tail is not None:
+            start = max(start, end - tail)
+        return bars[start:end]
+
+    @staticmethod
+    def _frame(selected):
+        df = pd.DataFrame({column: np.asarray(selected[column]) for column in BAR_COLUMNS})
+        df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
+        return df
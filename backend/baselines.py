@@ -0,0 +1,68 @@
+import numpy as np
+
+# Closed-form baselines over many series at once. `closes` is a 2-D array
+# with one row per series, most recent close last; shorter histories are
+# left-padded with NaN (see stack_tails). Rows without enough history get NaN.
+
+MA_WINDOW = 10
+LR_LOOKBACK = 30
+LR_MIN_POINTS = 10
+
+
+def stack_tails(series, length=LR_LOOKBACK):
+    # Right-aligns the last `length` values of each 1-D series into one
+    # NaN-padded (len(series), length) array
+    closes = np.full((len(series), length), np.nan)
+    for row, values in enumerate(series):
+        values = np.asarray(values, dtype=np.float64)[-length:]
+        if len(values):
+            closes[row, length - len(values):] = values
+    return closes
+
+
+def moving_average_forecasts(closes, window=MA_WINDOW):
+    # Mean of the last `window` closes; NaN if any of them is missing
+    closes = np.asarray(closes, dtype=np.float64)
+    if closes.shape[1] < window:
+        return np.full(len(closes), np.nan)
+    return closes[:, -window:].mean(axis=1)
+
+
+def linear_regression_forecasts(closes, lookback=LR_LOOKBACK, min_points=LR_MIN_POINTS):
+    # Least-squares line through the last `lookback` closes (fewer if the
+    # history is shorter), evaluated one step past the last point:
+    # x = 0..m-1, forecast = mean(y) + slope * (m - mean(x))
+    y = np.asarray(closes, dtype=np.float64)[:, -lookback:]
+    valid = ~np.isnan(y)
+    m = valid.sum(axis=1)
+    # Valid values are right-aligned, so x counts from the first of them
+    x = np.arange(y.shape[1]) - (y.shape[1] - m)[:, np.newaxis]
+    x = np.where(valid, x, 0.0)
+    y = np.where(valid, y, 0.0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        x_mean = x.sum(axis=1) / m
+        y_mean = y.sum(axis=1) / m
+        dx = np.where(valid, x - x_mean[:, np.newaxis], 0.0)
+        slope = (dx * y).sum(axis=1) / (dx * dx).sum(axis=1)
+        forecasts = y_mean + slope * (m - x_mean)
+    forecasts[m < min_points] = np.nan
+    return forecasts
+
+
+BASELINES = {
+    'moving_average': moving_average_forecasts,
+    'linear_regression': linear_regression_forecasts,
+}
+
+
+def _single(forecasts):
+    value = forecasts[0]
+    return None if np.isnan(value) else float(value)
+
+
+def moving_average_forecast(data, window=MA_WINDOW):
+    return _single(moving_average_forecasts(stack_tails([data['close'].to_numpy()], window), window))
+
+
+def linear_regression_forecast(data):
+    return _single(linear_regression_forecasts(stack_tails([data['close'].to_numpy()], LR_LOOKBACK)))
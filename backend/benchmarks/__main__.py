@@ -0,0 +1,71 @@
+import os
+import sys
+import logging
+import argparse
+from benchmarks.harness import offline_environment, report, BASELINE_DIR, REGRESSION_TOLERANCE
+
+# python -m benchmarks {micro,load,train} [--save | --check] from backend/.
+# Baselines live in benchmarks/baselines/<suite>.json; --save rewrites it,
+# --check exits non-zero when a stage regressed past --tolerance.
+
+DEFAULT_SYMBOLS = ['AAPL', 'MSFT', 'GOOGL', 'AMZN']
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m benchmarks',
+                                     description="Offline benchmarks on synthetic market data")
+    parser.add_argument('suite', choices=['micro', 'load', 'train'])
+    parser.add_argument('--symbols', nargs='+', default=DEFAULT_SYMBOLS)
+    parser.add_argument('--source', choices=['polygon', 'csv'], default='polygon',
+                        help="serve synthetic bars through a fake Polygon server or CSV files")
+    parser.add_argument('--source-latency', type=float, default=0.0,
+                        help="seconds added to every fake Polygon request")
+    parser.add_argument('--repeat', type=int, default=20, help="micro: timed calls per benchmark")
+    parser.add_argument('--endpoint', choices=['predict', 'batch'], default='predict', help="load: endpoint")
+    parser.add_argument('--concurrency', type=int, default=8, help="load: concurrent clients")
+    parser.add_argument('--requests', type=int, default=200, help="load: requests to send")
+    parser.add_argument('--url', help="load: measure a running server instead of an in-process one")
+    parser.add_argument('--uncached', action='store_true',
+                        help="load: expire cached features/responses immediately (in-process only)")
+    parser.add_argument('--batches', type=int, default=50, help="train: input batches timed")
+    parser.add_argument('--fit-steps', type=int, default=20, help="train: optimizer steps timed")
+    parser.add_argument('--save', nargs='?', const='', help="write results as the baseline (or to PATH)")
+    parser.add_argument('--check', nargs='?', const='', help="compare against the baseline (or PATH)")
+    parser.add_argument('--tolerance', type=float, default=REGRESSION_TOLERANCE)
+    args = parser.parse_args()
+
+    default_baseline = os.path.join(BASELINE_DIR, f"{args.suite}.json")
+    save = default_baseline if args.save == '' else args.save
+    check = default_baseline if args.check == '' else args.check
+    parameters = {'symbols': args.symbols, 'source': args.source, 'source_latency': args.source_latency}
+
+    if args.suite == 'load' and args.url:
+        from benchmarks.load_test import run_load
+        parameters.update(endpoint=args.endpoint, concurrency=args.concurrency, requests=args.requests)
+        results = run_load(args.url, args.symbols, args.endpoint, args.concurrency, args.requests)
+        return report(args.suite, results, parameters, save, check, args.tolerance)
+
+    with offline_environment(args.symbols, args.source, args.source_latency):
+        if args.suite == 'micro':
+            from benchmarks.micro import run_micro
+            parameters.update(repeat=args.repeat)
+            results = run_micro(args.symbols[0], args.repeat)
+        elif args.suite == 'load':
+            from benchmarks.load_test import run_load, InProcessServer
+            if args.uncached:
+                os.environ['PREDICTION_CACHE_TTL'] = '0'
+            parameters.update(endpoint=args.endpoint, concurrency=args.concurrency, requests=args.requests,
+                              uncached=args.uncached)
+            with InProcessServer() as server:
+                results = run_load(server.url, args.symbols, args.endpoint, args.concurrency, args.requests)
+        else:
+            from benchmarks.training import run_training
+            parameters.update(batches=args.batches, fit_steps=args.fit_steps)
+            results = run_training(args.symbols, args.batches, args.fit_steps)
+    return report(args.suite, results, parameters, save, check, args.tolerance)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger('benchmarks').setLevel(logging.INFO)
+    sys.exit(main())
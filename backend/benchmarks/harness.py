@@ -0,0 +1,164 @@
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import tempfile
+import logging
+from contextlib import contextmanager
+import numpy as np
+from benchmarks.synthetic import FakePolygonServer, write_csv_source
+
+logger = logging.getLogger(__name__)
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINE_DIR = os.path.join(BENCHMARK_DIR, 'baselines')
+# Relative slowdown tolerated by --check before a result counts as a regression
+REGRESSION_TOLERANCE = float(os.getenv('BENCHMARK_TOLERANCE', '0.25'))
+# Every store the app and training read at import time; pointed into a
+# scratch directory so benchmarks never touch (or benefit from) real data
+STORE_VARIABLES = {
+    'BAR_STORE_DIR': 'bars',
+    'FEATURE_STATE_DIR': 'feature_state',
+    'PREDICTION_CACHE_DIR': 'prediction_cache',
+    'FEATURE_CACHE_DIR': 'features',
+    'TRAINING_STORE_DIR': 'training',
+}
+
+
+@contextmanager
+def offline_environment(symbols, source='polygon', latency=0.0, workdir=None):
+    # Must be entered before app/train_model/bar_store are imported: they
+    # read these variables at import. 'polygon' serves synthetic bars over
+    # HTTP to the real Polygon client; 'csv' writes them for CsvBarSource.
+    scratch = workdir or tempfile.mkdtemp(prefix='quantum-bench-')
+    saved = dict(os.environ)
+    server = None
+    try:
+        for variable, name in STORE_VARIABLES.items():
+            os.environ[variable] = os.path.join(scratch, name)
+            os.makedirs(os.environ[variable], exist_ok=True)
+        if source == 'csv':
+            os.environ['BAR_SOURCE_DIR'] = os.path.join(scratch, 'source')
+            os.makedirs(os.environ['BAR_SOURCE_DIR'], exist_ok=True)
+            write_csv_source(os.environ['BAR_SOURCE_DIR'], symbols)
+        else:
+            server = FakePolygonServer(latency=latency).start()
+            os.environ.pop('BAR_SOURCE_DIR', None)
+            os.environ['POLYGON_BASE_URL'] = server.url
+            os.environ.setdefault('POLYGON_API_KEY', 'benchmark')
+        yield scratch
+    finally:
+        if server is not None:
+            server.stop()
+        os.environ.clear()
+        os.environ.update(saved)
+        if workdir is None:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+
+def latency_summary(seconds):
+    seconds = np.asarray(seconds, dtype=np.float64) * 1000
+    if len(seconds) == 0:
+        return {}
+    p50, p95, p99 = np.percentile(seconds, [50, 95, 99])
+    return {
+        'count': len(seconds),
+        'mean_ms': float(seconds.mean()),
+        'p50_ms': float(p50),
+        'p95_ms': float(p95),
+        'p99_ms': float(p99),
+        'max_ms': float(seconds.max()),
+    }
+
+
+def time_call(fn, repeat=20, warmup=2):
+    # Latency distribution of fn() over `repeat` calls after `warmup`
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return latency_summary(samples)
+
+
+def environment_info():
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def write_results(path, suite, results, parameters):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    payload = {
+        'suite': suite,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'environment': environment_info(),
+        'parameters': parameters,
+        'results': results,
+    }
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(payload, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+    logger.info(f"Wrote {suite} results to {path}")
+
+
+# Gated latencies; tails beyond p95 and maxima are reported but too noisy
+# at these sample counts to fail a check on
+GATED_LATENCIES = {'p50_ms', 'p95_ms', 'wall_ms', 'batch_ms', 'step_ms'}
+
+
+def _higher_is_better(metric):
+    return metric == 'rps' or metric.endswith('_per_s')
+
+
+def compare_results(results, baseline, tolerance=REGRESSION_TOLERANCE):
+    # One message per metric that moved the wrong way by more than
+    # `tolerance`: gated latencies up, rps/*_per_s throughputs down, plus any
+    # increase in errors. Metrics missing on either side are ignored.
+    regressions = []
+    for name, metrics in results.items():
+        for metric, value in metrics.items():
+            reference = baseline.get(name, {}).get(metric)
+            if not isinstance(reference, (int, float)) or not isinstance(value, (int, float)):
+                continue
+            if metric == 'errors':
+                regressed = value > reference
+            elif not reference:
+                continue
+            elif _higher_is_better(metric):
+                regressed = value < reference / (1 + tolerance)
+            elif metric in GATED_LATENCIES:
+                regressed = value > reference * (1 + tolerance)
+            else:
+                continue
+            if regressed:
+                regressions.append(f"{name}.{metric}: {value:.3f} vs baseline {reference:.3f}")
+    return regressions
+
+
+def report(suite, results, parameters, save=None, check=None, tolerance=REGRESSION_TOLERANCE):
+    # Prints the results, optionally saves them and/or checks them against
+    # a saved baseline; returns the process exit code
+    print(json.dumps({suite: results}, indent=2, sort_keys=True))
+    if save:
+        write_results(save, suite, results, parameters)
+    if check:
+        with open(check) as f:
+            baseline = json.load(f)
+        if baseline.get('parameters') != parameters:
+            logger.warning(f"Baseline {check} was recorded with different parameters: {baseline.get('parameters')}")
+        regressions = compare_results(results, baseline['results'], tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            return 1
+        logger.info(f"No regressions against {check} (tolerance {tolerance:.0%})")
+    return 0
@@ -0,0 +1,75 @@
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from werkzeug.serving import make_server
+from benchmarks.harness import latency_summary
+
+# End-to-end load test of /api/predict (or /api/predict/batch) over HTTP.
+# Without a url the Flask app is served in-process by a threaded werkzeug
+# server, so run it inside offline_environment; with one, any running
+# deployment (e.g. gunicorn from the Procfile) can be measured.
+
+
+class InProcessServer:
+    def __init__(self, host='127.0.0.1', port=0):
+        import app
+        logging.getLogger('werkzeug').setLevel(logging.WARNING)  # no access log per request
+        self._server = make_server(host, port, app.app, threaded=True)
+        self.url = f"http://{host}:{self._server.server_port}"
+
+    def __enter__(self):
+        threading.Thread(target=self._server.serve_forever, name='benchmark-server', daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+
+
+def _payloads(endpoint, symbols, batch_size):
+    # Requests cycle through the symbols (in groups for the batch endpoint)
+    if endpoint == 'batch':
+        groups = [symbols[i:i + batch_size] for i in range(0, len(symbols), batch_size)]
+        return '/api/predict/batch', [{'symbols': group} for group in groups]
+    return '/api/predict', [{'symbol': symbol} for symbol in symbols]
+
+
+def run_load(url, symbols, endpoint='predict', concurrency=8, requests_count=200, batch_size=10, warmup=True):
+    path, payloads = _payloads(endpoint, symbols, batch_size)
+    local = threading.local()
+
+    def send(i):
+        # One keep-alive session per worker thread
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        started = time.perf_counter()
+        try:
+            status = session.post(url + path, json=payloads[i % len(payloads)], timeout=60).status_code
+        except requests.RequestException:
+            status = None
+        return time.perf_counter() - started, status
+
+    if warmup:
+        # First requests fill the bar store and feature state; measure the
+        # steady state instead
+        for i in range(len(payloads)):
+            send(i)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        started = time.perf_counter()
+        outcomes = list(pool.map(send, range(requests_count)))
+        elapsed = time.perf_counter() - started
+
+    ok = [seconds for seconds, status in outcomes if status == 200]
+    statuses = {}
+    for _, status in outcomes:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    result = latency_summary(ok)
+    result.update({
+        'rps': len(ok) / elapsed,
+        'errors': requests_count - len(ok),
+        'statuses': statuses,
+    })
+    return {f'{endpoint}[c={concurrency}]': result}
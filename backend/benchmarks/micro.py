@@ -0,0 +1,41 @@
+import numpy as np
+from benchmarks.harness import time_call
+
+# Per-stage timings of the serving pipeline on synthetic bars. Imports app,
+# so call run_micro inside offline_environment.
+
+# Fixed ranges keep the row counts (and so the timings) comparable between
+# runs: one year as served by /api/predict, five as used for training
+SERVED_RANGE = ('2024-01-01', '2024-12-31')
+TRAINING_RANGE = ('2020-01-01', '2024-12-31')
+PREDICT_BATCH_SIZES = (1, 32, 256)
+
+
+def run_micro(symbol='AAPL', repeat=20):
+    import app
+    from sequences import create_sequences
+
+    served = app.bar_store.get_bars(symbol, *SERVED_RANGE)
+    history = app.bar_store.get_bars(symbol, *TRAINING_RANGE)
+    served_features = app.add_technical_indicators(served)
+    features = app.add_technical_indicators(history)
+    scaled = app.preprocess_data(features)
+
+    results = {
+        'add_technical_indicators[1y]': time_call(lambda: app.add_technical_indicators(served), repeat),
+        'add_technical_indicators[5y]': time_call(lambda: app.add_technical_indicators(history), repeat),
+        'preprocess_data[1y]': time_call(lambda: app.preprocess_data(served_features), repeat),
+        'preprocess_data[5y]': time_call(lambda: app.preprocess_data(features), repeat),
+        'create_sequences[5y]': time_call(lambda: create_sequences(scaled, app.SEQUENCE_LENGTH), repeat),
+        'create_sequences[5y,float32]': time_call(
+            lambda: create_sequences(scaled, app.SEQUENCE_LENGTH, dtype=np.float32), repeat),
+    }
+    model = app.serving().model if app.serving() is not None else None
+    if model is not None:
+        X, _ = create_sequences(scaled, app.SEQUENCE_LENGTH, dtype=np.float32)
+        for batch_size in PREDICT_BATCH_SIZES:
+            batch = np.ascontiguousarray(X[-batch_size:])
+            timing = time_call(lambda: model.predict(batch), repeat)
+            timing['windows_per_s'] = batch_size * 1000 / timing['p50_ms']
+            results[f'model.predict[{model.name},batch={batch_size}]'] = timing
+    return results
@@ -0,0 +1,156 @@
+import os
+import time
+import zlib
+import asyncio
+import threading
+from collections import Counter
+import numpy as np
+import pandas as pd
+from aiohttp import web
+
+# Offline market data for the benchmarks: a seeded OHLCV generator and two
+# ways to serve it -- CSV files for CsvBarSource, and a local HTTP server
+# speaking the Polygon aggregates API so PolygonBarSource/AsyncPolygonClient
+# run unchanged against it (set POLYGON_BASE_URL to its url). Nothing from
+# the backend is imported at module level: bar_store and polygon_async read
+# their configuration at import, which offline_environment sets up first.
+
+HISTORY_START = '2015-01-01'
+
+
+def _seed(symbol):
+    # Stable across processes (unlike hash())
+    return zlib.crc32(symbol.upper().encode())
+
+
+def synthetic_bars(symbol, from_date, to_date, seed=None):
+    # Geometric Brownian motion closes on business days with plausible
+    # open/high/low and volume. Bars are generated from HISTORY_START and
+    # then cut, so a symbol's bar for a given day never depends on the
+    # requested range.
+    days = pd.bdate_range(HISTORY_START, to_date)
+    rng = np.random.default_rng(_seed(symbol) if seed is None else seed)
+    n = len(days)
+    drift, volatility = rng.uniform(0.0001, 0.0006), rng.uniform(0.01, 0.025)
+    close = rng.uniform(20, 400) * np.exp(np.cumsum(drift + volatility * rng.standard_normal(n)))
+    open_ = np.concatenate(([close[0]], close[:-1])) * (1 + 0.003 * rng.standard_normal(n))
+    spread = np.abs(volatility * close * rng.standard_normal((2, n)))
+    bars = pd.DataFrame({
+        'timestamp': days.astype('int64') // 1_000_000,
+        'open': open_,
+        'high': np.maximum(open_, close) + spread[0],
+        'low': np.minimum(open_, close) - spread[1],
+        'close': close,
+        'volume': rng.lognormal(15, 0.5, n).round(),
+    })
+    keep = (days >= pd.Timestamp(from_date)) & (days <= pd.Timestamp(to_date))
+    return bars[keep].reset_index(drop=True)
+
+
+class FakePolygonServer:
+    """Local stand-in for the Polygon aggregates endpoint.
+
+    Serves synthetic_bars as /v2/aggs/ticker/{symbol}/range/1/day/{from}/{to}
+    pages (with next_url) after `latency` seconds per request, on a loop
+    thread of its own. Symbols in `missing` return no results.
+
+    Failures can be injected to exercise the client's retry path: the first
+    `failures` requests for every page answer `failure_status` (with a
+    Retry-After header when `retry_after` is set), and pages of symbols in
+    `malformed` answer with a truncated JSON body. Every request is logged
+    in `request_log` as ((symbol, cursor), status, monotonic time), and
+    `max_in_flight` records the most requests handled at once.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, page_size=5000, missing=(),
+                 failures=0, failure_status=429, retry_after=None, malformed=()):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.page_size = page_size
+        self.missing = {symbol.upper() for symbol in missing}
+        self.failures = failures
+        self.failure_status = failure_status
+        self.retry_after = retry_after
+        self.malformed = {symbol.upper() for symbol in malformed}
+        self.requests = 0
+        self.request_log = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._attempts = Counter()
+        self._loop = None
+        self._runner = None
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    async def _aggs(self, request):
+        self.requests += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            symbol, cursor = request.match_info['symbol'].upper(), int(request.query.get('cursor', 0))
+            response = self._page(request, symbol, cursor)
+        finally:
+            self.in_flight -= 1
+        self.request_log.append(((symbol, cursor), response.status, time.monotonic()))
+        return response
+
+    def _page(self, request, symbol, cursor):
+        self._attempts[symbol, cursor] += 1
+        if self._attempts[symbol, cursor] <= self.failures:
+            headers = {'Retry-After': str(self.retry_after)} if self.retry_after is not None else None
+            return web.json_response({'status': 'ERROR'}, status=self.failure_status, headers=headers)
+        if symbol in self.missing:
+            return web.json_response({'status': 'OK', 'resultsCount': 0, 'results': []})
+        if symbol in self.malformed:
+            return web.Response(text='{"status": "OK", "results": [{"t": ', content_type='application/json')
+        bars = synthetic_bars(symbol, request.match_info['from_date'], request.match_info['to_date'])
+        page = bars.iloc[cursor:cursor + self.page_size]
+        body = {
+            'status': 'OK',
+            'resultsCount': len(page),
+            'results': [{'t': int(row.timestamp), 'o': row.open, 'h': row.high, 'l': row.low,
+                         'c': row.close, 'v': row.volume} for row in page.itertuples()],
+        }
+        if cursor + self.page_size < len(bars):
+            body['next_url'] = f"{self.url}{request.path}?cursor={cursor + self.page_size}"
+        return web.json_response(body)
+
+    async def _start(self):
+        app = web.Application()
+        app.router.add_get('/v2/aggs/ticker/{symbol}/range/{multiplier}/{timespan}/{from_date}/{to_date}',
+                           self._aggs)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        self.port = self._runner.addresses[0][1]  # the real port when 0 was asked for
+
+    def start(self):
+        self._loop = asyncio.new_event_loop()
+        threading.Thread(target=self._loop.run_forever, name='fake-polygon', daemon=True).start()
+        asyncio.run_coroutine_threadsafe(self._start(), self._loop).result()
+        return self
+
+    def stop(self):
+        if self._loop is not None:
+            asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._loop = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def write_csv_source(directory, symbols, from_date=HISTORY_START, to_date=None):
+    # Files for CsvBarSource (BAR_SOURCE_DIR)
+    to_date = to_date or pd.Timestamp.now().strftime('%Y-%m-%d')
+    for symbol in symbols:
+        synthetic_bars(symbol, from_date, to_date).to_csv(
+            os.path.join(directory, f"{symbol.upper()}.csv"), index=False)
@@ -0,0 +1,48 @@
+import time
+from benchmarks.harness import time_call
+
+# Stage timings of train_model.main() on synthetic bars: bar ingestion,
+# feature preparation (cold and cached), the window store, tf.data input
+# throughput and a few optimizer steps -- everything except the 100-epoch
+# fit itself. Imports train_model (and TensorFlow), so call run_training
+# inside offline_environment.
+
+
+def _elapsed(fn):
+    started = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - started, result
+
+
+def run_training(symbols, batches=50, fit_steps=20, batch_size=32):
+    import train_model
+    from lstm_model import build_lstm_model
+    from feature_prep import prepare_features, load_features
+    from training_store import build_window_store, TRAINING_STORE_DIR
+
+    start, end, time_step = train_model.START_DATE, train_model.END_DATE, train_model.SEQUENCE_LENGTH
+    results = {}
+    seconds, _ = _elapsed(lambda: train_model.bar_store.refresh_many(symbols, start, end))
+    results['bar_ingest'] = {'wall_ms': seconds * 1000, 'symbols_per_s': len(symbols) / seconds}
+    seconds, paths = _elapsed(lambda: prepare_features(symbols, start, end))
+    results['prepare_features[cold]'] = {'wall_ms': seconds * 1000, 'symbols_per_s': len(paths) / seconds}
+    results['prepare_features[cached]'] = time_call(lambda: prepare_features(symbols, start, end), repeat=3, warmup=0)
+    seconds, (store, _, _) = _elapsed(lambda: build_window_store(
+        TRAINING_STORE_DIR, list(paths), lambda symbol: load_features(paths[symbol])))
+    results['build_window_store'] = {'wall_ms': seconds * 1000}
+
+    train_index, _ = store.window_index(time_step, train_model.TEST_SIZE)
+    dataset = store.dataset(train_index, time_step, batch_size=batch_size, shuffle=True,
+                            seed=train_model.RANDOM_STATE)
+    iterator = iter(dataset.repeat())
+    next(iterator)  # pipeline start-up
+    seconds, _ = _elapsed(lambda: [next(iterator) for _ in range(batches)])
+    results['input_pipeline'] = {'batch_ms': seconds * 1000 / batches,
+                                 'windows_per_s': batches * batch_size / seconds}
+
+    model = build_lstm_model((time_step, len(store.columns)))
+    model.fit(dataset.take(1), epochs=1, verbose=0)  # graph tracing
+    seconds, _ = _elapsed(lambda: model.fit(dataset.repeat().take(fit_steps), epochs=1, verbose=0))
+    results['fit'] = {'step_ms': seconds * 1000 / fit_steps, 'windows_per_s': fit_steps * batch_size / seconds}
+    results['fit']['train_windows'] = int(len(train_index))
+    return results
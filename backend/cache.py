@@ -0,0 +1,215 @@
+import os
+import time
+import pickle
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+PREDICTION_CACHE_SIZE = int(os.getenv('PREDICTION_CACHE_SIZE', '1024'))
+PREDICTION_CACHE_TTL = float(os.getenv('PREDICTION_CACHE_TTL', '900'))
+# Optional directory shared by all gunicorn workers; unset keeps the cache
+# per process
+PREDICTION_CACHE_DIR = os.getenv('PREDICTION_CACHE_DIR')
+DISK_PRUNE_EVERY = 256  # sets between sweeps of expired files
+# Written by precompute.py, read by /api/predict
+PRECOMPUTE_DIR = os.getenv('PRECOMPUTE_DIR', os.path.join('data', 'precomputed'))
+
+
+class LRUTTLCache:
+    """Bounded in-memory LRU cache whose entries also expire after `ttl`.
+
+    With `disk_dir` set, entries are written through to pickle files there
+    and memory misses fall back to disk, so processes sharing the directory
+    reuse each other's results.
+    """
+
+    def __init__(self, name, max_entries=PREDICTION_CACHE_SIZE, ttl=PREDICTION_CACHE_TTL,
+                 disk_dir=None):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.disk_dir = os.path.join(disk_dir, name) if disk_dir else None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._sets = 0
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    def _disk_path(self, key):
+        digest = hashlib.sha1(repr(key).encode()).hexdigest()
+        return os.path.join(self.disk_dir, f"{digest}.pkl")
+
+    def _read_disk(self, key):
+        path = self._disk_path(key)
+        try:
+            with open(path, 'rb') as f:
+                stored_key, expires_at, value = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable {self.name} cache entry: {str(e)}")
+            return None
+        if stored_key != key:
+            return None
+        if expires_at <= time.time():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        return expires_at, value
+
+    def _write_disk(self, key, expires_at, value):
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                pickle.dump((key, expires_at, value), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.warning(f"Could not write {self.name} cache entry: {str(e)}")
+
+    def _prune_disk(self):
+        # Entries are written once and expire `ttl` after their mtime
+        cutoff = time.time() - self.ttl
+        for entry in os.scandir(self.disk_dir):
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+            except OSError:
+                pass
+
+    def _store(self, key, expires_at, value):
+        # Caller holds the lock
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._entries[key]
+                self.expirations += 1
+        if self.disk_dir:
+            entry = self._read_disk(key)
+            if entry is not None:
+                with self._lock:
+                    self._store(key, *entry)
+                    self.disk_hits += 1
+                return entry[1]
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key, value):
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._store(key, expires_at, value)
+            self._sets += 1
+            prune = self._sets % DISK_PRUNE_EVERY == 0
+        if self.disk_dir:
+            self._write_disk(key, expires_at, value)
+            if prune:
+                self._prune_disk()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+                'shared_dir': self.disk_dir,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'hit_rate': (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            }
+
+
+class PrecomputedStore:
+    """Finished response bodies written ahead of time, one file per symbol.
+
+    Entries carry the cache key they were computed for (symbol, last bar,
+    model version) and are only returned for that exact key, so a new bar or
+    model makes them stale without any expiry bookkeeping.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.hits = 0
+        self.stale = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, symbol):
+        return os.path.join(self.root, f"{symbol.upper()}.pkl")
+
+    def get(self, key):
+        try:
+            with open(self._path(key[0]), 'rb') as f:
+                stored_key, body = pickle.load(f)
+        except FileNotFoundError:
+            stored_key, body = None, None
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable precomputed entry for {key[0]}: {str(e)}")
+            stored_key, body = None, None
+        with self._lock:
+            if stored_key == key:
+                self.hits += 1
+                return body
+            if stored_key is None:
+                self.misses += 1
+            else:
+                self.stale += 1
+        return None
+
+    def set(self, key, body):
+        path = self._path(key[0])
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump((key, body), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.stale + self.misses
+            return {
+                'dir': self.root,
+                'hits': self.hits,
+                'stale': self.stale,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+
+def file_version(path):
+    # Short content hash identifying a model artifact in cache keys
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:12]
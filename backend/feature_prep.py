@@ -0,0 +1,126 @@
+import os
+import glob
+import json
+import pickle
+import hashlib
+import logging
+import multiprocessing
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+import indicators
+from indicators import indicator_frame, SELECTED_FEATURES
+from bar_store import BarStore, BAR_STORE_DIR, make_bar_source, sized_dir
+
+logger = logging.getLogger(__name__)
+
+FEATURE_CACHE_DIR = sized_dir(os.getenv('FEATURE_CACHE_DIR', os.path.join('data', 'features')))
+FEATURE_PREP_WORKERS = int(os.getenv('FEATURE_PREP_WORKERS', str(os.cpu_count() or 1)))
+
+
+_bar_stores = {}  # per process, so workers reuse one source (and HTTP pool)
+
+
+def _bar_store(root):
+    if root not in _bar_stores:
+        _bar_stores[root] = BarStore(root, make_bar_source())
+    return _bar_stores[root]
+
+
+def feature_set_hash(features=SELECTED_FEATURES):
+    # Changes with the selected features or with the indicator code itself,
+    # so editing indicators.py invalidates every cached matrix
+    digest = hashlib.sha1(json.dumps(list(features)).encode())
+    with open(indicators.__file__, 'rb') as f:
+        digest.update(f.read())
+    return digest.hexdigest()[:12]
+
+
+def cache_path(cache_dir, symbol, from_date, to_date, feature_hash):
+    return os.path.join(cache_dir, f"{symbol.upper()}_{from_date}_{to_date}_{feature_hash}.pkl")
+
+
+def _bars_digest(bars):
+    # Guards against bars revised in the store since the entry was written
+    return hashlib.sha1(pd.util.hash_pandas_object(bars, index=False).values.tobytes()).hexdigest()
+
+
+def _read_entry(path):
+    try:
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable feature cache entry {path}: {str(e)}")
+        return None
+
+
+def prepare_symbol(symbol, from_date, to_date, cache_dir, feature_hash, bar_store_dir=sized_dir(BAR_STORE_DIR),
+                   compute=True):
+    # Runs in a worker process: load bars, compute indicators and fill NaNs,
+    # unless a cache entry for the same bars and feature set exists.
+    # Returns (symbol, cache path or None, status); with compute=False a
+    # cache miss is returned as (symbol, None, 'pending').
+    try:
+        bars = _bar_store(bar_store_dir).get_bars(symbol, from_date, to_date)
+        if bars.empty:
+            return symbol, None, 'no bars returned'
+        path = cache_path(cache_dir, symbol, from_date, to_date, feature_hash)
+        digest = _bars_digest(bars)
+        entry = _read_entry(path)
+        if entry is not None and entry[0] == digest:
+            return symbol, path, 'cached'
+        if not compute:
+            return symbol, None, 'pending'
+
+        features = indicator_frame(bars, SELECTED_FEATURES)
+        features = features.fillna(method='ffill').fillna(method='bfill')
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump((digest, features), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        # Entries for an older feature set of the same range are now stale
+        for stale in glob.glob(cache_path(cache_dir, symbol, from_date, to_date, '*')):
+            if stale != path:
+                os.remove(stale)
+        return symbol, path, 'computed'
+    except Exception as e:
+        return symbol, None, f"failed: {str(e)}"
+
+
+def prepare_features(symbols, from_date, to_date, cache_dir=FEATURE_CACHE_DIR, workers=FEATURE_PREP_WORKERS):
+    # Prepares every symbol in a process pool; returns {symbol: cache path}
+    # for the symbols that produced features, in the order given
+    os.makedirs(cache_dir, exist_ok=True)
+    feature_hash = feature_set_hash()
+    args = (repeat(from_date), repeat(to_date), repeat(cache_dir), repeat(feature_hash))
+    # Cache hits are found here, so a rerun starts no workers
+    results = {symbol: result for symbol, *result in
+               map(prepare_symbol, symbols, *args, repeat(sized_dir(BAR_STORE_DIR)), repeat(False))}
+    pending = [symbol for symbol, (_, status) in results.items() if status == 'pending']
+    if workers > 1 and len(pending) > 1:
+        # Spawned, not forked: the caller may have TensorFlow loaded and
+        # the Polygon client's event-loop thread running, neither of which
+        # survives a fork. Workers open their own BarStore.
+        with ProcessPoolExecutor(max_workers=min(workers, len(pending)),
+                                 mp_context=multiprocessing.get_context('spawn')) as pool:
+            fresh = list(pool.map(prepare_symbol, pending, *args))
+    else:
+        fresh = list(map(prepare_symbol, pending, *args))
+    results.update((symbol, result) for symbol, *result in fresh)
+
+    paths, computed = {}, 0
+    for symbol, (path, status) in results.items():
+        if path is None:
+            logger.error(f"Error preparing features for {symbol}: {status}")
+            continue
+        paths[symbol] = path
+        computed += status == 'computed'
+    logger.info(f"Features ready for {len(paths)} symbols ({computed} computed, "
+                f"{len(paths) - computed} from cache, feature set {feature_hash})")
+    return paths
+
+
+def load_features(path):
+    return _read_entry(path)[1]
@@ -0,0 +1,245 @@
+import os
+import logging
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+import numpy as np
+from inference import NumpyLSTMBackend
+from indicator_state import FeatureStreamStore, FEATURE_REANCHOR_BARS
+
+# Incremental inference: per-symbol LSTM (h, c) states are kept after a
+# window has been run, and a window that is the previous one shifted by one
+# new bar advances every layer by a single timestep instead of replaying all
+# SEQUENCE_LENGTH steps. A window whose last row alone changed (a revised
+# forming bar) redoes just that step from the states kept before it.
+#
+# This is an approximation of the full-window path used by predict(): the
+# model was trained on windows starting from a zero state, while a carried
+# state still holds (exponentially decaying) information from bars that have
+# left the window. Re-anchoring bounds that drift: every
+# INCREMENTAL_REANCHOR_STEPS single-step updates the symbol's window is
+# replayed from a zero state, exactly like model.predict. Call reanchor()
+# (or restart the process) to force it, e.g. after retraining or refitting
+# the scalers. `python incremental_lstm.py` measures the drift on stored bars.
+
+logger = logging.getLogger(__name__)
+
+INCREMENTAL_REANCHOR_STEPS = int(os.getenv('INCREMENTAL_REANCHOR_STEPS', '20'))
+# Consecutive windows from a symbol's feature stream overlap exactly (ADI
+# and OBV stay anchored at the stream's origin, see indicator_state.py);
+# they only diverge when the stream is rebuilt or re-anchored. Differences
+# up to this (scaled) tolerance still count as "one new bar"; anything
+# larger triggers a full replay.
+INCREMENTAL_INPUT_TOLERANCE = float(os.getenv('INCREMENTAL_INPUT_TOLERANCE', '1e-3'))
+# Threads running incremental steps for requests with a latency budget
+INCREMENTAL_WORKERS = int(os.getenv('INCREMENTAL_WORKERS', '4'))
+
+
+class IncrementalLSTM:
+    """Per-symbol stateful inference on top of a NumpyLSTMBackend."""
+
+    def __init__(self, backend, reanchor_every=INCREMENTAL_REANCHOR_STEPS,
+                 input_tolerance=INCREMENTAL_INPUT_TOLERANCE):
+        if not isinstance(backend, NumpyLSTMBackend):
+            raise ValueError("Incremental inference needs the NumPy backend")
+        kinds = [layer['type'] for layer in backend.layers]
+        if 'lstm' not in kinds or 'lstm' in kinds[kinds.index('dense'):]:
+            raise ValueError("Incremental inference expects stacked LSTM layers followed by dense layers")
+        self.backend = backend
+        self.lstm_layers = [layer for layer in backend.layers if layer['type'] == 'lstm']
+        self.reanchor_every = reanchor_every
+        self.input_tolerance = input_tolerance
+        # symbol -> (window, [(h, c) per LSTM layer] before and after the
+        # last timestep, output, steps since replay)
+        self.states = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pid = None
+        self.full_runs = 0
+        self.steps = 0
+        self.reuses = 0
+        self.revisions = 0
+        self.timeouts = 0
+
+    def _symbol_lock(self, symbol):
+        with self._lock:
+            return self._locks.setdefault(symbol, threading.Lock())
+
+    def _full(self, window):
+        # All but the last timestep, then that one as a step, so the states
+        # before it are kept for a revised last bar
+        x = window[np.newaxis, :-1]
+        before = []
+        for layer in self.lstm_layers:
+            outputs, h, c = self.backend.run_lstm(layer, x)
+            before.append((h, c))
+            x = outputs if layer['return_sequences'] else h
+        return (before, *self._step(before, window[-1]))
+
+    def _step(self, states, row):
+        # The new timestep's hidden state of each layer is the next layer's
+        # input at that timestep
+        x = row[np.newaxis]
+        advanced = []
+        for layer, (h, c) in zip(self.lstm_layers, states):
+            h, c = self.backend.lstm_step(layer, x @ layer['kernel'] + layer['bias'], h, c)
+            advanced.append((h, c))
+            x = h
+        return advanced, self.backend.head(x)
+
+    def _overlap(self, previous, window):
+        diff = np.max(np.abs(previous[1:] - window[:-1]))
+        return diff <= self.input_tolerance
+
+    def _revised(self, previous, window):
+        # The same bars with only the last (forming) one changed
+        diff = np.max(np.abs(previous[:-1] - window[:-1]))
+        return diff <= self.input_tolerance
+
+    def predict(self, symbol, sequence):
+        # `sequence` is a (1, time, features) window as built by
+        # latest_sequence; returns the (1, outputs) model output
+        window = np.asarray(sequence, dtype=np.float32)[0]
+        with self._symbol_lock(symbol):
+            entry = self.states.get(symbol)
+            if entry is not None and entry[0].shape == window.shape:
+                previous, before, states, output, steps = entry
+                if np.array_equal(previous, window):
+                    self.reuses += 1
+                    return output
+                if self._revised(previous, window):
+                    # Redoing the last step adds no drift
+                    states, output = self._step(before, window[-1])
+                    self.states[symbol] = (window, before, states, output, steps)
+                    self.revisions += 1
+                    return output
+                if steps < self.reanchor_every and self._overlap(previous, window):
+                    before = states
+                    states, output = self._step(before, window[-1])
+                    self.states[symbol] = (window, before, states, output, steps + 1)
+                    self.steps += 1
+                    return output
+            before, states, output = self._full(window)
+            self.states[symbol] = (window, before, states, output, 0)
+            self.full_runs += 1
+            return output
+
+    def predict_many(self, symbols, batch, timeout=None):
+        # One output row per symbol. With a timeout the steps run on a pool
+        # thread so the caller can give up at its latency budget
+        # (TimeoutError); a step already running still completes and
+        # updates the symbol's state for the next request.
+        if timeout is None:
+            return self._predict_many(symbols, batch)
+        future = self._executor().submit(self._predict_many, symbols, batch)
+        try:
+            return future.result(timeout=timeout)
+        except TimeoutError:
+            future.cancel()
+            with self._lock:
+                self.timeouts += 1
+            raise
+
+    def _predict_many(self, symbols, batch):
+        return np.concatenate([self.predict(symbol, batch[i:i + 1]) for i, symbol in enumerate(symbols)])
+
+    def _executor(self):
+        # Created lazily and per process, like the inference scheduler's
+        # worker: pool threads started before gunicorn forks do not survive
+        with self._lock:
+            if self._pool is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._pool = ThreadPoolExecutor(INCREMENTAL_WORKERS, thread_name_prefix='incremental')
+            return self._pool
+
+    def close(self):
+        # Steps already submitted finish on their threads
+        with self._lock:
+            if self._pool is not None and self._pid == os.getpid():
+                self._pool.shutdown(wait=False)
+            self._pool = None
+
+    def reanchor(self, symbol=None):
+        # Drops carried state so the next request replays its full window
+        with self._lock:
+            if symbol is None:
+                self.states.clear()
+            else:
+                self.states.pop(symbol, None)
+
+    def stats(self):
+        return {
+            'symbols': len(self.states),
+            'reanchor_every': self.reanchor_every,
+            'input_tolerance': self.input_tolerance,
+            'full_runs': self.full_runs,
+            'incremental_steps': self.steps,
+            'reuses': self.reuses,
+            'revisions': self.revisions,
+            'timeouts': self.timeouts,
+        }
+
+
+def validate(symbol, steps, history, reanchor_every, input_tolerance, reanchor_bars=FEATURE_REANCHOR_BARS):
+    # Replays the last `steps` bars one at a time through the serving
+    # pipeline (a `history`-bar window ending at each bar, like the sliding
+    # 365-day fetch, fed through a feature stream like predict()) and
+    # compares incremental outputs with the full window
+    import app
+    import pandas as pd
+    logging.getLogger('app').setLevel(logging.WARNING)
+    logging.getLogger('indicator_state').setLevel(logging.WARNING)
+    # ~252 trading days per 365 calendar days, plus slack for holidays
+    days = int((history + steps) * 1.6)
+    stock_data = app.bar_store.get_bars(symbol, (pd.Timestamp.now() - pd.Timedelta(days=days)).strftime('%Y-%m-%d'),
+                                        pd.Timestamp.now().strftime('%Y-%m-%d'))
+    if len(stock_data) < history + steps:
+        raise SystemExit(f"Need at least {history + steps} bars for {symbol}")
+    served = app.serving()
+    if served is None:
+        raise SystemExit("No model loaded")
+    incremental = IncrementalLSTM(served.model if isinstance(served.model, NumpyLSTMBackend)
+                                  else NumpyLSTMBackend(os.path.join(os.path.dirname(served.model.path), 'final_model.npz')),
+                                  reanchor_every, input_tolerance)
+    diffs = []
+    with tempfile.TemporaryDirectory() as state_dir:
+        streams = FeatureStreamStore(state_dir, served.sequence_length + 2, reanchor_bars)
+        for end in range(len(stock_data) - steps + 1, len(stock_data) + 1):
+            bars = stock_data.iloc[end - history:end].reset_index(drop=True)
+            scaled = app.preprocess_data(streams.features(symbol, bars))
+            sequence = app.latest_sequence(scaled, served.sequence_length)
+            full = app.inverse_transform_close(incremental.backend.predict(sequence)[:, 0])[0]
+            stepped = app.inverse_transform_close(incremental.predict(symbol, sequence)[:, 0])[0]
+            diffs.append(abs(stepped - full))
+    diffs = np.array(diffs)
+    return {
+        'max_abs_price_diff': float(diffs.max()),
+        'mean_abs_price_diff': float(diffs.mean()),
+        'p95_abs_price_diff': float(np.percentile(diffs, 95)),
+        **incremental.stats(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare incremental LSTM inference with full-window predictions")
+    parser.add_argument('symbols', nargs='+')
+    parser.add_argument('--steps', type=int, default=100, help="bars to replay one at a time")
+    parser.add_argument('--history', type=int, default=250, help="bars per simulated fetch")
+    parser.add_argument('--reanchor-every', type=int, default=INCREMENTAL_REANCHOR_STEPS)
+    parser.add_argument('--input-tolerance', type=float, default=INCREMENTAL_INPUT_TOLERANCE)
+    parser.add_argument('--reanchor-bars', type=int, default=FEATURE_REANCHOR_BARS,
+                        help="feature stream ADI/OBV re-anchoring interval (FEATURE_REANCHOR_BARS)")
+    args = parser.parse_args()
+
+    for symbol in args.symbols:
+        report = validate(symbol, args.steps, args.history, args.reanchor_every, args.input_tolerance,
+                          args.reanchor_bars)
+        logger.info(f"{symbol}: " + ", ".join(f"{name}={value:.6g}" if isinstance(value, float) else f"{name}={value}"
+                                              for name, value in report.items()))
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,390 @@
+import os
+import math
+import logging
+import copy
+import threading
+from collections import deque
+import pickle
+import numpy as np
+import pandas as pd
+from indicators import (
+    SELECTED_FEATURES, SMA_FAST, SMA_SLOW, MACD_FAST, MACD_SLOW, MACD_SIGN,
+    RSI_WINDOW, STOCH_WINDOW, STOCH_SMOOTH, TSI_SLOW, TSI_FAST, UO_WINDOWS,
+    UO_WEIGHTS, ATR_WINDOW, BB_WINDOW, BB_DEV, VWAP_WINDOW, MFI_WINDOW, EOM_WINDOW,
+)
+
+# Streaming counterpart of indicators.compute_indicators: one bar in, one
+# SELECTED_FEATURES row out, in O(1) per bar. Rows match the vectorized
+# engine (and therefore ta) run over the same bar history.
+
+logger = logging.getLogger(__name__)
+
+FEATURE_STATE_DIR = os.getenv('FEATURE_STATE_DIR', os.path.join('data', 'feature_state'))
+
+NAN = float('nan')
+# Bars a stream's ADI/OBV anchor may trail the first bar of a request's
+# history before the stream is rebuilt from that history, which bounds the
+# level of both sums (and costs incremental inference one full replay)
+FEATURE_REANCHOR_BARS = int(os.getenv('FEATURE_REANCHOR_BARS', '250'))
+
+
+def _div(a, b):
+    # IEEE division like NumPy: x/0 -> +-inf, 0/0 -> nan
+    if b == 0:
+        if a == 0 or math.isnan(a):
+            return NAN
+        return math.copysign(math.inf, a) * math.copysign(1.0, b)
+    return a / b
+
+
+def _valid(x):
+    return not (math.isnan(x) or math.isinf(x))
+
+
+def _mean_valid(values):
+    valid = [x for x in values if _valid(x)]
+    return sum(valid) / len(valid) if valid else NAN
+
+
+def _sum_valid(values):
+    return sum(x for x in values if _valid(x))
+
+
+class _Ema:
+    __slots__ = ('alpha', 'value')
+
+    def __init__(self, alpha):
+        self.alpha = alpha
+        self.value = NAN
+
+    def update(self, x):
+        # Leading NaNs are skipped; the average starts at the first value
+        if math.isnan(x):
+            return self.value
+        if math.isnan(self.value):
+            self.value = x
+        else:
+            self.value = self.alpha * x + (1.0 - self.alpha) * self.value
+        return self.value
+
+
+class _Fill:
+    # ta's fillna: inf/NaN take the last valid value, else a constant
+    __slots__ = ('default', 'last')
+
+    def __init__(self, default):
+        self.default = default
+        self.last = NAN
+
+    def __call__(self, x):
+        if _valid(x):
+            self.last = x
+            return x
+        return self.default if math.isnan(self.last) else self.last
+
+
+class IndicatorState:
+    """Running accumulators for every indicator in SELECTED_FEATURES."""
+
+    def __init__(self):
+        self.bars = 0
+        self.prev_high = NAN
+        self.prev_low = NAN
+        self.prev_close = NAN
+        self.prev_typical = NAN
+
+        self.closes = deque(maxlen=max(SMA_SLOW, BB_WINDOW))
+        self.ema_fast = _Ema(2.0 / (MACD_FAST + 1))
+        self.ema_slow = _Ema(2.0 / (MACD_SLOW + 1))
+        self.ema_sign = _Ema(2.0 / (MACD_SIGN + 1))
+        self.rsi_up = _Ema(1.0 / RSI_WINDOW)
+        self.rsi_down = _Ema(1.0 / RSI_WINDOW)
+        self.lows = deque(maxlen=STOCH_WINDOW)
+        self.highs = deque(maxlen=STOCH_WINDOW)
+        self.stoch_k = deque(maxlen=STOCH_SMOOTH)
+        self.tsi = [_Ema(2.0 / (TSI_SLOW + 1)), _Ema(2.0 / (TSI_FAST + 1)),
+                    _Ema(2.0 / (TSI_SLOW + 1)), _Ema(2.0 / (TSI_FAST + 1))]
+        self.buying_pressure = deque(maxlen=max(UO_WINDOWS))
+        self.true_range = deque(maxlen=max(UO_WINDOWS))
+        self.atr_seed = []
+        self.atr = 0.0
+        self.adi = 0.0
+        self.obv = 0.0
+        self.price_volume = deque(maxlen=VWAP_WINDOW)
+        self.volumes = deque(maxlen=VWAP_WINDOW)
+        self.money_flow = deque(maxlen=MFI_WINDOW)
+        self.emv = deque(maxlen=EOM_WINDOW)
+
+        self.fill = {
+            'trend_macd': _Fill(0), 'trend_macd_signal': _Fill(0), 'trend_macd_diff': _Fill(0),
+            'momentum_rsi': _Fill(50), 'momentum_stoch': _Fill(50),
+            'momentum_stoch_signal': _Fill(50), 'momentum_tsi': _Fill(0), 'momentum_uo': _Fill(50),
+            'volatility_atr': _Fill(0), 'volatility_bbm': _Fill(NAN), 'volatility_bbh': _Fill(NAN),
+            'volatility_bbl': _Fill(NAN), 'volume_adi': _Fill(0), 'volume_obv': _Fill(0),
+            'volume_vwap': _Fill(0), 'volume_mfi': _Fill(50), 'volume_em': _Fill(0),
+            'volume_sma_em': _Fill(0),
+        }
+
+    def update(self, open_, high, low, close, volume):
+        open_, high, low, close, volume = (float(open_), float(high), float(low),
+                                           float(close), float(volume))
+        prev_close = self.prev_close
+        fill = self.fill
+        out = {'open': open_, 'high': high, 'low': low, 'close': close}
+
+        # SMAs
+        self.closes.append(close)
+        closes = list(self.closes)
+        out['trend_sma_fast'] = _mean_valid(closes[-SMA_FAST:])
+        out['trend_sma_slow'] = _mean_valid(closes[-SMA_SLOW:])
+
+        # MACD
+        macd = self.ema_fast.update(close) - self.ema_slow.update(close)
+        signal = self.ema_sign.update(macd)
+        out['trend_macd'] = fill['trend_macd'](macd)
+        out['trend_macd_signal'] = fill['trend_macd_signal'](signal)
+        out['trend_macd_diff'] = fill['trend_macd_diff'](macd - signal)
+
+        # RSI
+        diff = close - prev_close
+        emaup = self.rsi_up.update(diff if diff > 0 else 0.0)
+        emadn = self.rsi_down.update(-diff if diff < 0 else 0.0)
+        rsi = 100.0 if emadn == 0 else 100.0 - 100.0 / (1.0 + _div(emaup, emadn))
+        out['momentum_rsi'] = fill['momentum_rsi'](rsi)
+
+        # Stochastic oscillator
+        self.lows.append(low)
+        self.highs.append(high)
+        smin, smax = min(self.lows), max(self.highs)
+        stoch_k = _div(100.0 * (close - smin), smax - smin)
+        self.stoch_k.append(stoch_k)
+        out['momentum_stoch'] = fill['momentum_stoch'](stoch_k)
+        out['momentum_stoch_signal'] = fill['momentum_stoch_signal'](_mean_valid(self.stoch_k))
+
+        # TSI
+        smoothed = self.tsi[1].update(self.tsi[0].update(diff))
+        smoothed_abs = self.tsi[3].update(self.tsi[2].update(abs(diff)))
+        out['momentum_tsi'] = fill['momentum_tsi'](_div(100.0 * smoothed, smoothed_abs))
+
+        # Ultimate oscillator
+        true_range = max(x for x in (high - low, abs(high - prev_close), abs(low - prev_close))
+                         if not math.isnan(x))
+        self.true_range.append(true_range)
+        self.buying_pressure.append(close - min(low, prev_close) if not math.isnan(prev_close) else NAN)
+        bp, tr = list(self.buying_pressure), list(self.true_range)
+        uo = 0
+        for window, weight in zip(UO_WINDOWS, UO_WEIGHTS):
+            uo = uo + weight * _div(_sum_valid(bp[-window:]), _sum_valid(tr[-window:]))
+        out['momentum_uo'] = fill['momentum_uo'](100.0 * uo / sum(UO_WEIGHTS))
+
+        # ATR (Wilder smoothing seeded with the mean of the first window)
+        if self.bars < ATR_WINDOW:
+            self.atr_seed.append(true_range)
+            if len(self.atr_seed) == ATR_WINDOW:
+                self.atr = float(np.mean(self.atr_seed))
+                self.atr_seed = []
+        else:
+            alpha = 1.0 / ATR_WINDOW
+            self.atr = alpha * true_range + (1.0 - alpha) * self.atr
+        out['volatility_atr'] = fill['volatility_atr'](self.atr)
+
+        # Bollinger bands
+        window = closes[-BB_WINDOW:]
+        mavg = _mean_valid(window)
+        mstd = math.sqrt(sum((x - mavg) ** 2 for x in window) / len(window))
+        out['volatility_bbm'] = fill['volatility_bbm'](mavg)
+        out['volatility_bbh'] = fill['volatility_bbh'](mavg + BB_DEV * mstd)
+        out['volatility_bbl'] = fill['volatility_bbl'](mavg - BB_DEV * mstd)
+
+        # ADI and OBV (cumulative from the first bar this state saw)
+        clv = _div((close - low) - (high - close), high - low)
+        self.adi += (0.0 if math.isnan(clv) else clv) * volume
+        self.obv += -volume if close < prev_close else volume
+        out['volume_adi'] = fill['volume_adi'](self.adi)
+        out['volume_obv'] = fill['volume_obv'](self.obv)
+
+        # VWAP
+        typical = (high + low + close) / 3.0
+        self.price_volume.append(typical * volume)
+        self.volumes.append(volume)
+        vwap = _div(_sum_valid(self.price_volume), _sum_valid(self.volumes))
+        out['volume_vwap'] = fill['volume_vwap'](vwap)
+
+        # MFI
+        up_down = 1 if typical > self.prev_typical else (-1 if typical < self.prev_typical else 0)
+        self.money_flow.append(typical * volume * up_down)
+        positive = sum(x if x >= 0.0 else 0.0 for x in self.money_flow)
+        negative = abs(sum(x if x < 0.0 else 0.0 for x in self.money_flow))
+        out['volume_mfi'] = fill['volume_mfi'](100.0 - 100.0 / (1.0 + _div(positive, negative)))
+
+        # Ease of movement
+        emv = _div(((high - self.prev_high) + (low - self.prev_low)) * (high - low), 2 * volume)
+        emv *= 100000000
+        self.emv.append(emv)
+        out['volume_em'] = fill['volume_em'](emv)
+        out['volume_sma_em'] = fill['volume_sma_em'](_mean_valid(self.emv))
+
+        self.prev_high, self.prev_low, self.prev_close = high, low, close
+        self.prev_typical = typical
+        self.bars += 1
+        return np.array([out[feature] for feature in SELECTED_FEATURES])
+
+
+def _bar_values(bars):
+    timestamps = bars['timestamp'].values.astype('datetime64[ms]').astype(np.int64)
+    values = bars[['open', 'high', 'low', 'close', 'volume']].to_numpy(dtype=np.float64)
+    return timestamps, values
+
+
+def iter_feature_frames(frames):
+    # Feature rows for a long history given as consecutive bar DataFrames,
+    # one output frame per input frame, with the memory of one chunk: the
+    # rows equal indicator_frame over the whole history, NaN-filled like
+    # feature_prep (forward across chunks, backward within the first)
+    state = IndicatorState()
+    last = None
+    for bars in frames:
+        _, values = _bar_values(bars)
+        rows = np.array([state.update(*bar) for bar in values]).reshape(len(values), len(SELECTED_FEATURES))
+        features = pd.DataFrame(rows, index=bars.index, columns=SELECTED_FEATURES)
+        if last is None:
+            features = features.fillna(method='ffill').fillna(method='bfill')
+        else:
+            features = pd.concat([last, features]).fillna(method='ffill').iloc[1:]
+        if len(features):
+            last = features.iloc[-1:]
+        yield features
+
+
+class FeatureStream:
+    """Warm feature window for one symbol.
+
+    Keeps the last `window` feature rows and advances with each new bar.
+    ADI and OBV are cumulative sums anchored at the first bar the stream was
+    built from (`origin`), not at the first bar of each request's history:
+    a history window that slides with the calendar would otherwise shift
+    every past row of both columns daily. Rows therefore only change when
+    the stream is rebuilt (see FeatureStreamStore).
+
+    The state from before the last bar is kept as well: the bar store
+    refetches from the last stored bar, so the forming bar is revised on
+    most refreshes, and a revision is undone and reapplied in O(1).
+    """
+
+    # Also the default for streams pickled before it was kept
+    before_last = None
+
+    def __init__(self, window):
+        self.state = IndicatorState()
+        self.window = window
+        self.rows = deque(maxlen=window)
+        self.origin = None
+        self.last_timestamp = None
+        self.last_bar = None
+        # (state, last_timestamp, last_bar) before the last bar
+        self.before_last = None
+
+    def append(self, timestamp, bar):
+        self.rows.append(self.state.update(*bar))
+        if self.origin is None:
+            self.origin = timestamp
+        self.last_timestamp = timestamp
+        self.last_bar = tuple(bar)
+
+    def extend(self, timestamps, values):
+        if len(values) == 0:
+            return
+        for timestamp, bar in zip(timestamps[:-1], values[:-1]):
+            self.append(int(timestamp), bar)
+        self.before_last = (copy.deepcopy(self.state), self.last_timestamp, self.last_bar)
+        self.append(int(timestamps[-1]), values[-1])
+
+    @classmethod
+    def from_bars(cls, bars, window):
+        stream = cls(window)
+        stream.extend(*_bar_values(bars))
+        return stream
+
+    def sync(self, bars):
+        # Append bars newer than the last one seen, first replacing the last
+        # one if it was revised. Returns False when the stream cannot follow
+        # (a gap, or a change before the last bar) and has to be rebuilt.
+        if self.last_timestamp is None or len(bars) == 0:
+            return False
+        timestamps, values = _bar_values(bars)
+        pos = int(np.searchsorted(timestamps, self.last_timestamp))
+        if pos == len(timestamps) or timestamps[pos] != self.last_timestamp:
+            return False
+        if tuple(values[pos]) != self.last_bar:
+            if self.before_last is None or (pos > 0 and tuple(values[pos - 1]) != self.before_last[2]):
+                return False
+            self.state, self.last_timestamp, self.last_bar = self.before_last
+            self.before_last = None
+            self.rows.pop()
+            pos -= 1
+        self.extend(timestamps[pos + 1:], values[pos + 1:])
+        return True
+
+    def frame(self, bars):
+        # Last feature rows for `bars`; equal to add_technical_indicators
+        # over the bars since `origin`
+        return pd.DataFrame(np.array(self.rows), index=bars.index[-len(self.rows):], columns=SELECTED_FEATURES)
+
+
+class FeatureStreamStore:
+    # Per-symbol FeatureStreams, kept in memory and pickled to disk so
+    # a restarted worker resumes from the last state instead of a full pass
+    def __init__(self, root, window, reanchor_bars=FEATURE_REANCHOR_BARS):
+        self.root = root
+        self.window = window
+        self.reanchor_bars = reanchor_bars
+        self.streams = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def _symbol_lock(self, symbol):
+        with self._lock:
+            return self._locks.setdefault(symbol, threading.Lock())
+
+    def _path(self, symbol):
+        return os.path.join(self.root, f"{symbol.upper()}.pkl")
+
+    def _load(self, symbol, window):
+        path = self._path(symbol)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'rb') as f:
+                stream = pickle.load(f)
+            return stream if stream.window >= window else None
+        except Exception as e:
+            logger.warning(f"Discarding unreadable feature state for {symbol}: {str(e)}")
+            return None
+
+    def _save(self, symbol, stream):
+        path = self._path(symbol)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(stream, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    def features(self, symbol, bars, window=None):
+        # `window` (default self.window) is the fewest rows wanted; a stream
+        # kept for a longer window, e.g. of the previous model, still serves
+        window = window or self.window
+        with self._symbol_lock(symbol):
+            stream = previous = self.streams.get(symbol) or self._load(symbol, window)
+            if stream is not None and stream.window < window:
+                stream = None
+            last = (stream.last_timestamp, stream.last_bar) if stream is not None else None
+            if stream is None or not stream.sync(bars):
+                logger.info(f"Rebuilding feature state for {symbol} from {len(bars)} bars")
+                stream = FeatureStream.from_bars(bars, window)
+            elif stream.state.bars - len(bars) > self.reanchor_bars:
+                logger.info(f"Re-anchoring feature state for {symbol} to {len(bars)} bars")
+                stream = FeatureStream.from_bars(bars, window)
+            self.streams[symbol] = stream
+            if stream is not previous or (stream.last_timestamp, stream.last_bar) != last:
+                self._save(symbol, stream)
+            return stream.frame(bars)
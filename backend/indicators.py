@@ -0,0 +1,288 @@
+import warnings
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy.signal import lfilter
+
+# NumPy re-implementation of the subset of `ta` indicators the model uses.
+# Parameters and NaN handling follow ta.add_all_ta_features(..., fillna=True)
+# so the output matches it column for column, without computing the ~70
+# indicators that were thrown away.
+
+PRICE_FEATURES = ['open', 'high', 'low', 'close']
+
+SELECTED_FEATURES = PRICE_FEATURES + [
+    'trend_sma_fast',
+    'trend_sma_slow',
+    'trend_macd',
+    'trend_macd_signal',
+    'trend_macd_diff',  # MACD Histogram
+    'momentum_rsi',
+    'momentum_stoch',
+    'momentum_stoch_signal',  # Stochastic %D
+    'momentum_tsi',  # True Strength Index
+    'momentum_uo',  # Ultimate Oscillator
+    'volatility_atr',  # Average True Range
+    'volatility_bbm',
+    'volatility_bbh',
+    'volatility_bbl',
+    'volume_adi',  # Accumulation/Distribution Index
+    'volume_obv',  # On-Balance Volume
+    'volume_vwap',  # Volume Weighted Average Price
+    'volume_mfi',  # Money Flow Index
+    'volume_em',  # Ease of Movement
+    'volume_sma_em'  # SMA of Ease of Movement
+]
+
+# Window lengths used by ta.add_all_ta_features
+SMA_FAST, SMA_SLOW = 12, 26
+MACD_FAST, MACD_SLOW, MACD_SIGN = 12, 26, 9
+RSI_WINDOW = 14
+STOCH_WINDOW, STOCH_SMOOTH = 14, 3
+TSI_SLOW, TSI_FAST = 25, 13
+UO_WINDOWS, UO_WEIGHTS = (7, 14, 28), (4.0, 2.0, 1.0)
+ATR_WINDOW = 10
+BB_WINDOW, BB_DEV = 20, 2
+VWAP_WINDOW = 14
+MFI_WINDOW = 14
+EOM_WINDOW = 14
+
+
+def _fill(x, value=0):
+    # ta's _check_fillna: inf -> NaN, forward fill, then a constant
+    # (value == -1 means back fill instead)
+    x = np.where(np.isinf(x), np.nan, x)
+    idx = np.where(np.isnan(x), 0, np.arange(len(x)))
+    np.maximum.accumulate(idx, out=idx)
+    x = x[idx]
+    if value == -1:
+        valid = np.flatnonzero(~np.isnan(x))
+        if len(valid):
+            x[:valid[0]] = x[valid[0]]
+        return x
+    x[np.isnan(x)] = value
+    return x
+
+
+def _shift(x):
+    out = np.empty_like(x)
+    out[0] = np.nan
+    out[1:] = x[:-1]
+    return out
+
+
+def _ema(x, alpha):
+    # pandas ewm(alpha=alpha, adjust=False).mean(); leading NaNs stay NaN
+    out = np.full(len(x), np.nan)
+    valid = np.flatnonzero(~np.isnan(x))
+    if len(valid) == 0:
+        return out
+    seg = x[valid[0]:]
+    out[valid[0]:], _ = lfilter([alpha], [1.0, alpha - 1.0], seg, zi=[(1.0 - alpha) * seg[0]])
+    return out
+
+
+def _windows(x, window):
+    # Rolling windows with min_periods=0: the first rows see a partial
+    # window, padded with NaN. inf is treated as missing like pandas does.
+    x = np.where(np.isinf(x), np.nan, x)
+    padded = np.concatenate([np.full(window - 1, np.nan), x])
+    return sliding_window_view(padded, window)
+
+
+def _rolling(func, x, window):
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        return func(_windows(x, window), axis=1)
+
+
+def _true_range(high, low, prev_close):
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        return np.nanmax([high - low, np.abs(high - prev_close), np.abs(low - prev_close)], axis=0)
+
+
+def _sma(a):
+    return {
+        'trend_sma_fast': _rolling(np.nanmean, a['close'], SMA_FAST),
+        'trend_sma_slow': _rolling(np.nanmean, a['close'], SMA_SLOW),
+    }
+
+
+def _macd(a):
+    close = a['close']
+    macd = _ema(close, 2.0 / (MACD_FAST + 1)) - _ema(close, 2.0 / (MACD_SLOW + 1))
+    signal = _ema(macd, 2.0 / (MACD_SIGN + 1))
+    return {
+        'trend_macd': _fill(macd, 0),
+        'trend_macd_signal': _fill(signal, 0),
+        'trend_macd_diff': _fill(macd - signal, 0),
+    }
+
+
+def _rsi(a):
+    diff = a['close'] - _shift(a['close'])
+    up = np.where(diff > 0, diff, 0.0)
+    down = np.where(diff < 0, -diff, 0.0)
+    emaup = _ema(up, 1.0 / RSI_WINDOW)
+    emadn = _ema(down, 1.0 / RSI_WINDOW)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rsi = np.where(emadn == 0, 100.0, 100.0 - 100.0 / (1.0 + emaup / emadn))
+    return {'momentum_rsi': _fill(rsi, 50)}
+
+
+def _stoch(a):
+    smin = _rolling(np.nanmin, a['low'], STOCH_WINDOW)
+    smax = _rolling(np.nanmax, a['high'], STOCH_WINDOW)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        stoch_k = 100.0 * (a['close'] - smin) / (smax - smin)
+    stoch_d = _rolling(np.nanmean, stoch_k, STOCH_SMOOTH)
+    return {
+        'momentum_stoch': _fill(stoch_k, 50),
+        'momentum_stoch_signal': _fill(stoch_d, 50),
+    }
+
+
+def _tsi(a):
+    diff = a['close'] - _shift(a['close'])
+    slow, fast = 2.0 / (TSI_SLOW + 1), 2.0 / (TSI_FAST + 1)
+    smoothed = _ema(_ema(diff, slow), fast)
+    smoothed_abs = _ema(_ema(np.abs(diff), slow), fast)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        tsi = 100.0 * smoothed / smoothed_abs
+    return {'momentum_tsi': _fill(tsi, 0)}
+
+
+def _uo(a):
+    prev_close = _shift(a['close'])
+    true_range = _true_range(a['high'], a['low'], prev_close)
+    buying_pressure = a['close'] - np.minimum(a['low'], prev_close)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        averages = [
+            _rolling(np.nansum, buying_pressure, window) / _rolling(np.nansum, true_range, window)
+            for window in UO_WINDOWS
+        ]
+    uo = 100.0 * sum(w * avg for w, avg in zip(UO_WEIGHTS, averages)) / sum(UO_WEIGHTS)
+    return {'momentum_uo': _fill(uo, 50)}
+
+
+def _atr(a):
+    true_range = _true_range(a['high'], a['low'], _shift(a['close']))
+    atr = np.zeros(len(true_range))
+    if len(true_range) >= ATR_WINDOW:
+        # Wilder smoothing seeded with the mean of the first window
+        seed = true_range[:ATR_WINDOW].mean()
+        alpha = 1.0 / ATR_WINDOW
+        atr[ATR_WINDOW - 1] = seed
+        atr[ATR_WINDOW:], _ = lfilter([alpha], [1.0, alpha - 1.0], true_range[ATR_WINDOW:],
+                                      zi=[(1.0 - alpha) * seed])
+    return {'volatility_atr': _fill(atr, 0)}
+
+
+def _bollinger(a):
+    mavg = _rolling(np.nanmean, a['close'], BB_WINDOW)
+    mstd = _rolling(np.nanstd, a['close'], BB_WINDOW)
+    return {
+        'volatility_bbm': _fill(mavg, -1),
+        'volatility_bbh': _fill(mavg + BB_DEV * mstd, -1),
+        'volatility_bbl': _fill(mavg - BB_DEV * mstd, -1),
+    }
+
+
+def _adi(a):
+    high, low, close = a['high'], a['low'], a['close']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        clv = ((close - low) - (high - close)) / (high - low)
+    clv[np.isnan(clv)] = 0.0
+    return {'volume_adi': _fill(np.cumsum(clv * a['volume']), 0)}
+
+
+def _obv(a):
+    close = a['close']
+    obv = np.where(close < _shift(close), -a['volume'], a['volume'])
+    return {'volume_obv': _fill(np.cumsum(obv), 0)}
+
+
+def _vwap(a):
+    typical_price = (a['high'] + a['low'] + a['close']) / 3.0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        vwap = (_rolling(np.nansum, typical_price * a['volume'], VWAP_WINDOW)
+                / _rolling(np.nansum, a['volume'], VWAP_WINDOW))
+    return {'volume_vwap': _fill(vwap, 0)}
+
+
+def _mfi(a):
+    typical_price = (a['high'] + a['low'] + a['close']) / 3.0
+    prev = _shift(typical_price)
+    up_down = np.where(typical_price > prev, 1, np.where(typical_price < prev, -1, 0))
+    mfr = typical_price * a['volume'] * up_down
+    positive = _rolling(np.nansum, np.where(mfr >= 0.0, mfr, 0.0), MFI_WINDOW)
+    negative = np.abs(_rolling(np.nansum, np.where(mfr < 0.0, mfr, 0.0), MFI_WINDOW))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mfi = 100.0 - 100.0 / (1.0 + positive / negative)
+    return {'volume_mfi': _fill(mfi, 50)}
+
+
+def _eom(a):
+    high, low = a['high'], a['low']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        emv = ((high - _shift(high)) + (low - _shift(low))) * (high - low) / (2 * a['volume'])
+    emv *= 100000000
+    return {
+        'volume_em': _fill(emv, 0),
+        'volume_sma_em': _fill(_rolling(np.nanmean, emv, EOM_WINDOW), 0),
+    }
+
+
+# feature name -> function computing it (and its siblings)
+_FEATURE_GROUP = {
+    'trend_sma_fast': _sma, 'trend_sma_slow': _sma,
+    'trend_macd': _macd, 'trend_macd_signal': _macd, 'trend_macd_diff': _macd,
+    'momentum_rsi': _rsi,
+    'momentum_stoch': _stoch, 'momentum_stoch_signal': _stoch,
+    'momentum_tsi': _tsi,
+    'momentum_uo': _uo,
+    'volatility_atr': _atr,
+    'volatility_bbm': _bollinger, 'volatility_bbh': _bollinger, 'volatility_bbl': _bollinger,
+    'volume_adi': _adi,
+    'volume_obv': _obv,
+    'volume_vwap': _vwap,
+    'volume_mfi': _mfi,
+    'volume_em': _eom, 'volume_sma_em': _eom,
+}
+SUPPORTED_FEATURES = PRICE_FEATURES + ['volume'] + list(_FEATURE_GROUP)
+
+
+def compute_indicators(open_, high, low, close, volume, features=SELECTED_FEATURES):
+    """Return a C-contiguous (n, len(features)) float64 matrix.
+
+    Only the indicator groups needed for `features` are evaluated.
+    """
+    arrays = {
+        name: np.ascontiguousarray(values, dtype=np.float64)
+        for name, values in (('open', open_), ('high', high), ('low', low),
+                             ('close', close), ('volume', volume))
+    }
+    columns = {}
+    for feature in features:
+        if feature in arrays:
+            columns[feature] = arrays[feature]
+        elif feature not in columns:
+            group = _FEATURE_GROUP.get(feature)
+            if group is None:
+                raise KeyError(f"Unsupported feature: {feature}")
+            columns.update(group(arrays))
+
+    out = np.empty((len(arrays['close']), len(features)), dtype=np.float64)
+    for i, feature in enumerate(features):
+        out[:, i] = columns[feature]
+    return out
+
+
+def indicator_frame(data, features=SELECTED_FEATURES):
+    # DataFrame wrapper keeping the bars' index, as add_all_ta_features did
+    values = compute_indicators(
+        data['open'].to_numpy(), data['high'].to_numpy(), data['low'].to_numpy(),
+        data['close'].to_numpy(), data['volume'].to_numpy(), features
+    )
+    return pd.DataFrame(values, index=data.index, columns=list(features))
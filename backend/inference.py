@@ -0,0 +1,233 @@
+import os
+import json
+import logging
+import argparse
+import numpy as np
+
+# Inference backends for the LSTM built by train_model.build_lstm_model.
+# The NumPy and TFLite backends let the server run without importing
+# TensorFlow; TensorFlow is only imported by the Keras backend and exporter.
+
+logger = logging.getLogger(__name__)
+
+INFERENCE_BACKEND = os.getenv('INFERENCE_BACKEND', 'auto')
+KERAS_MODEL_FILE = 'final_model.h5'
+NUMPY_MODEL_FILE = 'final_model.npz'
+TFLITE_MODEL_FILE = 'final_model.tflite'
+
+
+def _sigmoid(x):
+    return 1.0 / (1.0 + np.exp(-x))
+
+
+_ACTIVATIONS = {
+    'linear': lambda x: x,
+    'relu': lambda x: np.maximum(x, 0.0),
+    'tanh': np.tanh,
+    'sigmoid': _sigmoid,
+}
+
+
+def export_weights(model, path):
+    # Plain .npz with one entry per weight tensor plus a JSON layer spec.
+    # Dropout layers are identity at inference time and are skipped.
+    layers, arrays = [], {}
+    for layer in model.layers:
+        kind = type(layer).__name__
+        config = layer.get_config()
+        weights = layer.get_weights()
+        index = len(layers)
+        if kind == 'LSTM':
+            if config['activation'] != 'tanh' or config['recurrent_activation'] != 'sigmoid':
+                raise ValueError(f"Unsupported LSTM activations in layer {layer.name}")
+            layers.append({'type': 'lstm', 'units': config['units'],
+                           'return_sequences': config['return_sequences']})
+            arrays[f'{index}_kernel'], arrays[f'{index}_recurrent_kernel'], arrays[f'{index}_bias'] = weights
+        elif kind == 'Dense':
+            layers.append({'type': 'dense', 'units': config['units'],
+                           'activation': config['activation']})
+            arrays[f'{index}_kernel'], arrays[f'{index}_bias'] = weights
+        elif kind == 'Dropout':
+            continue
+        else:
+            raise ValueError(f"Unsupported layer type for NumPy export: {kind}")
+    arrays = {name: np.asarray(value, dtype=np.float32) for name, value in arrays.items()}
+    np.savez(path, layers=np.array(json.dumps(layers)), **arrays)
+    logger.info(f"Exported {len(layers)} layers to {path}")
+
+
+def export_tflite(model, path):
+    import tensorflow as tf
+    from tensorflow import keras
+    # The LSTM lowering needs a static batch dimension (see
+    # TFLiteBackend.predict), so the layers are re-applied to a batch-1 input
+    _, steps, features = model.input_shape
+    inputs = keras.Input(shape=(steps, features), batch_size=1)
+    x = inputs
+    for layer in model.layers:
+        x = layer(x)
+    converter = tf.lite.TFLiteConverter.from_keras_model(keras.Model(inputs, x))
+    flatbuffer = converter.convert()
+    with open(path, 'wb') as f:
+        f.write(flatbuffer)
+    logger.info(f"Exported TFLite model to {path}")
+
+
+class NumpyLSTMBackend:
+    """Float32 forward pass over weights written by export_weights."""
+
+    name = 'numpy'
+
+    def __init__(self, path):
+        self.path = path
+        with np.load(path) as data:
+            self.layers = json.loads(str(data['layers']))
+            for index, layer in enumerate(self.layers):
+                if layer['type'] == 'lstm':
+                    layer['kernel'] = data[f'{index}_kernel']
+                    layer['recurrent_kernel'] = data[f'{index}_recurrent_kernel']
+                    layer['bias'] = data[f'{index}_bias']
+                else:
+                    layer['kernel'] = data[f'{index}_kernel']
+                    layer['bias'] = data[f'{index}_bias']
+                    layer['fn'] = _ACTIVATIONS[layer['activation']]
+
+    @staticmethod
+    def lstm_step(layer, projected, h, c):
+        # One timestep given the input projection x @ kernel + bias.
+        # Gate order follows Keras: input, forget, cell, output.
+        units = layer['units']
+        z = projected + h @ layer['recurrent_kernel']
+        i = _sigmoid(z[:, :units])
+        f = _sigmoid(z[:, units:2 * units])
+        g = np.tanh(z[:, 2 * units:3 * units])
+        o = _sigmoid(z[:, 3 * units:])
+        c = f * c + i * g
+        h = o * np.tanh(c)
+        return h, c
+
+    def run_lstm(self, layer, x, h=None, c=None):
+        # x: (batch, time, features); returns all hidden states and the final
+        # (h, c). The input projection is done for every timestep at once.
+        batch, steps, _ = x.shape
+        units = layer['units']
+        if h is None:
+            h = np.zeros((batch, units), dtype=np.float32)
+            c = np.zeros((batch, units), dtype=np.float32)
+        projected = (x.reshape(batch * steps, -1) @ layer['kernel'] + layer['bias']).reshape(batch, steps, -1)
+        outputs = np.empty((batch, steps, units), dtype=np.float32)
+        for t in range(steps):
+            h, c = self.lstm_step(layer, projected[:, t], h, c)
+            outputs[:, t] = h
+        return outputs, h, c
+
+    def head(self, x):
+        for layer in self.layers:
+            if layer['type'] == 'dense':
+                x = layer['fn'](x @ layer['kernel'] + layer['bias'])
+        return x
+
+    def predict(self, x):
+        x = np.asarray(x, dtype=np.float32)
+        for layer in self.layers:
+            if layer['type'] == 'lstm':
+                outputs, h, _ = self.run_lstm(layer, x)
+                x = outputs if layer['return_sequences'] else h
+        return self.head(x)
+
+
+class TFLiteBackend:
+    name = 'tflite'
+
+    def __init__(self, path):
+        self.path = path
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            # Falls back to the interpreter bundled with full TensorFlow
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+        self.interpreter = Interpreter(model_path=path)
+        self.interpreter.allocate_tensors()
+        input_details = self.interpreter.get_input_details()[0]
+        self.input_index = input_details['index']
+        self.output_index = self.interpreter.get_output_details()[0]['index']
+        # The lowered LSTM cannot be resized, so rows are fed in chunks of
+        # the exported (static) batch size
+        self.batch_size = int(input_details['shape'][0])
+
+    def predict(self, x):
+        # The interpreter is not thread-safe; the inference scheduler calls
+        # it from a single thread
+        x = np.asarray(x, dtype=np.float32)
+        outputs = []
+        for start in range(0, len(x), self.batch_size):
+            chunk = x[start:start + self.batch_size]
+            rows = len(chunk)
+            if rows < self.batch_size:
+                chunk = np.concatenate([chunk, np.zeros((self.batch_size - rows,) + chunk.shape[1:], np.float32)])
+            self.interpreter.set_tensor(self.input_index, chunk)
+            self.interpreter.invoke()
+            outputs.append(self.interpreter.get_tensor(self.output_index)[:rows])
+        return np.concatenate(outputs)
+
+
+class KerasBackend:
+    name = 'keras'
+
+    def __init__(self, path):
+        os.environ.setdefault("TF_CPP_MIN_LOG_LEVEL", "2")
+        os.environ.setdefault("TF_ENABLE_ONEDNN_OPTS", "0")
+        from tensorflow.keras.models import load_model
+        self.path = path
+        self.model = load_model(path)
+
+    def predict(self, x):
+        return self.model.predict(x, batch_size=len(x), verbose=0)
+
+
+def load_backend(model_dir, backend=INFERENCE_BACKEND):
+    # 'auto' prefers the exported NumPy weights and only falls back to Keras
+    # (and a TensorFlow import) when they have not been exported yet
+    if backend == 'auto':
+        backend = 'numpy' if os.path.exists(os.path.join(model_dir, NUMPY_MODEL_FILE)) else 'keras'
+    if backend == 'numpy':
+        return NumpyLSTMBackend(os.path.join(model_dir, NUMPY_MODEL_FILE))
+    if backend == 'tflite':
+        return TFLiteBackend(os.path.join(model_dir, TFLITE_MODEL_FILE))
+    if backend == 'keras':
+        return KerasBackend(os.path.join(model_dir, KERAS_MODEL_FILE))
+    raise ValueError(f"Unknown inference backend: {backend}")
+
+
+def compare_backends(reference, candidate, sequence_length=60, features=24, samples=256, seed=0):
+    # Max absolute difference on random inputs in the scaled [0, 1] range
+    x = np.random.default_rng(seed).random((samples, sequence_length, features), dtype=np.float32)
+    return float(np.max(np.abs(reference.predict(x) - candidate.predict(x))))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the trained Keras model for lightweight serving")
+    parser.add_argument('--model-dir', default='models')
+    parser.add_argument('--tflite', action='store_true', help="also write a TFLite flatbuffer")
+    parser.add_argument('--tolerance', type=float, default=1e-4)
+    args = parser.parse_args()
+
+    keras_backend = KerasBackend(os.path.join(args.model_dir, KERAS_MODEL_FILE))
+    export_weights(keras_backend.model, os.path.join(args.model_dir, NUMPY_MODEL_FILE))
+    exported = [NumpyLSTMBackend(os.path.join(args.model_dir, NUMPY_MODEL_FILE))]
+    if args.tflite:
+        export_tflite(keras_backend.model, os.path.join(args.model_dir, TFLITE_MODEL_FILE))
+        exported.append(TFLiteBackend(os.path.join(args.model_dir, TFLITE_MODEL_FILE)))
+
+    for backend in exported:
+        diff = compare_backends(keras_backend, backend)
+        status = 'OK' if diff <= args.tolerance else 'MISMATCH'
+        logger.info(f"{backend.name}: max abs difference vs Keras {diff:.2e} ({status})")
+        if diff > args.tolerance:
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,183 @@
+import os
+import time
+import queue
+import logging
+import threading
+from collections import Counter
+from concurrent.futures import Future, TimeoutError
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+INFERENCE_MAX_BATCH_SIZE = int(os.getenv('INFERENCE_MAX_BATCH_SIZE', '32'))
+INFERENCE_MAX_WAIT_MS = float(os.getenv('INFERENCE_MAX_WAIT_MS', '5'))
+
+
+class _Request:
+    __slots__ = ('sequences', 'future', 'enqueued_at')
+
+    def __init__(self, sequences):
+        self.sequences = sequences
+        self.future = Future()
+        self.enqueued_at = time.perf_counter()
+
+
+class MicroBatchScheduler:
+    """Coalesces concurrent inference requests into one predict call.
+
+    Callers hand in prepared sequences of shape (n, time_step, features).
+    A single worker thread waits up to max_wait_ms for more requests, or
+    until max_batch_size rows are queued, then runs predict_fn once on the
+    concatenated batch and hands each caller its slice of the output.
+    """
+
+    def __init__(self, predict_fn, max_batch_size=INFERENCE_MAX_BATCH_SIZE,
+                 max_wait_ms=INFERENCE_MAX_WAIT_MS):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._carry = None
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._closed = False
+        self._batches = 0
+        self._requests = 0
+        self._rows = 0
+        self._errors = 0
+        self._cancelled = 0
+        self._queue_wait_total = 0.0
+        self._predict_time_total = 0.0
+        self._batch_sizes = Counter()
+
+    def _ensure_worker(self):
+        # Started lazily and per process: a thread started before gunicorn
+        # forks its workers does not exist in the children
+        with self._lock:
+            if self._closed:
+                return
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='inference-scheduler', daemon=True)
+            self._thread.start()
+
+    def submit(self, sequences):
+        sequences = np.asarray(sequences)
+        self._ensure_worker()
+        request = _Request(sequences)
+        with self._lock:
+            if not self._closed:
+                self._queue.put(request)
+                return request.future
+        # Closed (its model was swapped out) after the caller picked it:
+        # run unbatched in the caller's thread
+        try:
+            request.future.set_result(self.predict_fn(sequences))
+        except Exception as e:
+            request.future.set_exception(e)
+        return request.future
+
+    def close(self):
+        # The worker finishes the requests already queued, then exits
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)
+
+    def predict(self, sequences, timeout=None):
+        future = self.submit(sequences)
+        try:
+            return future.result(timeout=timeout)
+        except TimeoutError:
+            # Still queued: the worker drops it instead of running it
+            future.cancel()
+            raise
+
+    def _next_batch(self):
+        first = self._carry if self._carry is not None else self._queue.get()
+        self._carry = None
+        if first is None:
+            return None, 0
+        batch = [first]
+        rows = len(first.sequences)
+        deadline = time.perf_counter() + self.max_wait
+        while rows < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if request is None:
+                # Closed; nothing can be queued after the marker
+                self._queue.put(None)
+                break
+            if rows + len(request.sequences) > self.max_batch_size:
+                # Does not fit; it opens the next batch instead
+                self._carry = request
+                break
+            batch.append(request)
+            rows += len(request.sequences)
+        return batch, rows
+
+    def _run(self):
+        while True:
+            batch, rows = self._next_batch()
+            if batch is None:
+                return
+            live = [request for request in batch if request.future.set_running_or_notify_cancel()]
+            if len(live) < len(batch):
+                with self._lock:
+                    self._cancelled += len(batch) - len(live)
+                batch, rows = live, sum(len(request.sequences) for request in live)
+                if not batch:
+                    continue
+            started = time.perf_counter()
+            try:
+                inputs = np.concatenate([request.sequences for request in batch])
+                outputs = self.predict_fn(inputs)
+            except Exception as e:
+                logger.error(f"Batched inference failed: {str(e)}")
+                for request in batch:
+                    request.future.set_exception(e)
+                with self._lock:
+                    self._errors += 1
+                continue
+            finished = time.perf_counter()
+
+            offset = 0
+            for request in batch:
+                n = len(request.sequences)
+                request.future.set_result(outputs[offset:offset + n])
+                offset += n
+
+            with self._lock:
+                self._batches += 1
+                self._requests += len(batch)
+                self._rows += rows
+                self._batch_sizes[rows] += 1
+                self._predict_time_total += finished - started
+                self._queue_wait_total += sum(started - request.enqueued_at for request in batch)
+
+    def stats(self):
+        with self._lock:
+            batches = self._batches
+            return {
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': self.max_wait * 1000.0,
+                'queue_depth': self._queue.qsize() + (1 if self._carry is not None else 0),
+                'batches': batches,
+                'requests': self._requests,
+                'rows': self._rows,
+                'errors': self._errors,
+                'cancelled': self._cancelled,
+                'mean_batch_size': self._rows / batches if batches else 0.0,
+                'mean_requests_per_batch': self._requests / batches if batches else 0.0,
+                'mean_queue_wait_ms': 1000.0 * self._queue_wait_total / self._requests if self._requests else 0.0,
+                'mean_predict_ms': 1000.0 * self._predict_time_total / batches if batches else 0.0,
+                'batch_size_histogram': {str(size): count for size, count in sorted(self._batch_sizes.items())},
+            }
@@ -0,0 +1,47 @@
+import json
+
+# The architecture trained by train_model.py; sweep.py searches over these
+# hyperparameters. Defaults are the production model. TensorFlow is only
+# imported to build a model, so the defaults can be read without it.
+DEFAULT_HYPERPARAMETERS = {
+    'lstm_units': [128, 64, 32],
+    'dropout': 0.2,
+    'dense_units': [32, 16],
+    'learning_rate': 0.001,
+    'sequence_length': 60,
+    'batch_size': 32,
+}
+
+
+def load_hyperparameters(path):
+    # Overrides of DEFAULT_HYPERPARAMETERS from a JSON file: a plain
+    # mapping, a sweep trial's metadata.json or a leaderboard entry
+    with open(path) as f:
+        data = json.load(f)
+    data = data.get('hyperparameters') or data.get('params') or data
+    unknown = sorted(set(data) - set(DEFAULT_HYPERPARAMETERS))
+    if unknown:
+        raise ValueError(f"Unknown hyperparameters in {path}: {', '.join(unknown)}")
+    return data
+
+
+def build_lstm_model(input_shape, hyperparameters=None):
+    # Stacked LSTMs (each followed by dropout), a ReLU dense head and one
+    # linear output; only these layer types export to the NumPy backend.
+    # sequence_length and batch_size are the caller's to apply.
+    from tensorflow.keras.models import Sequential
+    from tensorflow.keras.layers import LSTM, Dense, Dropout
+    from tensorflow.keras.optimizers import Adam
+    params = {**DEFAULT_HYPERPARAMETERS, **(hyperparameters or {})}
+    lstm_units = params['lstm_units']
+    layers = []
+    for i, units in enumerate(lstm_units):
+        kwargs = {'input_shape': input_shape} if i == 0 else {}
+        layers.append(LSTM(units, return_sequences=i < len(lstm_units) - 1,
+                           activation='tanh', recurrent_activation='sigmoid', **kwargs))
+        layers.append(Dropout(params['dropout']))
+    layers.extend(Dense(units, activation='relu') for units in params['dense_units'])
+    layers.append(Dense(1))
+    model = Sequential(layers)
+    model.compile(optimizer=Adam(learning_rate=params['learning_rate']), loss='huber', metrics=['mae', 'mse'])
+    return model
@@ -0,0 +1,209 @@
+import os
+import time
+import functools
+import random
+import bisect
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Fraction of requests whose stage timings and array shapes are logged at
+# DEBUG level by this module's logger (one line per request); only sampled
+# while that logger is enabled for DEBUG (e.g.
+# logging.getLogger('metrics').setLevel(logging.DEBUG)), 0 disables
+TRACE_SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', '0.01'))
+# Seconds; covers cache hits (sub-millisecond) up to a cold Polygon fetch
+STAGE_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Gauge:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def set(self, value, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] = value
+
+    def remove(self, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values.pop(key, None)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=STAGE_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts (+Inf last), sum]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float('inf'),), counts):
+                    cumulative += count
+                    le = 'le="+Inf"' if bound == float('inf') else f'le="{bound!r}"'
+                    lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+                lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {total}")
+                lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    'prediction_stage_seconds', 'Wall time of each prediction stage.', ['stage']))
+STAGE_ERRORS = REGISTRY.register(Counter(
+    'prediction_stage_errors_total', 'Prediction failures by stage.', ['stage']))
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    'prediction_request_seconds', 'Wall time of prediction requests.', ['endpoint']))
+FALLBACKS = REGISTRY.register(Counter(
+    'prediction_fallbacks_total', 'Predictions answered by the baseline, by reason.', ['reason']))
+REJECTIONS = REGISTRY.register(Counter(
+    'prediction_rejections_total', 'Requests turned away with 429 by admission control.', ['endpoint']))
+SHARED_RESULTS = REGISTRY.register(Counter(
+    'prediction_shared_results_total', 'Requests answered by another request\'s in-flight computation.'))
+MODEL_INFO = REGISTRY.register(Gauge(
+    'model_info', 'The model version being served (always 1).', ['version', 'backend']))
+MODEL_SWAPS = REGISTRY.register(Counter(
+    'model_swaps_total', 'Hot swaps to a new model version since the process started.'))
+
+
+_trace = contextvars.ContextVar('trace', default=None)
+
+
+def start_trace(name):
+    # Samples the current request for a DEBUG trace line; cheap when not
+    # sampled (or DEBUG is off)
+    sampled = (TRACE_SAMPLE_RATE > 0 and random.random() < TRACE_SAMPLE_RATE
+               and logger.isEnabledFor(logging.DEBUG))
+    _trace.set({'name': name, 'stages': [], 'notes': []} if sampled else None)
+
+
+def trace_note(key, value):
+    trace = _trace.get()
+    if trace is not None:
+        trace['notes'].append(f"{key}={value}")
+
+
+def end_trace():
+    trace = _trace.get()
+    if trace is not None:
+        stages = ' '.join(f"{stage}={seconds * 1000:.2f}ms" for stage, seconds in trace['stages'])
+        logger.debug(f"trace {trace['name']}: {stages} {' '.join(trace['notes'])}".rstrip())
+        _trace.set(None)
+
+
+def record_error(stage):
+    STAGE_ERRORS.inc(stage=stage)
+
+
+@contextmanager
+def timed(stage):
+    # Times a block into STAGE_SECONDS and counts it as a failure of `stage`
+    # if it raises
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        record_error(stage)
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        trace = _trace.get()
+        if trace is not None:
+            trace['stages'].append((stage, elapsed))
+
+
+def instrumented(endpoint):
+    # Request-level wall time plus a (sampled) trace around a Flask view
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            start_trace(endpoint)
+            try:
+                return view(*args, **kwargs)
+            finally:
+                REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint)
+                end_trace()
+        return wrapper
+    return decorator
@@ -0,0 +1,275 @@
+import os
+import json
+import time
+import shutil
+import logging
+import argparse
+import threading
+import joblib
+from cache import file_version
+from inference import load_backend, INFERENCE_BACKEND, KERAS_MODEL_FILE, NUMPY_MODEL_FILE, TFLITE_MODEL_FILE
+
+# Versioned model artifacts written by train_model.py:
+#
+#   models/registry/
+#     CURRENT                    name of the active version
+#     20261018T203000Z-<hash>/   one directory per version
+#       final_model.{h5,npz,tflite}, price_scaler.save,
+#       indicator_scaler.save, metadata.json
+#
+# A version directory is complete before it appears (written under a
+# temporary name, then renamed) and CURRENT is replaced atomically, so a
+# reader never sees a half-written version. Old versions are kept for
+# rollback:  python model_registry.py activate <version>
+
+logger = logging.getLogger(__name__)
+
+MODEL_REGISTRY_DIR = os.getenv('MODEL_REGISTRY_DIR', os.path.join('models', 'registry'))
+# Seconds between checks of CURRENT by a serving process; 0 disables hot swaps
+MODEL_RELOAD_INTERVAL = float(os.getenv('MODEL_RELOAD_INTERVAL', '30'))
+
+CURRENT_FILE = 'CURRENT'
+METADATA_FILE = 'metadata.json'
+PRICE_SCALER_FILE = 'price_scaler.save'
+INDICATOR_SCALER_FILE = 'indicator_scaler.save'
+ARTIFACT_FILES = [KERAS_MODEL_FILE, NUMPY_MODEL_FILE, TFLITE_MODEL_FILE, PRICE_SCALER_FILE, INDICATOR_SCALER_FILE]
+
+
+def current_version(root=MODEL_REGISTRY_DIR):
+    try:
+        with open(os.path.join(root, CURRENT_FILE)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def list_versions(root=MODEL_REGISTRY_DIR):
+    # Oldest first; version names start with their UTC creation time
+    if not os.path.isdir(root):
+        return []
+    return sorted(name for name in os.listdir(root)
+                  if not name.startswith('.') and os.path.isfile(os.path.join(root, name, METADATA_FILE)))
+
+
+def activate(version, root=MODEL_REGISTRY_DIR):
+    if version not in list_versions(root):
+        raise ValueError(f"Unknown model version {version} in {root}")
+    tmp_path = os.path.join(root, f'.{CURRENT_FILE}.{os.getpid()}.tmp')
+    with open(tmp_path, 'w') as f:
+        f.write(version + '\n')
+    os.replace(tmp_path, os.path.join(root, CURRENT_FILE))
+    logger.info(f"Activated model version {version}")
+
+
+def read_metadata(path):
+    # A version's (or a flat model directory's) metadata.json, or {}
+    try:
+        with open(os.path.join(path, METADATA_FILE)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def publish_version(source_dir, metadata, root=MODEL_REGISTRY_DIR, files=ARTIFACT_FILES, make_current=True):
+    # Copies those of `files` present in source_dir (at least one model file
+    # and both scalers) into a new version and returns its name. A
+    # metadata.json in source_dir is carried over, updated by `metadata`.
+    present = [name for name in files if os.path.exists(os.path.join(source_dir, name))]
+    model_files = [name for name in present if name not in (PRICE_SCALER_FILE, INDICATOR_SCALER_FILE)]
+    if not model_files or PRICE_SCALER_FILE not in present or INDICATOR_SCALER_FILE not in present:
+        raise ValueError(f"{source_dir} needs a model file and both scalers to publish")
+    version = f"{time.strftime('%Y%m%dT%H%M%SZ', time.gmtime())}-{file_version(os.path.join(source_dir, model_files[0]))}"
+
+    os.makedirs(root, exist_ok=True)
+    tmp_dir = os.path.join(root, f'.{version}.{os.getpid()}.tmp')
+    os.makedirs(tmp_dir)
+    for name in present:
+        shutil.copy2(os.path.join(source_dir, name), os.path.join(tmp_dir, name))
+    carried = {key: value for key, value in read_metadata(source_dir).items()
+               if key not in ('version', 'created', 'files')}
+    metadata = {'version': version, 'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+                'files': present, **carried, **metadata}
+    with open(os.path.join(tmp_dir, METADATA_FILE), 'w') as f:
+        json.dump(metadata, f, indent=2)
+    os.replace(tmp_dir, os.path.join(root, version))
+    logger.info(f"Published model version {version} to {root}")
+    if make_current:
+        activate(version, root)
+    return version
+
+
+class ModelBundle:
+    """One loaded model version: inference backend, scalers and metadata."""
+
+    def __init__(self, version, model, price_scaler, indicator_scaler, metadata):
+        self.version = version
+        self.model = model
+        self.price_scaler = price_scaler
+        self.indicator_scaler = indicator_scaler
+        self.metadata = metadata
+        self.loaded_at = time.time()
+
+    @classmethod
+    def load(cls, path, version=None, backend=INFERENCE_BACKEND):
+        # A registry version directory, or a flat directory of artifacts
+        # (the pre-registry layout), versioned by its model file's hash
+        metadata = read_metadata(path)
+        model = load_backend(path, backend)
+        return cls(
+            version or metadata.get('version') or file_version(model.path),
+            model,
+            joblib.load(os.path.join(path, PRICE_SCALER_FILE)),
+            joblib.load(os.path.join(path, INDICATOR_SCALER_FILE)),
+            metadata,
+        )
+
+
+class ModelRegistry:
+    """Serves the registry's CURRENT version and hot-swaps to new ones.
+
+    load() is meant to run at import, so under gunicorn --preload the
+    initial version is loaded once in the master and shared copy-on-write
+    with the workers. Each serving process then polls CURRENT every
+    reload_interval seconds (watch(), started lazily per process) and loads
+    a new version beside the old one. `prepare` turns a ModelBundle into
+    what `active` holds and may raise to reject an incompatible version;
+    the swap itself is one reference assignment, so requests that already
+    hold the old version finish on it. `on_swap(old, new)` runs afterwards.
+    With an empty registry the flat fallback_dir is served, and load()
+    falls back to older versions, then fallback_dir, when CURRENT fails.
+    """
+
+    def __init__(self, root=MODEL_REGISTRY_DIR, fallback_dir=None, prepare=None, on_swap=None,
+                 reload_interval=MODEL_RELOAD_INTERVAL):
+        self.root = root
+        self.fallback_dir = fallback_dir
+        self.prepare = prepare or (lambda bundle: bundle)
+        self.on_swap = on_swap
+        self.reload_interval = reload_interval
+        self.active = None
+        self.active_version = None
+        self.swaps = 0
+        self.failures = 0
+        self._failed_version = None
+        self._reload_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def _load(self, version):
+        if version is None:
+            if self.fallback_dir is None:
+                raise FileNotFoundError(f"No model version in {self.root}")
+            return self.prepare(ModelBundle.load(self.fallback_dir))
+        return self.prepare(ModelBundle.load(os.path.join(self.root, version), version))
+
+    def load(self):
+        # CURRENT, or if it fails to load the newest older version that
+        # loads, then fallback_dir; a skipped CURRENT is left to reload()
+        # like any failed version (retried once CURRENT changes)
+        version = current_version(self.root)
+        candidates = [version]
+        if version is not None:
+            candidates += [older for older in reversed(list_versions(self.root)) if older < version]
+            if self.fallback_dir is not None:
+                candidates.append(None)
+        error = None
+        for candidate in candidates:
+            try:
+                served = self._load(candidate)
+            except Exception as e:
+                if len(candidates) == 1:
+                    raise
+                logger.error(f"Could not load model version {candidate or self.fallback_dir}: {str(e)}")
+                self.failures += 1
+                error = error or e
+                continue
+            if candidate != version:
+                logger.error(f"Model version {version} is CURRENT but could not be loaded; "
+                             f"serving {candidate or self.fallback_dir} instead")
+                self._failed_version = version
+            self.active, self.active_version = served, candidate
+            if self.on_swap is not None:
+                self.on_swap(None, self.active)
+            return self.active
+        raise error
+
+    def reload(self):
+        # Returns True if a new version was swapped in. A version that
+        # fails to load is logged once and skipped until CURRENT changes.
+        with self._reload_lock:
+            version = current_version(self.root)
+            if version is None or version == self.active_version or version == self._failed_version:
+                return False
+            try:
+                started = time.perf_counter()
+                served = self._load(version)
+            except Exception as e:
+                logger.error(f"Could not load model version {version}, keeping "
+                             f"{self.active_version or 'the current model'}: {str(e)}")
+                self._failed_version = version
+                self.failures += 1
+                return False
+            old, self.active, self.active_version = self.active, served, version
+            self.swaps += 1
+            logger.info(f"Swapped to model version {version} in {time.perf_counter() - started:.2f}s")
+            if self.on_swap is not None:
+                self.on_swap(old, served)
+            return True
+
+    def watch(self):
+        # Started lazily and per process, like the inference scheduler's
+        # worker: a thread started before gunicorn forks does not survive
+        if self.reload_interval <= 0:
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='model-registry', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.reload_interval)
+            try:
+                self.reload()
+            except Exception as e:
+                logger.error(f"Model registry check failed: {str(e)}")
+
+    def stats(self):
+        return {
+            'registry_dir': self.root,
+            'active_version': self.active_version,
+            'current_version': current_version(self.root),
+            'swaps': self.swaps,
+            'failed_loads': self.failures,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect and manage the model registry")
+    parser.add_argument('--root', default=MODEL_REGISTRY_DIR)
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('list', help="list versions, marking the active one")
+    activate_parser = commands.add_parser('activate', help="point CURRENT at a version (deploy or roll back)")
+    activate_parser.add_argument('version')
+    publish_parser = commands.add_parser('publish', help="publish the artifacts in a flat model directory")
+    publish_parser.add_argument('--model-dir', default='models')
+    args = parser.parse_args()
+
+    if args.command == 'list':
+        active = current_version(args.root)
+        for version in list_versions(args.root):
+            metrics = read_metadata(os.path.join(args.root, version)).get('metrics', {})
+            summary = ' '.join(f"{name}={value:.4g}" for name, value in metrics.items())
+            print(f"{'*' if version == active else ' '} {version} {summary}".rstrip())
+    elif args.command == 'activate':
+        activate(args.version, args.root)
+    else:
+        print(publish_version(args.model_dir, {'source': os.path.abspath(args.model_dir)}, args.root))
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    main()
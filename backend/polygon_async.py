@@ -0,0 +1,192 @@
+import os
+import atexit
+import random
+import asyncio
+import logging
+import threading
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+# Overridable so the client can be pointed at a local fake aggregates server
+POLYGON_BASE_URL = os.getenv('POLYGON_BASE_URL', 'https://api.polygon.io').rstrip('/')
+POLYGON_MAX_CONCURRENCY = int(os.getenv('POLYGON_MAX_CONCURRENCY', '8'))
+POLYGON_MAX_RETRIES = int(os.getenv('POLYGON_MAX_RETRIES', '3'))
+POLYGON_RETRY_BACKOFF = float(os.getenv('POLYGON_RETRY_BACKOFF', '0.5'))  # seconds, doubled per attempt
+POLYGON_TIMEOUT = float(os.getenv('POLYGON_TIMEOUT', '30'))
+# Aggregates per result page (Polygon's maximum); pages are also the unit
+# of streaming ingestion, so this bounds the rows parsed at once
+POLYGON_PAGE_LIMIT = int(os.getenv('POLYGON_PAGE_LIMIT', '50000'))
+
+
+class PolygonRetryableError(Exception):
+    def __init__(self, status, retry_after=None):
+        super().__init__(f"HTTP {status}")
+        self.status = status
+        self.retry_after = retry_after
+
+
+class AsyncPolygonClient:
+    """Aggregates client on one pooled aiohttp session.
+
+    At most `max_concurrency` requests are in flight at once; 429s, 5xxs,
+    connection errors and timeouts are retried with exponential backoff
+    (honouring Retry-After).
+    """
+
+    def __init__(self, api_key, base_url=POLYGON_BASE_URL, max_concurrency=POLYGON_MAX_CONCURRENCY,
+                 max_retries=POLYGON_MAX_RETRIES, backoff=POLYGON_RETRY_BACKOFF, timeout=POLYGON_TIMEOUT):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip('/')
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self._session = None
+        self._semaphore = None
+        self.requests = 0
+        self.retries = 0
+
+    async def _ensure_session(self):
+        # Created lazily so the session belongs to the loop that uses it
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_concurrency),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def __aenter__(self):
+        await self._ensure_session()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def _delay(self, attempt, error):
+        if isinstance(error, PolygonRetryableError) and error.retry_after:
+            try:
+                return float(error.retry_after)
+            except ValueError:
+                pass
+        return self.backoff * (2 ** attempt) * (0.5 + random.random())
+
+    async def _get_json(self, url, params):
+        session = await self._ensure_session()
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with self._semaphore:
+                    self.requests += 1
+                    async with session.get(url, params=params) as response:
+                        if response.status == 429 or response.status >= 500:
+                            raise PolygonRetryableError(response.status, response.headers.get('Retry-After'))
+                        response.raise_for_status()
+                        return await response.json()
+            except (PolygonRetryableError, aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = self._delay(attempt, e)
+                self.retries += 1
+                logger.warning(f"Polygon request failed ({e!r}), retrying in {delay:.2f}s")
+                await asyncio.sleep(delay)
+
+    def aggs_request(self, symbol, from_date, to_date, multiplier=1, timespan='day'):
+        # (url, params) of the first page
+        url = f"{self.base_url}/v2/aggs/ticker/{symbol}/range/{multiplier}/{timespan}/{from_date}/{to_date}"
+        return url, {'adjusted': 'true', 'sort': 'asc', 'limit': POLYGON_PAGE_LIMIT}
+
+    async def get_aggs_page(self, url, params):
+        # Returns ((timestamp ms, open, high, low, close, volume) tuples,
+        # next page url or None)
+        params = dict(params)
+        if self.api_key:
+            params['apiKey'] = self.api_key
+        payload = await self._get_json(url, params)
+        rows = [(r['t'], r['o'], r['h'], r['l'], r['c'], r['v']) for r in payload.get('results') or []]
+        return rows, payload.get('next_url')
+
+    async def get_aggs(self, symbol, from_date, to_date, multiplier=1, timespan='day'):
+        # Every page's rows, following next_url
+        url, params = self.aggs_request(symbol, from_date, to_date, multiplier, timespan)
+        rows = []
+        while url:
+            page, url = await self.get_aggs_page(url, params)
+            rows.extend(page)
+            # next_url already carries the query except for the key
+            params = {}
+        return rows
+
+    async def get_many(self, symbols, from_date, to_date, **kwargs):
+        # {symbol: rows or exception}; one failing symbol does not cancel
+        # the others
+        results = await asyncio.gather(
+            *(self.get_aggs(symbol, from_date, to_date, **kwargs) for symbol in symbols),
+            return_exceptions=True,
+        )
+        return dict(zip(symbols, results))
+
+
+class BackgroundPolygonClient:
+    """Synchronous facade running an AsyncPolygonClient on a background loop.
+
+    Flask handler threads (and BarStore) submit coroutines to one event loop
+    thread and wait on the result, so all threads of a worker share a single
+    connection pool and concurrency limit. The loop is started lazily per
+    process so it survives gunicorn's fork.
+    """
+
+    def __init__(self, api_key, **client_kwargs):
+        self.api_key = api_key
+        self.client_kwargs = client_kwargs
+        self._lock = threading.Lock()
+        self._pid = None
+        self._loop = None
+        self.client = None
+
+    def _ensure_loop(self):
+        with self._lock:
+            if self._loop is None or self._pid != os.getpid():
+                self._loop = asyncio.new_event_loop()
+                self.client = AsyncPolygonClient(self.api_key, **self.client_kwargs)
+                threading.Thread(target=self._loop.run_forever, name='polygon-io', daemon=True).start()
+                if self._pid is None:
+                    atexit.register(self.close)
+                self._pid = os.getpid()
+            return self._loop
+
+    def close(self):
+        with self._lock:
+            if self._loop is None or self._pid != os.getpid():
+                return
+            loop, client = self._loop, self.client
+            self._loop = None
+        asyncio.run_coroutine_threadsafe(client.close(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+
+    def run(self, coro):
+        loop = self._ensure_loop()
+        return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+    def get_aggs(self, symbol, from_date, to_date, **kwargs):
+        self._ensure_loop()
+        return self.run(self.client.get_aggs(symbol, from_date, to_date, **kwargs))
+
+    def get_many(self, symbols, from_date, to_date, **kwargs):
+        self._ensure_loop()
+        return self.run(self.client.get_many(symbols, from_date, to_date, **kwargs))
+
+    def iter_aggs(self, symbol, from_date, to_date, multiplier=1, timespan='day'):
+        # Yields the rows of one result page at a time; the next page is
+        # requested only when the caller has consumed the previous one
+        self._ensure_loop()
+        url, params = self.client.aggs_request(symbol, from_date, to_date, multiplier, timespan)
+        while url:
+            rows, url = self.run(self.client.get_aggs_page(url, params))
+            params = {}
+            yield rows
@@ -0,0 +1,105 @@
+import os
+import time
+import logging
+import argparse
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+import numpy as np
+import app
+
+# Writes complete /api/predict responses for a watchlist into the
+# precomputed store (cache.PRECOMPUTE_DIR), which predict() serves while the
+# entry's last bar and model version are current. Run it once after the
+# close (cron), or keep it running with --schedule:
+#
+#   python precompute.py [--symbols AAPL MSFT ...] [--schedule]
+
+logger = logging.getLogger(__name__)
+
+PRECOMPUTE_SYMBOLS = [symbol.strip().upper() for symbol in
+                      os.getenv('PRECOMPUTE_SYMBOLS', 'AAPL,MSFT,GOOGL,AMZN').split(',') if symbol.strip()]
+PRECOMPUTE_BATCH_SIZE = int(os.getenv('PRECOMPUTE_BATCH_SIZE', '256'))
+# Local market time of the daily run; late enough for Polygon to have the
+# day's final bar
+PRECOMPUTE_AT = os.getenv('PRECOMPUTE_AT', '16:30')
+MARKET_TIMEZONE = ZoneInfo(os.getenv('MARKET_TIMEZONE', 'America/New_York'))
+
+
+def precompute(symbols, batch_size=PRECOMPUTE_BATCH_SIZE):
+    # Returns (symbols written, {symbol: error})
+    if app.serving() is None:
+        raise RuntimeError("No model loaded; nothing to precompute")
+    _, errors = app.bar_store.refresh_many(symbols, *app.history_range())
+    errors = {symbol: str(error) for symbol, error in errors.items()}
+    written = []
+    pending = [symbol for symbol in symbols if symbol not in errors]
+    for start in range(0, len(pending), batch_size):
+        prepared = []
+        for symbol in pending[start:start + batch_size]:
+            try:
+                stock_data = app.load_stock_data(symbol)
+                key = app.cache_key(symbol, stock_data)
+                feature_data, sequence = app.prepare_prediction_input(symbol, stock_data, key)
+                prepared.append((symbol, key, stock_data, feature_data, sequence))
+            except app.PredictionError as e:
+                errors[symbol] = e.message
+        if not prepared:
+            continue
+
+        # One forward pass per chunk, no latency budget
+        predictions = app.run_model([symbol for symbol, *_ in prepared],
+                                    np.concatenate([sequence for *_, sequence in prepared]))
+        prices = app.inverse_transform_close(predictions[:, 0])
+        for (symbol, key, stock_data, feature_data, _), price in zip(prepared, prices):
+            result = app.build_prediction_response(key, stock_data, feature_data, float(price))
+            app.precomputed_store.set(key, result)
+            written.append(symbol)
+    return written, errors
+
+
+def next_run(now, at=PRECOMPUTE_AT):
+    # The next weekday at `at` market time strictly after `now`
+    hour, minute = (int(part) for part in at.split(':'))
+    candidate = now.astimezone(MARKET_TIMEZONE).replace(hour=hour, minute=minute, second=0, microsecond=0)
+    while candidate <= now or candidate.weekday() >= 5:
+        candidate += timedelta(days=1)
+    return candidate
+
+
+def run_once(symbols, batch_size):
+    started = time.perf_counter()
+    try:
+        # No request hook watches the registry in this process; pick up a
+        # version published since the last run, or entries would be keyed
+        # to a model the server no longer serves
+        app.model_registry.reload()
+        written, errors = precompute(symbols, batch_size)
+    except Exception as e:
+        logger.error(f"Precompute failed: {str(e)}")
+        return False
+    for symbol, error in errors.items():
+        logger.error(f"Precompute failed for {symbol}: {error}")
+    logger.info(f"Precomputed {len(written)}/{len(symbols)} symbols in {time.perf_counter() - started:.1f}s")
+    return not errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute /api/predict responses for a watchlist")
+    parser.add_argument('--symbols', nargs='+', default=PRECOMPUTE_SYMBOLS)
+    parser.add_argument('--batch-size', type=int, default=PRECOMPUTE_BATCH_SIZE)
+    parser.add_argument('--schedule', action='store_true',
+                        help=f"run now, then every weekday at PRECOMPUTE_AT ({PRECOMPUTE_AT} {MARKET_TIMEZONE.key})")
+    args = parser.parse_args()
+    symbols = list(dict.fromkeys(symbol.upper() for symbol in args.symbols))
+
+    ok = run_once(symbols, args.batch_size)
+    while args.schedule:
+        scheduled = next_run(datetime.now(MARKET_TIMEZONE))
+        logger.info(f"Next precompute run at {scheduled.isoformat()}")
+        time.sleep(max(0.0, (scheduled - datetime.now(MARKET_TIMEZONE)).total_seconds()))
+        run_once(symbols, args.batch_size)
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
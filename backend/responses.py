@@ -0,0 +1,75 @@
+import hashlib
+import pandas as pd
+
+try:
+    import msgpack
+except ImportError:  # optional; application/msgpack is simply not offered
+    msgpack = None
+
+# Encodings of /api/predict, chosen by Accept. JSON is the original format
+# with historical_data as one object per bar; the others carry it as
+# columns with epoch-millisecond timestamps.
+JSON = 'application/json'
+COLUMNAR_JSON = 'application/vnd.quantum.columnar+json'
+MSGPACK = 'application/msgpack'
+ENCODINGS = [JSON, COLUMNAR_JSON] + ([MSGPACK] if msgpack is not None else [])
+
+HISTORY_ROWS = 300
+BAR_FIELDS = ['timestamp', 'open', 'high', 'low', 'close', 'volume']
+
+
+class PredictionResponse:
+    """One /api/predict answer, cached unencoded so every variant is cheap.
+
+    `summary` is the payload without historical_data and `bars` the last
+    HISTORY_ROWS bars. The default row-per-bar JSON body is encoded once up
+    front (it is what most requests and the batch endpoint need); other
+    encodings and `since` filters are encoded per request from the columns.
+    """
+
+    def __init__(self, summary, bars, version, dumps):
+        self.summary = summary
+        self.bars = bars[BAR_FIELDS].tail(HISTORY_ROWS).reset_index(drop=True)
+        self.version = hashlib.sha1(repr(version).encode()).hexdigest()[:16]
+        self.last_modified = self.bars['timestamp'].iat[-1].to_pydatetime()
+        self.json = self._encode(JSON, dumps, None)
+
+    def etag(self, encoding, since_ms=None):
+        # Differs per representation: content version, encoding and filter
+        suffix = '' if encoding == JSON else '-' + hashlib.sha1(encoding.encode()).hexdigest()[:6]
+        if since_ms is not None:
+            suffix += f'-{since_ms}'
+        return f'{self.version}{suffix}'
+
+    def _bars_since(self, since_ms):
+        if since_ms is None:
+            return self.bars
+        return self.bars[self.bars['timestamp'] > pd.Timestamp(since_ms, unit='ms')]
+
+    def _columns(self, bars):
+        columns = {field: bars[field].tolist() for field in BAR_FIELDS[1:]}
+        return {'timestamp': (bars['timestamp'].astype('int64') // 1_000_000).tolist(), **columns}
+
+    def _encode(self, encoding, dumps, since_ms):
+        bars = self._bars_since(since_ms)
+        if encoding == JSON:
+            return dumps({**self.summary, 'historical_data': bars.to_dict('records')}).encode()
+        payload = {**self.summary, 'historical_data': self._columns(bars)}
+        if encoding == MSGPACK:
+            return msgpack.packb(payload)
+        return dumps(payload).encode()
+
+    def encode(self, encoding, dumps, since_ms=None):
+        if encoding == JSON and since_ms is None:
+            return self.json
+        return self._encode(encoding, dumps, since_ms)
+
+
+def parse_since(value):
+    # Epoch milliseconds or anything pandas parses as a timestamp (ISO
+    # dates); None passes through. Raises ValueError otherwise.
+    if value is None or value == '':
+        return None
+    if isinstance(value, (int, float)) or str(value).isdigit():
+        return int(value)
+    return int(pd.Timestamp(value).value // 1_000_000)
@@ -0,0 +1,29 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+CLOSE_INDEX = 3  # position of 'close' in the feature matrix
+
+
+def create_sequences(data, time_step=60, dtype=None):
+    # X[i] = data[i:i + time_step], y[i] = data[i + time_step, close] for
+    # i in range(len(data) - time_step - 1), like the original loop, but X is
+    # a read-only strided view over `data` instead of an N x time_step copy.
+    # `dtype` converts the base matrix once (e.g. float32 for training).
+    data = np.ascontiguousarray(data, dtype=dtype)
+    count = len(data) - time_step - 1
+    if count <= 0:
+        return (np.empty((0, time_step, data.shape[1]), dtype=data.dtype),
+                np.empty(0, dtype=data.dtype))
+    # sliding_window_view puts the window axis last: (windows, features, time)
+    X = sliding_window_view(data, time_step, axis=0)[:count].transpose(0, 2, 1)
+    y = data[time_step:time_step + count, CLOSE_INDEX]
+    return X, y
+
+
+def latest_sequence(data, time_step=60):
+    # Serving fast path: create_sequences(data, time_step)[0][-1:] without
+    # building the other windows
+    count = len(data) - time_step - 1
+    if count <= 0:
+        return np.empty((0, time_step, data.shape[1]), dtype=data.dtype)
+    return data[np.newaxis, count - 1:count - 1 + time_step]
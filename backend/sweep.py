@@ -0,0 +1,325 @@
+import os
+import json
+import time
+import random
+import hashlib
+import logging
+import argparse
+import shutil
+import itertools
+import statistics
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+
+# Hyperparameter and architecture sweep over lstm_model.build_lstm_model.
+# The parent builds the training window store once (as train_model.main
+# does); every trial runs in a spawned worker process with pinned TensorFlow
+# thread counts and reads the same memory-mapped store, so the dataset is
+# in the page cache once however many workers there are. Trials stop early
+# on their own validation loss and are pruned when they trail the median of
+# the other trials at the same epoch. Results go to a leaderboard:
+#
+#   python sweep.py [--space space.json] [--trials 20] [--workers 4] [--threads 1]
+#
+# A search space maps each hyperparameter to a list of choices or to a
+# range {"min": ..., "max": ..., "log": true, "int": true}. Trials are
+# identified by their parameters, so rerunning a sweep resumes it.
+
+logger = logging.getLogger(__name__)
+
+SWEEP_DIR = os.getenv('SWEEP_DIR', os.path.join('data', 'sweep'))
+DEFAULT_SPACE = {
+    'lstm_units': [[128, 64, 32], [64, 32], [64], [32, 16], [32]],
+    'dropout': [0.0, 0.1, 0.2],
+    'dense_units': [[32, 16], [16], []],
+    'learning_rate': {'min': 0.0003, 'max': 0.003, 'log': True},
+    'sequence_length': [30, 60],
+    'batch_size': [32, 64, 128],
+}
+# Epochs every trial runs before it can be pruned, and trials that must have
+# reached an epoch before the median there is trusted
+PRUNE_AFTER_EPOCHS = 3
+PRUNE_MIN_TRIALS = 3
+# Single-window NumPy backend latency samples per trial
+LATENCY_REPEAT = 50
+SCALER_FILES = ['price_scaler.save', 'indicator_scaler.save']
+
+
+def trial_id(params):
+    return hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()[:10]
+
+
+def _sample(spec, rng):
+    if isinstance(spec, list):
+        return rng.choice(spec)
+    low, high = spec['min'], spec['max']
+    if spec.get('int'):
+        return rng.randint(low, high)
+    if spec.get('log'):
+        return float(np.exp(rng.uniform(np.log(low), np.log(high))))
+    return rng.uniform(low, high)
+
+
+def sample_trials(space, trials, seed=0, grid=False):
+    # Every combination of a choices-only space (grid), or `trials` distinct
+    # random draws from it
+    if grid:
+        if not all(isinstance(spec, list) for spec in space.values()):
+            raise ValueError("A grid needs a list of choices for every hyperparameter")
+        names = sorted(space)
+        return [dict(zip(names, values)) for values in itertools.product(*(space[name] for name in names))]
+    rng = random.Random(seed)
+    sampled, seen = [], set()
+    for _ in range(trials * 20):
+        params = {name: _sample(spec, rng) for name, spec in sorted(space.items())}
+        if trial_id(params) not in seen:
+            seen.add(trial_id(params))
+            sampled.append(params)
+            if len(sampled) == trials:
+                break
+    return sampled
+
+
+def _write_json(path, payload):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(payload, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _read_json(path, default=None):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return default
+
+
+def _init_worker(threads):
+    # Runs first in every spawned worker: thread pools have to be sized
+    # before TensorFlow (or NumPy's BLAS) creates them
+    for variable in ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS'):
+        os.environ[variable] = str(threads)
+    os.environ.setdefault('TF_CPP_MIN_LOG_LEVEL', '2')
+    os.environ.setdefault('TF_ENABLE_ONEDNN_OPTS', '0')
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+
+
+def _median_pruner(curves_dir, trial, min_epochs, min_trials):
+    from tensorflow.keras.callbacks import Callback
+
+    class MedianPruner(Callback):
+        # Records this trial's validation losses for the other workers and
+        # stops it when its best so far is worse than the median of the
+        # other trials' best at the same epoch
+        def __init__(self):
+            super().__init__()
+            self.losses = []
+            self.pruned = False
+
+        def on_epoch_end(self, epoch, logs=None):
+            self.losses.append(float(logs['val_loss']))
+            _write_json(os.path.join(curves_dir, f'{trial}.json'), self.losses)
+            if len(self.losses) < min_epochs:
+                return
+            others = []
+            for name in os.listdir(curves_dir):
+                if name.endswith('.json') and name != f'{trial}.json':
+                    curve = _read_json(os.path.join(curves_dir, name), [])
+                    if len(curve) > epoch:
+                        others.append(min(curve[:epoch + 1]))
+            if len(others) >= min_trials and min(self.losses) > statistics.median(others):
+                self.pruned = True
+                self.model.stop_training = True
+
+    return MedianPruner()
+
+
+def run_trial(trial, params, store_root, sweep_dir, epochs, patience, test_size, close_range, seed):
+    # Trains one configuration in a worker; returns its leaderboard entry
+    import tensorflow as tf
+    from tensorflow.keras.callbacks import EarlyStopping
+    from training_store import WindowStore
+    from lstm_model import build_lstm_model, DEFAULT_HYPERPARAMETERS
+    from inference import export_weights, NumpyLSTMBackend, NUMPY_MODEL_FILE, KERAS_MODEL_FILE
+    from model_registry import METADATA_FILE
+    from bar_store import BAR_SIZE
+
+    tf.random.set_seed(seed)
+    started = time.perf_counter()
+    store = WindowStore(store_root)
+    # Keys the search space leaves out keep their production defaults
+    hyperparameters = {**DEFAULT_HYPERPARAMETERS, **params}
+    time_step = hyperparameters['sequence_length']
+    train_index, val_index = store.window_index(time_step, test_size)
+    model = build_lstm_model((time_step, len(store.columns)), hyperparameters)
+    pruner = _median_pruner(os.path.join(sweep_dir, 'curves'), trial, PRUNE_AFTER_EPOCHS, PRUNE_MIN_TRIALS)
+    stopper = EarlyStopping(monitor='val_loss', patience=patience, restore_best_weights=True)
+    history = model.fit(
+        store.dataset(train_index, time_step, batch_size=hyperparameters['batch_size'], shuffle=True, seed=seed),
+        validation_data=store.dataset(val_index, time_step, batch_size=256),
+        epochs=epochs, callbacks=[stopper, pruner], verbose=0,
+    )
+    train_seconds = time.perf_counter() - started
+    val_loss = history.history['val_loss']
+    best_epoch = int(np.argmin(val_loss))
+
+    # With the sweep's scalers and the metadata serving checks beside it, a
+    # trial directory can be published as is
+    # (python model_registry.py publish --model-dir ...)
+    trial_dir = os.path.join(sweep_dir, 'trials', trial)
+    os.makedirs(trial_dir, exist_ok=True)
+    model.save(os.path.join(trial_dir, KERAS_MODEL_FILE))
+    export_weights(model, os.path.join(trial_dir, NUMPY_MODEL_FILE))
+    for name in SCALER_FILES:
+        if os.path.exists(os.path.join(sweep_dir, name)):
+            shutil.copy2(os.path.join(sweep_dir, name), os.path.join(trial_dir, name))
+    _write_json(os.path.join(trial_dir, METADATA_FILE), {
+        'features': list(store.columns),
+        'sequence_length': time_step,
+        'bar_size': BAR_SIZE.label,
+        'symbols': store.symbols,
+        'sweep_trial': trial,
+        'hyperparameters': hyperparameters,
+        'epochs': len(val_loss),
+        'metrics': {'val_loss': val_loss[best_epoch], 'val_mae': history.history['val_mae'][best_epoch]},
+    })
+
+    # Served the way the app serves it: the NumPy backend, one window per call
+    backend = NumpyLSTMBackend(os.path.join(trial_dir, NUMPY_MODEL_FILE))
+    window = store.gather(val_index[:1], time_step)[0]
+    timings = []
+    for _ in range(LATENCY_REPEAT):
+        call_started = time.perf_counter()
+        backend.predict(window)
+        timings.append((time.perf_counter() - call_started) * 1000)
+
+    return {
+        'trial': trial,
+        'params': params,
+        'status': 'pruned' if pruner.pruned else ('early_stopped' if len(val_loss) < epochs else 'completed'),
+        'epochs': len(val_loss),
+        'best_epoch': best_epoch + 1,
+        'val_loss': val_loss[best_epoch],
+        'val_mae': history.history['val_mae'][best_epoch],
+        # MinMax-scaled close error back in price units
+        'val_mae_price': history.history['val_mae'][best_epoch] * close_range,
+        'weights': int(model.count_params()),
+        'predict_ms': float(np.median(timings)),
+        'train_seconds': train_seconds,
+    }
+
+
+def leaderboard_order(max_mae=None):
+    # Best validation loss first; with an accuracy bar, the trials meeting
+    # it come first, fastest to serve first
+    def key(entry):
+        if 'val_loss' not in entry:
+            return (2, 0.0)
+        if max_mae is not None:
+            meets = entry['val_mae_price'] <= max_mae
+            return (0, entry['predict_ms']) if meets else (1, entry['val_loss'])
+        return (0, entry['val_loss'])
+    return key
+
+
+def write_leaderboard(path, entries, max_mae=None):
+    entries = sorted(entries.values(), key=leaderboard_order(max_mae))
+    for entry in entries:
+        if max_mae is not None and 'val_mae_price' in entry:
+            entry['meets_accuracy_bar'] = entry['val_mae_price'] <= max_mae
+    _write_json(path, entries)
+    return entries
+
+
+def run_sweep(trials, store_root, close_range, sweep_dir=SWEEP_DIR, workers=1, threads=1, epochs=30,
+              patience=5, test_size=0.2, max_mae=None, seed=0):
+    os.makedirs(os.path.join(sweep_dir, 'curves'), exist_ok=True)
+    leaderboard_path = os.path.join(sweep_dir, 'leaderboard.json')
+    entries = {entry['trial']: entry for entry in _read_json(leaderboard_path, [])}
+    pending = [(trial_id(params), params) for params in trials]
+    pending = [(trial, params) for trial, params in pending
+               if trial not in entries or 'val_loss' not in entries[trial]]
+    logger.info(f"Running {len(pending)} trials ({len(trials) - len(pending)} already done) "
+                f"on {workers} workers x {threads} threads")
+
+    # Spawned, not forked: TensorFlow's runtime does not survive a fork
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker,
+                             initargs=(threads,)) as pool:
+        futures = {pool.submit(run_trial, trial, params, store_root, sweep_dir, epochs, patience,
+                               test_size, close_range, seed): (trial, params) for trial, params in pending}
+        for future in as_completed(futures):
+            trial, params = futures[future]
+            try:
+                entry = future.result()
+                logger.info(f"Trial {trial} {entry['status']} after {entry['epochs']} epochs: "
+                            f"val_loss={entry['val_loss']:.5f} mae=${entry['val_mae_price']:.2f} "
+                            f"weights={entry['weights']} predict={entry['predict_ms']:.2f}ms")
+            except Exception as e:
+                logger.error(f"Trial {trial} failed: {str(e)}")
+                entry = {'trial': trial, 'params': params, 'status': 'failed', 'error': str(e)}
+            entries[trial] = entry
+            write_leaderboard(leaderboard_path, entries, max_mae)
+    return write_leaderboard(leaderboard_path, entries, max_mae)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parallel hyperparameter sweep for the LSTM")
+    parser.add_argument('--space', help="search space JSON (default: sweep.DEFAULT_SPACE)")
+    parser.add_argument('--trials', type=int, default=20, help="random configurations to try")
+    parser.add_argument('--grid', action='store_true', help="try every combination instead")
+    parser.add_argument('--threads', type=int, default=1, help="TensorFlow threads per worker")
+    parser.add_argument('--workers', type=int, help="worker processes (default: CPUs / threads)")
+    parser.add_argument('--epochs', type=int, default=30)
+    parser.add_argument('--patience', type=int, default=5, help="epochs without improvement before stopping")
+    parser.add_argument('--max-mae', type=float, help="accuracy bar in price units; ranks passing trials by latency")
+    parser.add_argument('--sweep-dir', default=SWEEP_DIR)
+    parser.add_argument('--store', help="existing training window store (default: build it like train_model)")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    space = DEFAULT_SPACE
+    if args.space:
+        with open(args.space) as f:
+            space = json.load(f)
+    trials = sample_trials(space, args.trials, args.seed, args.grid)
+    workers = args.workers or max(1, (os.cpu_count() or 1) // args.threads)
+
+    # Kept out of module scope, which spawned workers re-import
+    import joblib
+    import train_model
+    from training_store import WindowStore
+    store, price_scaler, indicator_scaler = ((WindowStore(args.store), None, None) if args.store
+                                             else train_model.prepare_training_store())
+    if store is None:
+        raise SystemExit("No training data")
+    if price_scaler is None and all(os.path.exists(os.path.join(args.sweep_dir, name)) for name in SCALER_FILES):
+        # A reused store carries no scalers; an earlier run of this sweep
+        # saved the ones it was built with
+        price_scaler = joblib.load(os.path.join(args.sweep_dir, SCALER_FILES[0]))
+        close_range = float(price_scaler.data_range_[3])
+    elif price_scaler is None:
+        logger.warning("Reusing a store without scalers: val_mae_price is in scaled units")
+        close_range = 1.0
+    else:
+        close_range = float(price_scaler.data_range_[3])
+        os.makedirs(args.sweep_dir, exist_ok=True)
+        for name, scaler in zip(SCALER_FILES, (price_scaler, indicator_scaler)):
+            joblib.dump(scaler, os.path.join(args.sweep_dir, name))
+
+    entries = run_sweep(trials, store.root, close_range, args.sweep_dir, workers, args.threads,
+                        args.epochs, args.patience, train_model.TEST_SIZE, args.max_mae, args.seed)
+    for entry in entries[:5]:
+        if 'val_loss' in entry:
+            print(f"{entry['trial']} val_loss={entry['val_loss']:.5f} mae={entry['val_mae_price']:.2f} "
+                  f"weights={entry['weights']} predict={entry['predict_ms']:.2f}ms {json.dumps(entry['params'])}")
+    return 0
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    raise SystemExit(main())
@@ -0,0 +1,118 @@
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+from indicators import indicator_frame
+from indicator_state import FeatureStream, FeatureStreamStore
+from benchmarks.synthetic import synthetic_bars
+
+# The streaming engine (IndicatorState/FeatureStream) against the vectorized
+# one: a stream's rows equal indicator_frame over the bars since its origin.
+# Run from backend/: python -m pytest tests
+
+WINDOW = 62
+HISTORY = 250
+
+
+def bar_history(symbol='AAPL'):
+    bars = synthetic_bars(symbol, '2022-01-01', '2024-12-31')
+    bars['timestamp'] = bars['timestamp'].astype('datetime64[ms]')
+    return bars
+
+
+def expected(bars, rows=WINDOW):
+    return indicator_frame(bars).to_numpy()[-rows:]
+
+
+def assert_rows_equal(actual, desired):
+    np.testing.assert_allclose(np.asarray(actual), desired, rtol=1e-9, atol=1e-9)
+
+
+class FeatureStreamTest(unittest.TestCase):
+    def test_from_bars_matches_vectorized_engine(self):
+        bars = bar_history()
+        for n in (1, 5, 20, 40, HISTORY):
+            with self.subTest(bars=n):
+                stream = FeatureStream.from_bars(bars.iloc[:n], WINDOW)
+                assert_rows_equal(stream.rows, expected(bars.iloc[:n]))
+
+    def test_append_one_bar_at_a_time(self):
+        bars = bar_history()
+        stream = FeatureStream.from_bars(bars.iloc[:30], WINDOW)
+        for end in range(31, 120):
+            self.assertTrue(stream.sync(bars.iloc[end - 30:end]))
+            assert_rows_equal(stream.rows, expected(bars.iloc[:end]))
+
+    def test_revised_last_bar_is_replaced(self):
+        bars = bar_history()
+        stream = FeatureStream.from_bars(bars.iloc[:HISTORY], WINDOW)
+        revised = bars.iloc[:HISTORY].copy()
+        for column, change in (('close', 1.5), ('volume', 1e5), ('high', 2.0)):
+            revised.loc[revised.index[-1], column] += change
+            with self.subTest(column=column):
+                self.assertTrue(stream.sync(revised))
+                assert_rows_equal(stream.rows, expected(revised))
+        # A revised bar followed by new ones in the same fetch
+        revised = bars.iloc[:HISTORY + 3].copy()
+        revised.loc[HISTORY - 1, 'close'] -= 1.0
+        self.assertTrue(stream.sync(revised))
+        assert_rows_equal(stream.rows, expected(revised))
+        self.assertEqual(stream.origin, FeatureStream.from_bars(bars.iloc[:1], WINDOW).origin)
+
+    def test_change_before_last_bar_needs_rebuild(self):
+        bars = bar_history()
+        stream = FeatureStream.from_bars(bars.iloc[:HISTORY], WINDOW)
+        revised = bars.iloc[:HISTORY].copy()
+        revised.loc[HISTORY - 2:, 'close'] += 1.0
+        self.assertFalse(stream.sync(revised))
+
+
+class FeatureStreamStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.root.cleanup)
+        self.bars = bar_history()
+
+    def test_sliding_history_keeps_origin(self):
+        store = FeatureStreamStore(self.root.name, WINDOW, reanchor_bars=HISTORY)
+        for end in range(HISTORY, HISTORY + 40):
+            features = store.features('AAPL', self.bars.iloc[end - HISTORY:end])
+            assert_rows_equal(features.to_numpy(), expected(self.bars.iloc[:end]))
+            self.assertEqual(list(features.index), list(self.bars.index[end - WINDOW:end]))
+
+    def test_revised_last_bar_does_not_rebuild(self):
+        store = FeatureStreamStore(self.root.name, WINDOW)
+        store.features('AAPL', self.bars.iloc[:HISTORY])
+        stream = store.streams['AAPL']
+        revised = self.bars.iloc[:HISTORY].copy()
+        for step in range(3):
+            revised.loc[HISTORY - 1, 'close'] += 0.5
+            revised.loc[HISTORY - 1, 'volume'] += 1e4
+            features = store.features('AAPL', revised)
+            self.assertIs(store.streams['AAPL'], stream)
+            assert_rows_equal(features.to_numpy(), expected(revised))
+        # The revision is persisted, and a restarted worker resumes from it
+        history = pd.concat([revised, self.bars.iloc[HISTORY:HISTORY + 1]])
+        resumed = FeatureStreamStore(self.root.name, WINDOW)
+        features = resumed.features('AAPL', history.iloc[1:])
+        assert_rows_equal(features.to_numpy(), expected(history))
+        self.assertEqual(resumed.streams['AAPL'].state.bars, HISTORY + 1)
+
+    def test_reanchors_after_reanchor_bars(self):
+        reanchor_bars = 20
+        store = FeatureStreamStore(self.root.name, WINDOW, reanchor_bars=reanchor_bars)
+        for end in range(HISTORY, HISTORY + reanchor_bars + 2):
+            bars = self.bars.iloc[end - HISTORY:end]
+            features = store.features('AAPL', bars)
+            stream = store.streams['AAPL']
+            if end - HISTORY <= reanchor_bars:
+                self.assertEqual(stream.state.bars, end)
+                assert_rows_equal(features.to_numpy(), expected(self.bars.iloc[:end]))
+            else:
+                # Rebuilt from the request's history, so anchored at its start
+                self.assertEqual(stream.state.bars, HISTORY)
+                assert_rows_equal(features.to_numpy(), expected(bars))
+
+
+if __name__ == '__main__':
+    unittest.main()
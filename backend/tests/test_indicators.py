@@ -0,0 +1,115 @@
+import unittest
+import warnings
+import numpy as np
+from ta import add_all_ta_features
+from ta.trend import SMAIndicator, MACD
+from ta.momentum import RSIIndicator, StochasticOscillator, TSIIndicator, UltimateOscillator
+from ta.volatility import AverageTrueRange, BollingerBands
+from ta.volume import (AccDistIndexIndicator, OnBalanceVolumeIndicator, VolumeWeightedAveragePrice,
+                       MFIIndicator, EaseOfMovementIndicator)
+from indicators import indicator_frame, SELECTED_FEATURES, PRICE_FEATURES, ATR_WINDOW
+from benchmarks.synthetic import synthetic_bars
+
+# The NumPy indicator engine against ta, which it replaced (ta is a
+# development dependency, see requirements-dev.txt). Run from backend/:
+# python -m pytest tests
+
+# Short histories leave the longer windows (26-bar SMA/MACD, 28-bar UO,
+# TSI's 25/13 EMAs) partly or wholly unfilled
+LENGTHS = [1, 2, 5, 9, 10, 14, 20, 26, 40, 250, 1000]
+
+
+def ta_features(bars):
+    # Each selected feature from its own ta indicator, with the parameters
+    # add_all_ta_features uses; that one needs ~30 bars (its ADX fails on
+    # fewer), these work on any history except ATR's (see below)
+    high, low, close, volume = bars['high'], bars['low'], bars['close'], bars['volume']
+    macd = MACD(close, 26, 12, 9, fillna=True)
+    stoch = StochasticOscillator(high, low, close, 14, 3, fillna=True)
+    bollinger = BollingerBands(close, 20, 2, fillna=True)
+    eom = EaseOfMovementIndicator(high, low, volume, 14, fillna=True)
+    features = {
+        'trend_sma_fast': lambda: SMAIndicator(close, 12, fillna=True).sma_indicator(),
+        'trend_sma_slow': lambda: SMAIndicator(close, 26, fillna=True).sma_indicator(),
+        'trend_macd': macd.macd,
+        'trend_macd_signal': macd.macd_signal,
+        'trend_macd_diff': macd.macd_diff,
+        'momentum_rsi': lambda: RSIIndicator(close, 14, fillna=True).rsi(),
+        'momentum_stoch': stoch.stoch,
+        'momentum_stoch_signal': stoch.stoch_signal,
+        'momentum_tsi': lambda: TSIIndicator(close, 25, 13, fillna=True).tsi(),
+        'momentum_uo': lambda: UltimateOscillator(high, low, close, 7, 14, 28, 4.0, 2.0, 1.0,
+                                                  fillna=True).ultimate_oscillator(),
+        'volatility_atr': lambda: AverageTrueRange(high, low, close, 10, fillna=True).average_true_range(),
+        'volatility_bbm': bollinger.bollinger_mavg,
+        'volatility_bbh': bollinger.bollinger_hband,
+        'volatility_bbl': bollinger.bollinger_lband,
+        'volume_adi': lambda: AccDistIndexIndicator(high, low, close, volume, fillna=True).acc_dist_index(),
+        'volume_obv': lambda: OnBalanceVolumeIndicator(close, volume, fillna=True).on_balance_volume(),
+        'volume_vwap': lambda: VolumeWeightedAveragePrice(high, low, close, volume, 14,
+                                                          fillna=True).volume_weighted_average_price(),
+        'volume_mfi': lambda: MFIIndicator(high, low, close, volume, 14, fillna=True).money_flow_index(),
+        'volume_em': eom.ease_of_movement,
+        'volume_sma_em': eom.sma_ease_of_movement,
+    }
+    if len(bars) < ATR_WINDOW:
+        del features['volatility_atr']
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        return {feature: np.asarray(compute(), dtype=np.float64) for feature, compute in features.items()}
+
+
+def assert_close(actual, desired, feature):
+    np.testing.assert_allclose(actual, desired, rtol=1e-9, atol=1e-9, err_msg=feature)
+
+
+class IndicatorEngineTest(unittest.TestCase):
+    def setUp(self):
+        self.bars = synthetic_bars('MSFT', '2020-01-01', '2024-12-31')
+
+    def assertMatchesTa(self, bars):
+        frame = indicator_frame(bars)
+        for feature in PRICE_FEATURES:
+            assert_close(frame[feature].to_numpy(), bars[feature].to_numpy(), feature)
+        for feature, expected in ta_features(bars).items():
+            assert_close(frame[feature].to_numpy(), expected, feature)
+
+    def test_matches_ta_across_history_lengths(self):
+        for n in LENGTHS:
+            with self.subTest(bars=n):
+                self.assertMatchesTa(self.bars.tail(n))
+
+    def test_atr_before_its_first_window(self):
+        # ta's ATR fails on fewer than ATR_WINDOW bars; the engine gives the
+        # fill value it uses for the warm-up rows of longer histories
+        for n in (1, ATR_WINDOW - 1):
+            with self.subTest(bars=n):
+                atr = indicator_frame(self.bars.tail(n))['volatility_atr'].to_numpy()
+                np.testing.assert_array_equal(atr, np.zeros(n))
+
+    def test_matches_ta_on_degenerate_bars(self):
+        # A flat bar (high == low), zero volume, an unchanged close and a
+        # flat stretch hit the 0/0 and x/0 paths of CLV, MFI, EoM, RSI and
+        # the stochastic
+        bars = self.bars.tail(60).copy()
+        bars.iloc[3, 1:5] = bars.iloc[3, 4]
+        bars.iloc[7, 5] = 0.0
+        bars.iloc[12, 4] = bars.iloc[11, 4]
+        bars.iloc[20:35, 1:5] = bars.iloc[20, 4]
+        self.assertMatchesTa(bars)
+
+    def test_matches_add_all_ta_features(self):
+        # The call the engine replaced, column for column
+        bars = self.bars.tail(250)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            expected = add_all_ta_features(bars.copy(), open='open', high='high', low='low', close='close',
+                                           volume='volume', fillna=True)[SELECTED_FEATURES]
+        frame = indicator_frame(bars)
+        self.assertTrue(frame.index.equals(bars.index))
+        for feature in SELECTED_FEATURES:
+            assert_close(frame[feature].to_numpy(), expected[feature].to_numpy(), feature)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+import asyncio
+import unittest
+from polygon_async import AsyncPolygonClient, BackgroundPolygonClient, PolygonRetryableError
+from benchmarks.synthetic import FakePolygonServer, synthetic_bars
+
+# AsyncPolygonClient against the local fake aggregates server, with
+# injected failures. Run from backend/: python -m pytest tests
+
+FROM_DATE, TO_DATE = '2024-01-01', '2024-12-31'
+
+
+def fetch(server, symbols, **client_kwargs):
+    # {symbol: rows or exception} and the client's counters
+    async def run():
+        async with AsyncPolygonClient('key', base_url=server.url, **client_kwargs) as client:
+            return await client.get_many(symbols, FROM_DATE, TO_DATE), client
+    return asyncio.run(run())
+
+
+def attempt_gaps(server, page):
+    times = [at for logged, _, at in server.request_log if logged == page]
+    return [later - earlier for earlier, later in zip(times, times[1:])]
+
+
+class PagingTest(unittest.TestCase):
+    def test_follows_next_url_across_pages(self):
+        expected = synthetic_bars('AAPL', FROM_DATE, TO_DATE)
+        with FakePolygonServer(page_size=40) as server:
+            results, client = fetch(server, ['AAPL'])
+        rows = results['AAPL']
+        pages = -(-len(expected) // 40)
+        self.assertEqual(server.requests, pages)
+        self.assertEqual(client.requests, pages)
+        self.assertEqual([row[0] for row in rows], expected['timestamp'].tolist())
+        self.assertEqual([row[4] for row in rows], expected['close'].tolist())
+
+    def test_background_client_yields_one_page_at_a_time(self):
+        with FakePolygonServer(page_size=100) as server:
+            client = BackgroundPolygonClient('key', base_url=server.url)
+            try:
+                pages = client.iter_aggs('MSFT', FROM_DATE, TO_DATE)
+                first = next(pages)
+                self.assertEqual((len(first), server.requests), (100, 1))
+                rest = list(pages)
+            finally:
+                client.close()
+        self.assertEqual(sum(map(len, [first] + rest)), len(synthetic_bars('MSFT', FROM_DATE, TO_DATE)))
+        self.assertEqual(server.requests, 1 + len(rest))
+
+
+class RetryTest(unittest.TestCase):
+    def test_retries_server_errors_with_exponential_backoff(self):
+        with FakePolygonServer(failures=2, failure_status=503) as server:
+            results, client = fetch(server, ['AAPL'], max_retries=3, backoff=0.1)
+        self.assertEqual(len(results['AAPL']), len(synthetic_bars('AAPL', FROM_DATE, TO_DATE)))
+        self.assertEqual([status for _, status, _ in server.request_log], [503, 503, 200])
+        self.assertEqual(client.retries, 2)
+        # backoff * 2**attempt, jittered by 0.5-1.5x
+        first, second = attempt_gaps(server, ('AAPL', 0))
+        self.assertGreaterEqual(first, 0.05)
+        self.assertGreaterEqual(second, 0.1)
+
+    def test_honours_retry_after(self):
+        with FakePolygonServer(failures=1, failure_status=429, retry_after=0.3) as server:
+            results, client = fetch(server, ['AAPL'], max_retries=1, backoff=0.0)
+        self.assertNotIsInstance(results['AAPL'], Exception)
+        self.assertEqual(client.retries, 1)
+        self.assertGreaterEqual(attempt_gaps(server, ('AAPL', 0))[0], 0.3)
+
+    def test_retries_each_page(self):
+        with FakePolygonServer(page_size=100, failures=1, failure_status=500) as server:
+            results, client = fetch(server, ['AAPL'], max_retries=1, backoff=0.0)
+        pages = -(-len(synthetic_bars('AAPL', FROM_DATE, TO_DATE)) // 100)
+        self.assertEqual(len(results['AAPL']), len(synthetic_bars('AAPL', FROM_DATE, TO_DATE)))
+        self.assertEqual(client.retries, pages)
+        self.assertEqual(server.requests, 2 * pages)
+
+    def test_gives_up_after_max_retries(self):
+        with FakePolygonServer(failures=10, failure_status=429) as server:
+            results, client = fetch(server, ['AAPL'], max_retries=2, backoff=0.0)
+        self.assertIsInstance(results['AAPL'], PolygonRetryableError)
+        self.assertEqual(results['AAPL'].status, 429)
+        self.assertEqual(server.requests, 3)
+
+    def test_malformed_page_fails_only_its_symbol(self):
+        with FakePolygonServer(malformed=['BAD']) as server:
+            results, _ = fetch(server, ['AAPL', 'BAD'], max_retries=2, backoff=0.0)
+        self.assertIsInstance(results['BAD'], ValueError)
+        self.assertEqual(len(results['AAPL']), len(synthetic_bars('AAPL', FROM_DATE, TO_DATE)))
+        # Not a transient status, so not retried
+        self.assertEqual(server.requests, 2)
+
+
+class ConcurrencyTest(unittest.TestCase):
+    SYMBOLS = ['AAPL', 'MSFT', 'GOOGL', 'AMZN', 'TSLA', 'NVDA']
+
+    def test_in_flight_requests_are_bounded(self):
+        with FakePolygonServer(latency=0.1) as server:
+            results, _ = fetch(server, self.SYMBOLS, max_concurrency=2)
+        self.assertTrue(all(not isinstance(rows, Exception) for rows in results.values()))
+        self.assertEqual(server.max_in_flight, 2)
+
+    def test_symbols_are_fetched_concurrently(self):
+        with FakePolygonServer(latency=0.1) as server:
+            fetch(server, self.SYMBOLS, max_concurrency=8)
+        self.assertEqual(server.max_in_flight, len(self.SYMBOLS))
+
+
+if __name__ == '__main__':
+    unittest.main()
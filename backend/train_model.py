@@ -1,4 +1,5 @@
 import io
+import json
 import requests
 import os
 from flask import Flask, jsonify, request  # type: unused-import
@@ -7,16 +8,19 @@ import numpy as np
 import pandas as pd
 import logging
 from sklearn.preprocessing import MinMaxScaler
-from sklearn.model_selection import train_test_split
-from sklearn.linear_model import LinearRegression
-from tensorflow.keras.models import Sequential, load_model  # Added load_model import
-from tensorflow.keras.layers import LSTM, Dense, Dropout
-from tensorflow.keras.callbacks import EarlyStopping, ModelCheckpoint, ReduceLROnPlateau
-from tensorflow.keras.optimizers import Adam
 import joblib
-from ta import add_all_ta_features
+from indicators import indicator_frame, SELECTED_FEATURES
+from training_store import build_window_store, TRAINING_STORE_DIR
+from feature_prep import prepare_features, load_features
+from indicator_state import iter_feature_frames
+from inference import export_weights, KERAS_MODEL_FILE, NUMPY_MODEL_FILE
+from lstm_model import build_lstm_model, load_hyperparameters, DEFAULT_HYPERPARAMETERS
+from model_registry import (publish_version, read_metadata, MODEL_REGISTRY_DIR, METADATA_FILE,
+                            PRICE_SCALER_FILE, INDICATOR_SCALER_FILE)
+from baselines import moving_average_forecast, linear_regression_forecast  # noqa: F401
+import argparse
 import traceback
-from polygon import RESTClient
+from bar_store import BarStore, BAR_STORE_DIR, BAR_SIZE, make_bar_source, sized_dir
 import matplotlib.pyplot as plt
 from dotenv import load_dotenv
 from sklearn.metrics import mean_squared_error, mean_absolute_error, r2_score
@@ -30,56 +34,47 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__)
 CORS(app)
 
-# Ensure models directory exists
-MODEL_DIR = 'models'
+# Ensure models directory exists; one per BAR_SIZE (see bar_store.sized_dir)
+MODEL_DIR = sized_dir('models')
 if not os.path.exists(MODEL_DIR):
     os.makedirs(MODEL_DIR)
 
-try:
-    # Load the trained model and scalers if they exist, else later they will be trained.
-    logger.info("Loading model and scalers...")
-    model = load_model(os.path.join(MODEL_DIR, 'final_model.h5'))
-    price_scaler = joblib.load(os.path.join(MODEL_DIR, 'price_scaler.save'))
-    indicator_scaler = joblib.load(os.path.join(MODEL_DIR, 'indicator_scaler.save'))
-    logger.info("Model and scalers loaded successfully")
-except Exception as e:
-    logger.error(f"Error loading model or scalers: {str(e)}")
-    logger.info("Proceeding to train a new model.")
-    model = None
+# Loaded by main(). TensorFlow is only imported there: feature_prep's
+# spawned workers re-import this module and must stay light.
+model = None
+
+def load_trained_model():
+    # The trained model if it exists, else None and main() trains one
+    from tensorflow.keras.models import load_model
+    try:
+        logger.info("Loading model and scalers...")
+        loaded = load_model(os.path.join(MODEL_DIR, KERAS_MODEL_FILE))
+        joblib.load(os.path.join(MODEL_DIR, PRICE_SCALER_FILE))
+        joblib.load(os.path.join(MODEL_DIR, INDICATOR_SCALER_FILE))
+        logger.info("Model and scalers loaded successfully")
+        return loaded
+    except Exception as e:
+        logger.error(f"Error loading model or scalers: {str(e)}")
+        logger.info("Proceeding to train a new model.")
+        return None
 
 # API_KEY = os.getenv('VANTAGE_API_KEY')
-client = RESTClient(api_key=os.getenv("POLYGON_API_KEY"))
+bar_store = BarStore(sized_dir(BAR_STORE_DIR), make_bar_source())
 
 SYMBOLS = ['AAPL', 'MSFT', 'GOOGL', 'AMZN']
-SEQUENCE_LENGTH = 60
+START_DATE = "2020-01-01"
+END_DATE = "2025-01-08"
+SEQUENCE_LENGTH = DEFAULT_HYPERPARAMETERS['sequence_length']
 TEST_SIZE = 0.2
 RANDOM_STATE = 42
 
-def fetch_stock_data(symbol, start_date="2020-01-01", end_date="2025-01-08"): #noqa
+def fetch_stock_data(symbol, start_date=START_DATE, end_date=END_DATE): #noqa
     try:
-        aggs = client.get_aggs(
-            ticker=symbol,
-            multiplier=1,
-            timespan="day",
-            from_=start_date,
-            to=end_date
-        )
-        data = [
-            {
-                'timestamp': agg.timestamp,
-                'symbol': symbol,
-                'open': agg.open,
-                'high': agg.high,
-                'low': agg.low,
-                'close': agg.close,
-                'volume': agg.volume
-            }
-            for agg in aggs
-        ]
-        df = pd.DataFrame(data)
-        # Polygon returns timestamps in nanoseconds; adjust accordingly if needed
-        df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ns')
-        df = df.sort_values('timestamp')
+        df = bar_store.get_bars(symbol, start_date, end_date)
+        if df.empty:
+            logger.error(f"Error fetching data for {symbol}: no bars returned")
+            return None
+        df.insert(1, 'symbol', symbol)
         return df
     except Exception as e:
         logger.error(f"Error fetching data for {symbol}: {e}")
@@ -87,25 +82,7 @@ def fetch_stock_data(symbol, start_date="2020-01-01", end_date="2025-01-08"): #n
 
 def add_technical_indicators(data):
     try:
-        df = data.copy()
-        df = add_all_ta_features(
-            df, open="open", high="high", low="low", 
-            close="close", volume="volume", fillna=True
-        )
-        selected_features = [
-            'open', 'high', 'low', 'close',
-            'trend_sma_fast', 'trend_sma_slow', 'trend_macd',
-            'trend_macd_signal', 'trend_macd_diff',
-            'momentum_rsi', 'momentum_stoch', 'momentum_stoch_signal',
-            'momentum_tsi', 'momentum_uo',
-            'volatility_atr',
-            'volatility_bbm', 'volatility_bbh', 'volatility_bbl',
-            'volume_adi', 'volume_obv', 'volume_vwap',
-            'volume_mfi',
-            'volume_em',
-            'volume_sma_em'
-        ]
-        return df[selected_features].copy()
+        return indicator_frame(data, SELECTED_FEATURES)
     except Exception as e:
         logger.error(f"Error adding technical indicators: {str(e)}")
         logger.error(traceback.format_exc())
@@ -126,52 +103,10 @@ def preprocess_data(data):
     scaled_data = np.hstack((scaled_price, scaled_indicators))
     return scaled_data, price_scaler, indicator_scaler
 
-def create_sequences(data, time_step=60):
-    X, y = [], []
-    for i in range(len(data) - time_step - 1):
-        X.append(data[i:(i + time_step), :])
-        y.append(data[i + time_step, 3])  # Index 3 for 'close'
-    return np.array(X), np.array(y)
-
-def build_lstm_model(input_shape):
-    model = Sequential([
-        LSTM(128, return_sequences=True, input_shape=input_shape,
-             activation='tanh', recurrent_activation='sigmoid'),
-        Dropout(0.2),
-        LSTM(64, return_sequences=True, activation='tanh', recurrent_activation='sigmoid'),
-        Dropout(0.2),
-        LSTM(32, return_sequences=False, activation='tanh', recurrent_activation='sigmoid'),
-        Dropout(0.2),
-        Dense(32, activation='relu'),
-        Dense(16, activation='relu'),
-        Dense(1)
-    ])
-    model.compile(optimizer=Adam(learning_rate=0.001), loss='huber', metrics=['mae', 'mse'])
-    return model
-
-def moving_average_forecast(data, window=10):
-    if len(data) < window:
-        return None
-    return data['close'].tail(window).mean()
-
-def linear_regression_forecast(data):
-    try:
-        if len(data) < 10:
-            return None
-        df = data.tail(30)
-        X = np.arange(len(df)).reshape(-1, 1)
-        y = df['close'].values
-        lr_model = LinearRegression()
-        lr_model.fit(X, y)
-        next_day = np.array([[len(df)]])
-        return lr_model.predict(next_day)[0]
-    except Exception as e:
-        logger.error(f"Error in linear regression forecast: {str(e)}")
-        return None
-
-def backtest_model(model, X_test, y_test, price_scaler):
-    # Get predictions from the model
-    predictions = model.predict(X_test)
+def backtest_model(model, test_data, y_test, price_scaler):
+    # Get predictions from the model; test_data yields the windows for y_test
+    # in order
+    predictions = model.predict(test_data)
 
     # Create padded arrays to inverse transform the 'close' prices
     padded_predictions = np.zeros((len(predictions), 4))
@@ -209,71 +144,111 @@ def backtest_model(model, X_test, y_test, price_scaler):
     logger.info(f"Backtesting completed: MAE={mae:.2f}, MSE={mse:.2f}, R²={r2:.2f}. Plot saved as backtest_plot.png")
     return mae, mse
 
-def main():
-    os.makedirs('models', exist_ok=True)
-    combined_data = []
-    logger.info("Fetching stock data...")
-    for symbol in SYMBOLS:
-        stock_data = fetch_stock_data(symbol)
-        if stock_data is not None:
-            logger.info(f"Processing data for {symbol}...")
-            feature_data = add_technical_indicators(stock_data)
-            if feature_data is not None:
-                combined_data.append(feature_data)
+def prepare_training_store(symbols=SYMBOLS, start_date=START_DATE, end_date=END_DATE):
+    # Returns (WindowStore or None, price_scaler, indicator_scaler)
+    logger.info(f"Fetching {BAR_SIZE.label} bars...")
+    # Bars for every symbol are fetched concurrently into the bar store,
+    # page by page and downsampled to BAR_SIZE as they arrive
+    bars, _ = bar_store.refresh_many(symbols, start_date, end_date)
+    
+    if BAR_SIZE.timespan == 'day':
+        # Indicators are computed from the store in a process pool
+        logger.info("Preparing features...")
+        feature_paths = prepare_features(symbols, start_date, end_date)
+        kept, load = list(feature_paths), lambda symbol: load_features(feature_paths[symbol])
+    else:
+        # Years of intraday bars are streamed through the indicators chunk
+        # by chunk (once per pass) instead of materialising feature frames
+        kept = [symbol for symbol in symbols if len(bars.get(symbol, ()))]
+        load = lambda symbol: iter_feature_frames(bar_store.iter_frames(symbol, start_date, end_date))
     
-    if not combined_data:
+    logger.info("Building training store...")
+    return build_window_store(sized_dir(TRAINING_STORE_DIR), kept, load)
+
+def main(hyperparameters=None):
+    # Trains with DEFAULT_HYPERPARAMETERS updated by `hyperparameters` (e.g.
+    # a sweep winner); without them an existing model is backtested instead
+    from tensorflow.keras.callbacks import EarlyStopping, ModelCheckpoint, ReduceLROnPlateau
+    global model  # so we can update the global variable if needed
+    params = {**DEFAULT_HYPERPARAMETERS, **(hyperparameters or {})}
+    model = None if hyperparameters else load_trained_model()
+    if model is not None:
+        params['sequence_length'] = read_metadata(MODEL_DIR).get('sequence_length', params['sequence_length'])
+    sequence_length, batch_size = params['sequence_length'], params['batch_size']
+    os.makedirs(MODEL_DIR, exist_ok=True)
+    store, price_scaler, indicator_scaler = prepare_training_store()
+    if store is None:
         logger.error("No data fetched. Exiting...")
         return
     
-    all_data = pd.concat(combined_data, ignore_index=True)
-    all_data = all_data.fillna(method='ffill').fillna(method='bfill')
-    
-    logger.info("Preprocessing data...")
-    scaled_data, price_scaler, indicator_scaler = preprocess_data(all_data)
-    
-    logger.info("Creating sequences...")
-    X, y = create_sequences(scaled_data, SEQUENCE_LENGTH)
-    logger.info(f"Created {len(X)} sequences.")
+    # Windows stay within one symbol; the last TEST_SIZE of each symbol's
+    # windows (chronologically) are held out
+    train_index, test_index = store.window_index(sequence_length, TEST_SIZE)
+    logger.info(f"Indexed {len(train_index)} training and {len(test_index)} test windows.")
+    test_data = store.dataset(test_index, sequence_length, batch_size=batch_size)
+    y_test = store.targets(test_index, sequence_length)
     
-    X_train, X_test, y_train, y_test = train_test_split(
-        X, y, test_size=TEST_SIZE, shuffle=False
-    )
-    
-    global model  # so we can update the global variable if needed
-    if model is None:
-        logger.info("Building LSTM model...")
-        model = build_lstm_model((X.shape[1], X.shape[2]))
+    trained = model is None
+    if trained:
+        logger.info(f"Building LSTM model with {params}...")
+        model = build_lstm_model((sequence_length, len(store.columns)), params)
     
         callbacks = [
             EarlyStopping(monitor='val_loss', patience=20, restore_best_weights=True),
-            ModelCheckpoint('models/best_model.h5', monitor='val_loss', save_best_only=True),
+            ModelCheckpoint(os.path.join(MODEL_DIR, 'best_model.h5'), monitor='val_loss', save_best_only=True),
             ReduceLROnPlateau(monitor='val_loss', factor=0.2, patience=5, min_lr=0.00001)
         ]
     
         logger.info("Training model...")
         history = model.fit(
-            X_train, y_train,
-            validation_data=(X_test, y_test),
+            store.dataset(train_index, sequence_length, batch_size=batch_size, shuffle=True, seed=RANDOM_STATE),
+            validation_data=test_data,
             epochs=100,
-            batch_size=32,
             callbacks=callbacks,
             verbose=1
         )
     
         logger.info("Saving model and scalers...")
-        model.save('models/final_model.h5')
-        joblib.dump(price_scaler, 'models/price_scaler.save')
-        joblib.dump(indicator_scaler, 'models/indicator_scaler.save')
+        model.save(os.path.join(MODEL_DIR, KERAS_MODEL_FILE))
+        export_weights(model, os.path.join(MODEL_DIR, NUMPY_MODEL_FILE))
+        joblib.dump(price_scaler, os.path.join(MODEL_DIR, PRICE_SCALER_FILE))
+        joblib.dump(indicator_scaler, os.path.join(MODEL_DIR, INDICATOR_SCALER_FILE))
     
         history_df = pd.DataFrame(history.history)
-        history_df.to_csv('models/training_history.csv')
+        history_df.to_csv(os.path.join(MODEL_DIR, 'training_history.csv'))
     
     # Perform backtesting on the test set
     logger.info("Performing backtesting...")
-    mae, mse = backtest_model(model, X_test, y_test, price_scaler)
+    mae, mse = backtest_model(model, test_data, y_test, price_scaler)
     logger.info(f"Backtest results - MAE: {mae:.2f}, MSE: {mse:.2f}")
     
+    if trained:
+        # Saved beside the flat artifacts too (the server's fallback
+        # directory), then published as a new registry version; serving
+        # processes swap to it on their next check of CURRENT (see
+        # model_registry.py)
+        metadata = {
+            'features': list(store.columns),
+            'sequence_length': sequence_length,
+            'hyperparameters': params,
+            'bar_size': BAR_SIZE.label,
+            'symbols': store.symbols,
+            'start_date': START_DATE,
+            'end_date': END_DATE,
+            'epochs': len(history_df),
+            'metrics': {'mae': float(mae), 'mse': float(mse)},
+        }
+        with open(os.path.join(MODEL_DIR, METADATA_FILE), 'w') as f:
+            json.dump(metadata, f, indent=2)
+        publish_version(MODEL_DIR, metadata, sized_dir(MODEL_REGISTRY_DIR),
+                        files=[KERAS_MODEL_FILE, NUMPY_MODEL_FILE, PRICE_SCALER_FILE, INDICATOR_SCALER_FILE])
+    
     logger.info("Training and backtesting completed successfully!")
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(description="Train, backtest and publish the LSTM")
+    parser.add_argument('--hyperparameters',
+                        help="JSON overriding lstm_model.DEFAULT_HYPERPARAMETERS: a mapping, a sweep "
+                             "trial's metadata.json or a leaderboard entry; always trains a new model")
+    args = parser.parse_args()
+    main(load_hyperparameters(args.hyperparameters) if args.hyperparameters else None)
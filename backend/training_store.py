@@ -0,0 +1,155 @@
+import os
+import json
+import shutil
+import logging
+import numpy as np
+from sklearn.preprocessing import MinMaxScaler
+from sequences import CLOSE_INDEX
+
+logger = logging.getLogger(__name__)
+
+TRAINING_STORE_DIR = os.getenv('TRAINING_STORE_DIR', os.path.join('data', 'training'))
+PRICE_COLUMNS = ['open', 'high', 'low', 'close']
+
+
+def _split_columns(data):
+    # Same layout as preprocess_data: prices first, then the indicators
+    data = data.fillna(method='ffill').fillna(method='bfill')
+    return data[PRICE_COLUMNS].values, data.drop(PRICE_COLUMNS, axis=1).values
+
+
+def _chunks(data):
+    # load_features may return one DataFrame or an iterable of consecutive
+    # chunks of one (a streamed intraday history)
+    if data is None:
+        return []
+    return [data] if hasattr(data, 'columns') else data
+
+
+def build_window_store(root, symbols, load_features):
+    # Two passes over the symbols so only one symbol's features (or one
+    # chunk of them) are in memory at a time: the first fits the scalers
+    # incrementally, the second writes each scaled matrix as float32.
+    # `load_features(symbol)` returns the feature DataFrame, an iterable of
+    # DataFrame chunks, or None to skip the symbol.
+    price_scaler = MinMaxScaler(feature_range=(0, 1))
+    indicator_scaler = MinMaxScaler(feature_range=(0, 1))
+    kept, rows, columns = [], [], None
+    for symbol in symbols:
+        count = 0
+        for data in _chunks(load_features(symbol)):
+            if data.empty:
+                continue
+            price_data, indicator_data = _split_columns(data)
+            price_scaler.partial_fit(price_data)
+            indicator_scaler.partial_fit(indicator_data)
+            columns = list(data.columns)
+            count += len(data)
+        if count:
+            kept.append(symbol)
+            rows.append(count)
+    if not kept:
+        return None, price_scaler, indicator_scaler
+
+    # Rebuilt from scratch so matrices from an older scaler fit never mix in
+    tmp_root = f"{root}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp_root, ignore_errors=True)
+    os.makedirs(tmp_root)
+    for symbol, count in zip(kept, rows):
+        matrix = np.lib.format.open_memmap(os.path.join(tmp_root, f"{symbol.upper()}.npy"), mode='w+',
+                                           dtype=np.float32, shape=(count, len(columns)))
+        offset = 0
+        for data in _chunks(load_features(symbol)):
+            if data.empty:
+                continue
+            price_data, indicator_data = _split_columns(data)
+            matrix[offset:offset + len(data)] = np.hstack((price_scaler.transform(price_data),
+                                                           indicator_scaler.transform(indicator_data)))
+            offset += len(data)
+        matrix.flush()
+        del matrix
+    with open(os.path.join(tmp_root, 'index.json'), 'w') as f:
+        json.dump({'symbols': kept, 'rows': rows, 'columns': columns}, f)
+    shutil.rmtree(root, ignore_errors=True)
+    os.makedirs(os.path.dirname(os.path.abspath(root)), exist_ok=True)
+    os.replace(tmp_root, root)
+    logger.info(f"Wrote {sum(rows)} scaled rows for {len(kept)} symbols to {root}")
+    return WindowStore(root), price_scaler, indicator_scaler
+
+
+class WindowStore:
+    """Scaled per-symbol feature matrices, memory-mapped from float32 .npy files.
+
+    Windows are addressed by (symbol id, start row) and never cross from one
+    symbol into the next.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        with open(os.path.join(root, 'index.json')) as f:
+            index = json.load(f)
+        self.symbols = index['symbols']
+        self.rows = index['rows']
+        self.columns = index['columns']
+        self.matrices = [np.load(os.path.join(root, f"{symbol.upper()}.npy"), mmap_mode='r')
+                         for symbol in self.symbols]
+
+    def window_index(self, time_step, test_size=0.0):
+        # (symbol id, start) pairs matching create_sequences per symbol
+        # (len - time_step - 1 windows each). The last `test_size` of every
+        # symbol's windows, in time order, form the test index.
+        train, test = [], []
+        for symbol_id, rows in enumerate(self.rows):
+            count = rows - time_step - 1
+            if count <= 0:
+                continue
+            split = count - int(np.ceil(count * test_size))
+            starts = np.arange(count, dtype=np.int32)
+            ids = np.full(count, symbol_id, dtype=np.int32)
+            train.append(np.stack([ids[:split], starts[:split]], axis=1))
+            test.append(np.stack([ids[split:], starts[split:]], axis=1))
+        empty = np.empty((0, 2), dtype=np.int32)
+        return (np.concatenate(train) if train else empty,
+                np.concatenate(test) if test else empty)
+
+    def gather(self, index, time_step):
+        # Copies the windows for one batch out of the memory maps
+        index = np.asarray(index)
+        X = np.empty((len(index), time_step, len(self.columns)), dtype=np.float32)
+        y = np.empty(len(index), dtype=np.float32)
+        offsets = np.arange(time_step)
+        for symbol_id in np.unique(index[:, 0]):
+            rows = np.flatnonzero(index[:, 0] == symbol_id)
+            starts = index[rows, 1]
+            matrix = self.matrices[symbol_id]
+            X[rows] = matrix[starts[:, np.newaxis] + offsets]
+            y[rows] = matrix[starts + time_step, CLOSE_INDEX]
+        return X, y
+
+    def targets(self, index, time_step):
+        index = np.asarray(index)
+        y = np.empty(len(index), dtype=np.float32)
+        for symbol_id in np.unique(index[:, 0]):
+            rows = np.flatnonzero(index[:, 0] == symbol_id)
+            y[rows] = self.matrices[symbol_id][index[rows, 1] + time_step, CLOSE_INDEX]
+        return y
+
+    def dataset(self, index, time_step, batch_size=32, shuffle=False, seed=None):
+        # Only the (symbol id, start) index is shuffled -- all of it, every
+        # epoch -- and windows are materialised per batch, one batch ahead.
+        # TensorFlow is imported here so building or reading the store
+        # (e.g. in spawned feature_prep workers) does not load it.
+        import tensorflow as tf
+        features = len(self.columns)
+        ds = tf.data.Dataset.from_tensor_slices(index)
+        if shuffle:
+            ds = ds.shuffle(len(index), seed=seed, reshuffle_each_iteration=True)
+        ds = ds.batch(batch_size)
+
+        def load(batch):
+            X, y = tf.numpy_function(lambda b: self.gather(b, time_step), [batch], (tf.float32, tf.float32))
+            X.set_shape([None, time_step, features])
+            y.set_shape([None])
+            return X, y
+
+        return ds.map(load, num_parallel_calls=tf.data.AUTOTUNE).prefetch(tf.data.AUTOTUNE)